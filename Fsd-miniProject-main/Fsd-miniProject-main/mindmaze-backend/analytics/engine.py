@@ -3,22 +3,44 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
-from collections import defaultdict, Counter
+from typing import Dict, List, Optional, Any, Tuple, Callable, Awaitable
+from collections import defaultdict, Counter, deque
 import json
 
-from models import User, QuizResult, AnalyticsEvent, AntiCheatEvent
+from models import User, QuizResult, AnalyticsEvent, AntiCheatEvent, SEVERITY_SCORES
 from database import db
+from cache import LRUCache
+from analytics.user_stats import user_stats
+from analytics.ingestion import BatchedWriter
+from analytics.realtime import RealTimeMetrics
+from analytics.rollups import rollup_store
 
 logger = logging.getLogger(__name__)
 
 class AnalyticsEngine:
     """Advanced analytics engine for comprehensive data analysis."""
     
+    EVENT_CACHE_SIZE = 1000  # most recent events kept per event type
+    USER_CACHE_SIZE = 10000  # cached (user, period) analyses
+    USER_CACHE_TTL = 3600  # seconds; lets period windows roll forward for idle users
+    TOP_OFFENDERS = 10  # users listed on the anti-cheat dashboard
+    TIME_PERIODS = {
+        "1d": timedelta(days=1),
+        "7d": timedelta(days=7),
+        "30d": timedelta(days=30),
+        "90d": timedelta(days=90),
+        "1y": timedelta(days=365)
+    }
+    
     def __init__(self):
-        self.event_cache = defaultdict(list)
-        self.real_time_metrics = {}
+        self.event_cache: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.EVENT_CACHE_SIZE))
+        self.real_time_metrics = RealTimeMetrics()
         self.aggregated_data = {}
+        self.user_cache = LRUCache(max_size=self.USER_CACHE_SIZE, ttl=self.USER_CACHE_TTL)
+        self.ingestion = BatchedWriter(
+            "analytics_events", max_queue_size=10000, batch_size=500,
+            flush_interval=1.0, overflow_policy="drop"
+        )
     
     async def track_event(self, user_id: str, event_type: str, 
                          metadata: Dict[str, Any] = None, 
@@ -33,65 +55,121 @@ class AnalyticsEngine:
             ip_address=None  # Would be set from request context
         )
         
-        # Store in cache for real-time processing
+        # Store in bounded ring buffer and rolling counters for real-time processing
         self.event_cache[event_type].append(event)
+        self.real_time_metrics.record(user_id, event_type)
+        rollup_store.record(user_id, event_type, event.timestamp, event.metadata)
         
-        # Store in database
-        try:
-            await db.analytics_events.insert_one(event.dict())
-        except Exception as e:
-            logger.error(f"Failed to store analytics event: {e}")
+        # Queue for batched storage; the background writer owns the round-trip
+        await self.ingestion.submit(event.dict())
+    
+    def get_real_time_metrics(self) -> Dict[str, Any]:
+        """Get rolling real-time metrics and ring buffer occupancy."""
+        metrics = self.real_time_metrics.snapshot()
+        metrics["cached_events"] = {
+            event_type: len(events) for event_type, events in self.event_cache.items()
+        }
+        metrics["ingestion"] = self.ingestion.get_stats()
+        metrics["user_cache"] = self.user_cache.get_stats()
+        return metrics
+    
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop a user's cached analytics after their results change."""
+        for key in (*self.TIME_PERIODS, "recommendations"):
+            self.user_cache.delete((user_id, key))
     
     async def analyze_user_performance(self, user_id: str, 
                                      time_period: str = "30d") -> Dict[str, Any]:
         """Analyze individual user performance."""
+        time_period = time_period if time_period in self.TIME_PERIODS else "30d"
+        return await self._cached_for_user(
+            user_id, time_period, lambda: self._compute_user_performance(user_id, time_period)
+        )
+    
+    async def _compute_user_performance(self, user_id: str, time_period: str) -> Dict[str, Any]:
         end_date = datetime.utcnow()
         start_date = self._get_start_date(time_period, end_date)
         
-        # Get user's quiz results
-        quiz_results = await db.quiz_results.find({
-            "user_id": user_id,
-            "completed_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(None)
+        # One server-side pass over the (user_id, completed_at) index range;
+        # only grouped aggregates come back over the wire
+        pipeline = [
+            {"$match": {
+                "user_id": user_id,
+                "completed_at": {"$gte": start_date, "$lte": end_date}
+            }},
+            {"$facet": {
+                "summary": [{"$group": {
+                    "_id": None,
+                    "total_quizzes": {"$sum": 1},
+                    "total_questions": {"$sum": "$total_questions"},
+                    "total_correct": {"$sum": "$correct_answers"},
+                    "total_time": {"$sum": "$time_taken"}
+                }}],
+                "by_category": [{"$group": {
+                    "_id": {"$ifNull": ["$category", "unknown"]},
+                    "correct": {"$sum": "$correct_answers"},
+                    "total": {"$sum": "$total_questions"},
+                    "time": {"$sum": "$time_taken"}
+                }}],
+                "by_difficulty": [{"$group": {
+                    "_id": {"$ifNull": ["$difficulty", "medium"]},
+                    "correct": {"$sum": "$correct_answers"},
+                    "total": {"$sum": "$total_questions"},
+                    "time": {"$sum": "$time_taken"}
+                }}],
+                "by_hour": [{"$group": {
+                    "_id": {"$hour": "$completed_at"},
+                    "accuracy": {"$avg": "$accuracy"}
+                }}],
+                "earliest": [
+                    {"$sort": {"completed_at": 1}},
+                    {"$limit": 5},
+                    {"$project": {"_id": 0, "accuracy": 1}}
+                ],
+                "latest": [
+                    {"$sort": {"completed_at": -1}},
+                    {"$limit": 5},
+                    {"$project": {"_id": 0, "accuracy": 1}}
+                ]
+            }}
+        ]
+        facets = (await db.quiz_results.aggregate(pipeline).to_list(1))[0]
         
-        if not quiz_results:
+        if not facets["summary"] or not facets["summary"][0]["total_quizzes"]:
             return {"error": "No data found for the specified period"}
         
         # Calculate performance metrics
-        total_quizzes = len(quiz_results)
-        total_questions = sum(r["total_questions"] for r in quiz_results)
-        total_correct = sum(r["correct_answers"] for r in quiz_results)
-        total_time = sum(r["time_taken"] for r in quiz_results)
+        summary = facets["summary"][0]
+        total_quizzes = summary["total_quizzes"]
+        total_questions = summary["total_questions"]
+        total_correct = summary["total_correct"]
+        total_time = summary["total_time"]
         
         accuracy = total_correct / total_questions if total_questions > 0 else 0
         avg_time_per_question = total_time / total_questions if total_questions > 0 else 0
         
-        # Category performance
-        category_performance = defaultdict(lambda: {"correct": 0, "total": 0, "time": 0})
-        for result in quiz_results:
-            category = result.get("category", "unknown")
-            category_performance[category]["correct"] += result["correct_answers"]
-            category_performance[category]["total"] += result["total_questions"]
-            category_performance[category]["time"] += result["time_taken"]
-        
-        # Calculate category accuracies
-        category_accuracies = {}
-        for category, data in category_performance.items():
-            if data["total"] > 0:
-                category_accuracies[category] = {
-                    "accuracy": data["correct"] / data["total"],
-                    "avg_time": data["time"] / data["total"],
-                    "questions_attempted": data["total"]
-                }
-        
-        # Difficulty performance
-        difficulty_performance = self._analyze_difficulty_performance(quiz_results)
+        # Category and difficulty performance
+        category_accuracies = self._summarize_group_totals(
+            {group["_id"]: group for group in facets["by_category"]}
+        )
+        difficulty_performance = self._summarize_group_totals(
+            {group["_id"]: group for group in facets["by_difficulty"]}
+        )
         
         # Time-based analysis
-        time_analysis = self._analyze_time_patterns(quiz_results)
+        time_analysis = self._summarize_hourly_accuracy(
+            {group["_id"]: group["accuracy"] for group in facets["by_hour"]}
+        )
         
         # Improvement trends
-        improvement_trends = self._analyze_improvement_trends(quiz_results)
+        if total_quizzes < 5:
+            improvement_trends = {"trend": "insufficient_data"}
+        else:
+            window_size = min(5, total_quizzes // 3)
+            improvement_trends = self._classify_trend(
+                [r["accuracy"] for r in facets["earliest"][:window_size]],
+                [r["accuracy"] for r in facets["latest"][:window_size]]
+            )
         
         return {
             "user_id": user_id,
@@ -115,40 +193,26 @@ class AnalyticsEngine:
         end_date = datetime.utcnow()
         start_date = self._get_start_date(time_period, end_date)
         
-        # User metrics
-        total_users = await db.users.count_documents({})
-        active_users = await db.users.count_documents({
-            "last_login": {"$gte": start_date}
-        })
-        new_users = await db.users.count_documents({
-            "created_at": {"$gte": start_date}
-        })
-        
-        # Quiz metrics
-        total_quizzes = await db.quiz_results.count_documents({
-            "completed_at": {"$gte": start_date, "$lte": end_date}
-        })
-        
-        # Performance metrics
-        quiz_results = await db.quiz_results.find({
-            "completed_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(None)
-        
-        if quiz_results:
-            total_questions = sum(r["total_questions"] for r in quiz_results)
-            total_correct = sum(r["correct_answers"] for r in quiz_results)
-            platform_accuracy = total_correct / total_questions if total_questions > 0 else 0
-        else:
-            platform_accuracy = 0
-        
-        # Category popularity
-        category_stats = await self._analyze_category_popularity(start_date, end_date)
-        
-        # Engagement metrics
-        engagement_metrics = await self._analyze_engagement_metrics(start_date, end_date)
+        # Independent queries are issued concurrently; event metrics come
+        # from the hourly/daily rollups rather than raw events
+        (
+            total_users, active_users, new_users, rollups, active_user_counts, anti_cheat_metrics
+        ) = await asyncio.gather(
+            db.users.estimated_document_count(),
+            db.users.count_documents({"last_login": {"$gte": start_date}}),
+            db.users.count_documents({"created_at": {"$gte": start_date}}),
+            rollup_store.load_period(start_date, end_date, include_users=True),
+            rollup_store.active_user_counts(end_date),
+            self._analyze_anti_cheat_metrics(start_date, end_date)
+        )
+        quiz_totals = self._aggregate_quiz_totals(rollups["events"])
+        category_stats = self._analyze_category_popularity(rollups["events"], rollups["event_users"])
+        engagement_metrics = self._analyze_engagement_metrics(rollups, active_user_counts)
         
-        # Anti-cheat metrics
-        anti_cheat_metrics = await self._analyze_anti_cheat_metrics(start_date, end_date)
+        # Quiz and performance metrics
+        total_quizzes = quiz_totals["quizzes"]
+        total_questions = quiz_totals["total_questions"]
+        platform_accuracy = quiz_totals["total_correct"] / total_questions if total_questions > 0 else 0
         
         return {
             "period": time_period,
@@ -239,11 +303,20 @@ class AnalyticsEngine:
     
     async def generate_study_recommendations(self, user_id: str) -> Dict[str, Any]:
         """Generate personalized study recommendations."""
+        return await self._cached_for_user(
+            user_id, "recommendations", lambda: self._compute_study_recommendations(user_id)
+        )
+    
+    async def _compute_study_recommendations(self, user_id: str) -> Dict[str, Any]:
         # Get user's performance data
         performance_data = await self.analyze_user_performance(user_id, "30d")
         
         if "error" in performance_data:
-            return {"error": "Insufficient data for recommendations"}
+            # Fall back to lifetime counters for players inactive this month
+            lifetime_performance = user_stats.category_performance(await user_stats.get(user_id))
+            if not lifetime_performance:
+                return {"error": "Insufficient data for recommendations"}
+            performance_data = {"category_performance": lifetime_performance}
         
         recommendations = []
         
@@ -301,14 +374,21 @@ class AnalyticsEngine:
     
     def _get_start_date(self, time_period: str, end_date: datetime) -> datetime:
         """Get start date based on time period."""
-        periods = {
-            "1d": timedelta(days=1),
-            "7d": timedelta(days=7),
-            "30d": timedelta(days=30),
-            "90d": timedelta(days=90),
-            "1y": timedelta(days=365)
-        }
-        return end_date - periods.get(time_period, timedelta(days=30))
+        return end_date - self.TIME_PERIODS.get(time_period, timedelta(days=30))
+    
+    async def _cached_for_user(self, user_id: str, key: str, 
+                               compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Serve a per-user result from the LRU cache, computing it on a miss."""
+        cache_key = (user_id, key)
+        cached = self.user_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # A write for this user landing mid-computation makes the result stale; set() skips it then
+        version = self.user_cache.version_of(cache_key)
+        result = await compute()
+        self.user_cache.set(cache_key, result, version)
+        return result
     
     def _analyze_difficulty_performance(self, quiz_results: List[Dict]) -> Dict[str, Any]:
         """Analyze performance by difficulty level."""
@@ -320,10 +400,14 @@ class AnalyticsEngine:
             difficulty_stats[difficulty]["total"] += result["total_questions"]
             difficulty_stats[difficulty]["time"] += result["time_taken"]
         
+        return self._summarize_group_totals(difficulty_stats)
+    
+    def _summarize_group_totals(self, group_totals: Dict[str, Dict]) -> Dict[str, Any]:
+        """Turn per-group correct/total/time sums into accuracy figures."""
         performance = {}
-        for difficulty, stats in difficulty_stats.items():
+        for group, stats in group_totals.items():
             if stats["total"] > 0:
-                performance[difficulty] = {
+                performance[group] = {
                     "accuracy": stats["correct"] / stats["total"],
                     "avg_time": stats["time"] / stats["total"],
                     "questions_attempted": stats["total"]
@@ -347,6 +431,10 @@ class AnalyticsEngine:
         for hour, accuracies in hour_performance.items():
             hourly_accuracy[hour] = sum(accuracies) / len(accuracies)
         
+        return self._summarize_hourly_accuracy(hourly_accuracy)
+    
+    def _summarize_hourly_accuracy(self, hourly_accuracy: Dict[int, float]) -> Dict[str, Any]:
+        """Summarize average accuracy per hour of day."""
         # Find best performing hours
         best_hours = sorted(hourly_accuracy.items(), key=lambda x: x[1], reverse=True)[:3]
         
@@ -366,8 +454,16 @@ class AnalyticsEngine:
         
         # Calculate moving average
         window_size = min(5, len(sorted_results) // 3)
-        recent_accuracy = sum(r["accuracy"] for r in sorted_results[-window_size:]) / window_size
-        early_accuracy = sum(r["accuracy"] for r in sorted_results[:window_size]) / window_size
+        return self._classify_trend(
+            [r["accuracy"] for r in sorted_results[:window_size]],
+            [r["accuracy"] for r in sorted_results[-window_size:]]
+        )
+    
+    def _classify_trend(self, early_accuracies: List[float], 
+                        recent_accuracies: List[float]) -> Dict[str, Any]:
+        """Compare early and recent accuracy windows."""
+        recent_accuracy = sum(recent_accuracies) / len(recent_accuracies)
+        early_accuracy = sum(early_accuracies) / len(early_accuracies)
         
         improvement = recent_accuracy - early_accuracy
         
@@ -385,26 +481,148 @@ class AnalyticsEngine:
             "early_accuracy": early_accuracy
         }
     
-    async def _analyze_category_popularity(self, start_date: datetime, 
-                                         end_date: datetime) -> Dict[str, Any]:
+    def _aggregate_quiz_totals(self, events: Dict[str, Any]) -> Dict[str, int]:
+        """Sum quiz counts and answer totals from merged rollups."""
+        completed = events.get("quiz_completed", {})
+        sums = completed.get("sums", {})
+        return {
+            "quizzes": int(completed.get("count", 0)),
+            "total_questions": int(sums.get("total_questions", 0)),
+            "total_correct": int(sums.get("correct_answers", 0))
+        }
+    
+    def _analyze_category_popularity(self, events: Dict[str, Any],
+                                     event_users: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Analyze category popularity and performance."""
-        # This would query the database for category statistics
-        # Placeholder implementation
-        return {}
+        categories = events.get("quiz_completed", {}).get("categories", {})
+        players = (event_users or {}).get("quiz_completed", {}).get("categories", {})
+        
+        category_stats = {}
+        for category, data in sorted(categories.items(), key=lambda item: -item[1].get("count", 0)):
+            sums = data.get("sums", {})
+            questions = sums.get("total_questions", 0)
+            sketch = players.get(category, {}).get("users_hll")
+            category_stats[category] = {
+                "quizzes": int(data.get("count", 0)),
+                # Only the game's own categories carry a user sketch
+                "unique_players": sketch.count() if sketch else None,
+                "accuracy": sums.get("correct_answers", 0) / questions if questions > 0 else 0,
+                "avg_time_per_question": sums.get("time_taken", 0) / questions if questions > 0 else 0
+            }
+        
+        return category_stats
     
-    async def _analyze_engagement_metrics(self, start_date: datetime, 
-                                        end_date: datetime) -> Dict[str, Any]:
+    def _analyze_engagement_metrics(self, rollups: Dict[str, Any], 
+                                    active_user_counts: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze user engagement metrics."""
-        # This would analyze user engagement patterns
-        # Placeholder implementation
-        return {}
+        event_users = rollups.get("event_users") or {}
+        events_by_type = {}
+        for event_type, data in rollups["events"].items():
+            sketch = event_users.get(event_type, {}).get("users_hll")
+            events_by_type[event_type] = {
+                "events": int(data.get("count", 0)),
+                "unique_users": sketch.count() if sketch else 0
+            }
+        total_events = sum(data["events"] for data in events_by_type.values())
+        active_users = rollups["users"].count() if rollups["users"] else 0
+        
+        return {
+            "total_events": total_events,
+            "active_users": active_users,
+            "events_per_active_user": total_events / active_users if active_users > 0 else 0,
+            "events_by_type": events_by_type,
+            **active_user_counts
+        }
+    
+    async def analyze_anti_cheat_period(self, time_period: str = "7d") -> Dict[str, Any]:
+        """Anti-cheat event breakdown and top offenders for a period."""
+        end_date = datetime.utcnow()
+        start_date = self._get_start_date(time_period, end_date)
+        metrics = await self._analyze_anti_cheat_metrics(
+            start_date, end_date, top_offenders=self.TOP_OFFENDERS
+        )
+        return {
+            "period": time_period,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            **metrics,
+            "suspicious_users": metrics["flagged_users"]  # previous name of flagged_users
+        }
     
-    async def _analyze_anti_cheat_metrics(self, start_date: datetime, 
-                                        end_date: datetime) -> Dict[str, Any]:
-        """Analyze anti-cheat metrics."""
-        # This would analyze anti-cheat events
-        # Placeholder implementation
-        return {}
+    async def _analyze_anti_cheat_metrics(self, start_date: datetime, end_date: datetime,
+                                        top_offenders: int = 0) -> Dict[str, Any]:
+        """Analyze anti-cheat metrics in one $facet pass over the period's events.
+        
+        Only small per-group results leave the server: counts per
+        (type, severity), the distinct user count and a bounded top-k
+        of offenders ($sort followed by $limit keeps only k in memory).
+        """
+        severity_weight = {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$severity", severity]}, "then": weight}
+                for severity, weight in SEVERITY_SCORES.items()
+            ],
+            "default": 1
+        }}
+        facets = {
+            "by_type_severity": [{"$group": {
+                "_id": {"type": "$flag_type", "severity": "$severity"},
+                "count": {"$sum": 1}
+            }}],
+            "users": [
+                {"$group": {"_id": "$user_id"}},
+                {"$count": "flagged_users"}
+            ]
+        }
+        if top_offenders:
+            facets["top_offenders"] = [
+                {"$group": {
+                    "_id": "$user_id",
+                    "events": {"$sum": 1},
+                    "risk_score": {"$sum": severity_weight},
+                    "flag_types": {"$addToSet": "$flag_type"},
+                    "last_event": {"$max": "$timestamp"}
+                }},
+                {"$sort": {"risk_score": -1, "events": -1, "_id": 1}},
+                {"$limit": top_offenders}
+            ]
+        
+        result = await db.anti_cheat_events.aggregate([
+            {"$match": {"timestamp": {"$gte": start_date, "$lte": end_date}}},
+            {"$project": {"_id": 0, "flag_type": 1, "severity": 1, "user_id": 1, "timestamp": 1}},
+            {"$facet": facets}
+        ], allowDiskUse=True).to_list(1)
+        result = result[0] if result else {}
+        
+        events_by_type: Dict[str, int] = defaultdict(int)
+        events_by_severity: Dict[str, int] = defaultdict(int)
+        severity_by_type: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for group in result.get("by_type_severity", []):
+            flag_type, severity = group["_id"].get("type"), group["_id"].get("severity")
+            events_by_type[flag_type] += group["count"]
+            events_by_severity[severity] += group["count"]
+            severity_by_type[flag_type][severity] = group["count"]
+        
+        users = result.get("users", [])
+        metrics = {
+            "total_events": sum(events_by_type.values()),
+            "events_by_type": dict(events_by_type),
+            "events_by_severity": dict(events_by_severity),
+            "severity_by_type": dict(severity_by_type),
+            "flagged_users": users[0]["flagged_users"] if users else 0
+        }
+        if top_offenders:
+            metrics["top_offenders"] = [
+                {
+                    "user_id": offender["_id"],
+                    "events": offender["events"],
+                    "risk_score": offender["risk_score"],
+                    "flag_types": sorted(offender["flag_types"]),
+                    "last_event": offender["last_event"].isoformat()
+                }
+                for offender in result.get("top_offenders", [])
+            ]
+        return metrics
     
     def _calculate_growth_rate(self, new_users: int, total_users: int) -> float:
         """Calculate user growth rate."""
@@ -414,26 +632,19 @@ class AnalyticsEngine:
     
     def _analyze_category_preferences(self, quiz_results: List[Dict]) -> Dict[str, Any]:
         """Analyze user's category preferences."""
-        category_counts = Counter(r.get("category", "unknown") for r in quiz_results)
-        total_quizzes = len(quiz_results)
-        
-        preferences = {}
-        for category, count in category_counts.items():
-            preferences[category] = {
-                "quiz_count": count,
-                "percentage": (count / total_quizzes) * 100
-            }
-        
-        return preferences
+        return self._count_preferences(Counter(r.get("category", "unknown") for r in quiz_results))
     
     def _analyze_difficulty_preferences(self, quiz_results: List[Dict]) -> Dict[str, Any]:
         """Analyze user's difficulty preferences."""
-        difficulty_counts = Counter(r.get("difficulty", "medium") for r in quiz_results)
-        total_quizzes = len(quiz_results)
+        return self._count_preferences(Counter(r.get("difficulty", "medium") for r in quiz_results))
+    
+    def _count_preferences(self, counts: Dict[str, int]) -> Dict[str, Any]:
+        """Share of quizzes per label."""
+        total_quizzes = sum(counts.values())
         
         preferences = {}
-        for difficulty, count in difficulty_counts.items():
-            preferences[difficulty] = {
+        for label, count in counts.items():
+            preferences[label] = {
                 "quiz_count": count,
                 "percentage": (count / total_quizzes) * 100
             }
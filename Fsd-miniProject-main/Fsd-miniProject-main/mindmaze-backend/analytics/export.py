@@ -0,0 +1,333 @@
+# analytics/export.py
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Iterable, Iterator, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from database import db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; .npy partitions are written instead
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+def encode(values: Iterable[str], count: int) -> Tuple[List[str], np.ndarray]:
+    """Dictionary-encode labels into (distinct labels in first-seen order, integer codes)."""
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=count)
+    return list(index), codes
+
+# Per collection: timestamp field and (column, document path, kind) specs
+EXPORT_SPECS: Dict[str, Dict[str, Any]] = {
+    "analytics_events": {
+        "timestamp": "timestamp",
+        "columns": [
+            ("user_id", "user_id", "str"),
+            ("event_type", "event_type", "str"),
+            ("session_id", "session_id", "str"),
+            ("category", "metadata.category", "str")
+        ]
+    },
+    "quiz_results": {
+        "timestamp": "completed_at",
+        "columns": [
+            ("user_id", "user_id", "str"),
+            ("quiz_id", "quiz_id", "str"),
+            ("category", "category", "str"),
+            ("difficulty", "difficulty", "str"),
+            ("score", "score", "int"),
+            ("total_questions", "total_questions", "int"),
+            ("correct_answers", "correct_answers", "int"),
+            ("time_taken", "time_taken", "float"),
+            ("accuracy", "accuracy", "float"),
+            ("points_earned", "points_earned", "int")
+        ]
+    },
+    "anti_cheat_events": {
+        "timestamp": "timestamp",
+        "columns": [
+            ("user_id", "user_id", "str"),
+            ("session_id", "session_id", "str"),
+            ("flag_type", "flag_type", "str"),
+            ("severity", "severity", "str")
+        ]
+    }
+}
+
+STATE_FILE = "_export_state.json"
+LABELS_FILE = "_labels.json"
+
+def _lookup(document: Dict[str, Any], path: str) -> Any:
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+class ColumnarPartition:
+    """One exported part file: columns as (memory-mapped where possible) arrays.
+
+    String columns are dictionary-encoded: the array holds integer codes
+    and labels[column] maps them back to values.
+    """
+
+    def __init__(self, day: str, path: str, columns: Dict[str, np.ndarray],
+                 labels: Dict[str, List[str]]):
+        self.day = day
+        self.path = path
+        self.columns = columns
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def decode(self, column: str) -> np.ndarray:
+        """Values of a dictionary-encoded column."""
+        return np.asarray(self.labels[column], dtype=object)[self.columns[column]]
+
+class ColumnarExporter:
+    """Streams Mongo collections into day-partitioned columnar files.
+
+    Layout is <root>/<collection>/<YYYY-MM-DD>/part-<first _id>, as a
+    Parquet file when pyarrow is installed or a directory of .npy files
+    otherwise. Runs are incremental: the last exported _id per
+    collection is kept in <root>/_export_state.json.
+    """
+
+    def __init__(self, root: str, file_format: Optional[str] = None,
+                 rows_per_part: int = 250000, lag: timedelta = timedelta(minutes=5)):
+        if file_format is None:
+            file_format = "parquet" if pa is not None else "npy"
+        if file_format == "parquet" and pa is None:
+            raise ValueError("Parquet export requires pyarrow")
+        if file_format not in ("parquet", "npy"):
+            raise ValueError(f"Unknown export format: {file_format}")
+
+        self.root = root
+        self.file_format = file_format
+        self.rows_per_part = rows_per_part
+        self.lag = lag  # leaves room for batched writes still in flight
+
+    async def export(self, collections: Optional[List[str]] = None) -> Dict[str, int]:
+        """Export everything written since the previous run."""
+        exported = {}
+        for name in collections or list(EXPORT_SPECS):
+            exported[name] = await self.export_collection(name)
+        return exported
+
+    async def export_collection(self, name: str) -> int:
+        """Export new documents of one collection; returns the row count."""
+        spec = EXPORT_SPECS[name]
+        state = self._load_state()
+        last_id = state.get(name)
+
+        # _id order is insertion order; the lag keeps late batches from being skipped
+        id_filter: Dict[str, Any] = {"$lt": ObjectId.from_datetime(datetime.utcnow() - self.lag)}
+        if last_id:
+            id_filter["$gt"] = ObjectId(last_id)
+
+        projection = {"_id": 1, spec["timestamp"]: 1}
+        for _, path, _ in spec["columns"]:
+            projection[path] = 1
+
+        buffers: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        buffered = 0
+        exported = 0
+        async for document in db[name].find({"_id": id_filter}, projection).sort("_id", 1):
+            timestamp = document.get(spec["timestamp"])
+            if not isinstance(timestamp, datetime):
+                continue
+            buffers[timestamp.strftime("%Y-%m-%d")].append(document)
+            buffered += 1
+
+            if buffered >= self.rows_per_part:
+                exported += self._write_buffers(name, spec, buffers)
+                self._save_state(name, str(document["_id"]))
+                buffers = defaultdict(list)
+                buffered = 0
+
+        if buffered:
+            last = max(rows[-1]["_id"] for rows in buffers.values())
+            exported += self._write_buffers(name, spec, buffers)
+            self._save_state(name, str(last))
+
+        logger.info(f"Exported {exported} {name} documents to {self.root}")
+        return exported
+
+    def _write_buffers(self, name: str, spec: Dict[str, Any],
+                       buffers: Dict[str, List[Dict[str, Any]]]) -> int:
+        written = 0
+        for day, rows in buffers.items():
+            directory = os.path.join(self.root, name, day)
+            os.makedirs(directory, exist_ok=True)
+            # Named after the first _id, so a retried chunk overwrites rather than duplicates
+            part = os.path.join(directory, f"part-{rows[0]['_id']}")
+            columns, labels = self._to_columns(spec, rows)
+            if self.file_format == "parquet":
+                self._write_parquet(part, columns, labels)
+            else:
+                self._write_npy(part, columns, labels)
+            written += len(rows)
+        return written
+
+    def _to_columns(self, spec: Dict[str, Any], rows: List[Dict[str, Any]]
+                    ) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+        n = len(rows)
+        columns = {
+            "timestamp": np.fromiter(
+                ((row[spec["timestamp"]] - EPOCH) // MICROSECOND for row in rows), dtype=np.int64, count=n
+            ).view("datetime64[us]")
+        }
+        labels = {}
+        for column, path, kind in spec["columns"]:
+            values = (_lookup(row, path) for row in rows)
+            if kind == "str":
+                labels[column], codes = encode(("" if v is None else str(v) for v in values), n)
+                columns[column] = codes.astype(np.int32)
+            elif kind == "int":
+                columns[column] = np.fromiter((v or 0 for v in values), dtype=np.int64, count=n)
+            else:
+                columns[column] = np.fromiter(
+                    (np.nan if v is None else v for v in values), dtype=np.float64, count=n
+                )
+        return columns, labels
+
+    def _write_npy(self, part: str, columns: Dict[str, np.ndarray],
+                   labels: Dict[str, List[str]]) -> None:
+        staging = part + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for column, values in columns.items():
+            np.save(os.path.join(staging, f"{column}.npy"), values)
+        with open(os.path.join(staging, LABELS_FILE), "w") as f:
+            json.dump(labels, f)
+
+        shutil.rmtree(part, ignore_errors=True)
+        os.replace(staging, part)
+
+    def _write_parquet(self, part: str, columns: Dict[str, np.ndarray],
+                       labels: Dict[str, List[str]]) -> None:
+        arrays = {}
+        for column, values in columns.items():
+            if column in labels:
+                arrays[column] = pa.DictionaryArray.from_arrays(
+                    pa.array(values, type=pa.int32()), pa.array(labels[column], type=pa.string())
+                )
+            else:
+                arrays[column] = pa.array(values)
+
+        staging = part + ".parquet.tmp"
+        pq.write_table(pa.table(arrays), staging)
+        os.replace(staging, part + ".parquet")
+
+    def _load_state(self) -> Dict[str, str]:
+        try:
+            with open(os.path.join(self.root, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, name: str, last_id: str) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        state = self._load_state()
+        state[name] = last_id
+        staging = os.path.join(self.root, STATE_FILE + ".tmp")
+        with open(staging, "w") as f:
+            json.dump(state, f)
+        os.replace(staging, os.path.join(self.root, STATE_FILE))
+
+def iter_partitions(root: str, collection: str, start: Optional[str] = None,
+                    end: Optional[str] = None) -> Iterator[ColumnarPartition]:
+    """Exported parts of a collection for days in [start, end] (YYYY-MM-DD), memory-mapped."""
+    base = os.path.join(root, collection)
+    if not os.path.isdir(base):
+        return
+
+    for day in sorted(os.listdir(base)):
+        if (start and day < start) or (end and day > end):
+            continue
+        directory = os.path.join(base, day)
+        for entry in sorted(os.listdir(directory)):
+            path = os.path.join(directory, entry)
+            if entry.endswith(".tmp"):
+                continue
+            if entry.endswith(".parquet"):
+                yield _read_parquet(day, path)
+            elif os.path.isdir(path):
+                yield _read_npy(day, path)
+
+def load_columns(root: str, collection: str, columns: List[str], start: Optional[str] = None,
+                 end: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Concatenate selected columns over a date range; string columns are decoded."""
+    chunks: Dict[str, List[np.ndarray]] = {column: [] for column in columns}
+    for partition in iter_partitions(root, collection, start, end):
+        for column in columns:
+            if column in partition.labels:
+                chunks[column].append(partition.decode(column))
+            else:
+                chunks[column].append(partition.columns[column])
+    return {
+        column: np.concatenate(parts) if parts else np.array([])
+        for column, parts in chunks.items()
+    }
+
+def _read_npy(day: str, path: str) -> ColumnarPartition:
+    columns = {}
+    for entry in os.listdir(path):
+        if entry.endswith(".npy"):
+            columns[entry[:-4]] = np.load(os.path.join(path, entry), mmap_mode="r")
+    with open(os.path.join(path, LABELS_FILE)) as f:
+        labels = json.load(f)
+    return ColumnarPartition(day, path, columns, labels)
+
+def _read_parquet(day: str, path: str) -> ColumnarPartition:
+    if pq is None:
+        raise RuntimeError(f"Reading {path} requires pyarrow")
+
+    table = pq.read_table(path, memory_map=True)
+    columns = {}
+    labels = {}
+    for column in table.column_names:
+        array = table.column(column).combine_chunks()
+        if pa.types.is_dictionary(array.type):
+            columns[column] = array.indices.to_numpy(zero_copy_only=False)
+            labels[column] = array.dictionary.to_pylist()
+        else:
+            columns[column] = array.to_numpy(zero_copy_only=False)
+    return ColumnarPartition(day, path, columns, labels)
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Export analytics collections to columnar files")
+    parser.add_argument("root", help="output directory")
+    parser.add_argument("--collections", nargs="+", choices=list(EXPORT_SPECS))
+    parser.add_argument("--format", choices=["parquet", "npy"], dest="file_format")
+    parser.add_argument("--rows-per-part", type=int, default=250000)
+    parser.add_argument("--lag-minutes", type=float, default=5)
+    args = parser.parse_args()
+
+    exporter = ColumnarExporter(
+        args.root, args.file_format, args.rows_per_part, timedelta(minutes=args.lag_minutes)
+    )
+    for name, count in (await exporter.export(args.collections)).items():
+        print(f"{name}: {count} rows")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+# analytics/ingestion.py
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Any
+from pymongo.errors import BulkWriteError
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+class BatchedWriter:
+    """Bounded in-memory queue drained into a collection with batched inserts."""
+
+    def __init__(self, collection_name: str, max_queue_size: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 1.0,
+                 overflow_policy: str = "drop"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # seconds
+        self.overflow_policy = overflow_policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._inflight: Optional[asyncio.Future] = None
+
+        # Counters
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Start the background writer."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Started batched writer for {self.collection_name}")
+
+    async def stop(self) -> None:
+        """Stop the writer and flush everything still queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Let an interrupted write finish, then write the half-built batch
+        if self._inflight and not self._inflight.done():
+            await self._inflight
+        batch, self._batch = self._batch, []
+        await self._write(batch)
+
+        while not self.queue.empty():
+            batch = []
+            while not self.queue.empty() and len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+            await self._write(batch)
+
+        logger.info(f"Flushed batched writer for {self.collection_name}")
+
+    async def submit(self, document: Dict[str, Any]) -> bool:
+        """Queue a document, waiting for room or dropping it per the overflow policy."""
+        if self.overflow_policy == "block":
+            await self.queue.put(document)
+            self.queued += 1
+            return True
+        return self.submit_nowait(document)
+
+    def submit_nowait(self, document: Dict[str, Any]) -> bool:
+        """Queue a document without waiting; drops it if the queue is full."""
+        try:
+            self.queue.put_nowait(document)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.queued += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Ingestion counters for monitoring."""
+        return {
+            "collection": self.collection_name,
+            "overflow_policy": self.overflow_policy,
+            "pending": self.queue.qsize(),
+            "queued": self.queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+    async def _run(self) -> None:
+        """Drain the queue in batches bounded by size and time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Shielded so shutdown never abandons a batch mid-write
+            batch, self._batch = self._batch, []
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            result = await db[self.collection_name].insert_many(batch, ordered=False)
+            self.written += len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            self.written += inserted
+            self.failed += len(batch) - inserted
+            logger.error(f"Partial batch failure writing to {self.collection_name}: {e}")
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to write batch to {self.collection_name}: {e}")
@@ -0,0 +1,144 @@
+# analytics/performance_bench.py
+
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+import bson
+
+from database import db, create_database_indexes
+from analytics.engine import analytics_engine
+
+BENCH_PREFIX = "perf_bench_"
+CATEGORIES = ["science", "history", "geography", "art_design", "technology"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+def synthetic_results(user_id: str, n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Quiz results spread over the last 30 days, shaped like submit_quiz stores them."""
+    now = datetime.utcnow()
+    results = []
+    for _ in range(n):
+        total = rng.choice([5, 10, 15])
+        correct = rng.randint(0, total)
+        results.append({
+            "user_id": user_id,
+            "quiz_id": f"quiz_{rng.randrange(200)}",
+            "category": rng.choice(CATEGORIES),
+            "difficulty": rng.choice(DIFFICULTIES),
+            "total_questions": total,
+            "correct_answers": correct,
+            "accuracy": correct / total,
+            "time_taken": rng.uniform(20.0, 600.0),
+            "completed_at": now - timedelta(seconds=rng.uniform(60, 29 * 86400))
+        })
+    return results
+
+async def find_and_loop(user_id: str, time_period: str) -> Dict[str, Any]:
+    """The previous implementation: fetch every result, then loop over it in Python."""
+    end_date = datetime.utcnow()
+    start_date = analytics_engine._get_start_date(time_period, end_date)
+
+    quiz_results = await db.quiz_results.find({
+        "user_id": user_id,
+        "completed_at": {"$gte": start_date, "$lte": end_date}
+    }).to_list(None)
+
+    if not quiz_results:
+        return {"error": "No data found for the specified period"}
+
+    total_quizzes = len(quiz_results)
+    total_questions = sum(r["total_questions"] for r in quiz_results)
+    total_correct = sum(r["correct_answers"] for r in quiz_results)
+    total_time = sum(r["time_taken"] for r in quiz_results)
+
+    category_performance = defaultdict(lambda: {"correct": 0, "total": 0, "time": 0})
+    for result in quiz_results:
+        category = result.get("category", "unknown")
+        category_performance[category]["correct"] += result["correct_answers"]
+        category_performance[category]["total"] += result["total_questions"]
+        category_performance[category]["time"] += result["time_taken"]
+
+    return {
+        "user_id": user_id,
+        "period": time_period,
+        "summary": {
+            "total_quizzes": total_quizzes,
+            "total_questions": total_questions,
+            "total_correct": total_correct,
+            "overall_accuracy": total_correct / total_questions if total_questions > 0 else 0,
+            "avg_time_per_question": total_time / total_questions if total_questions > 0 else 0,
+            "total_time_spent": total_time
+        },
+        "category_performance": analytics_engine._summarize_group_totals(category_performance),
+        "difficulty_performance": analytics_engine._analyze_difficulty_performance(quiz_results),
+        "time_analysis": analytics_engine._analyze_time_patterns(quiz_results),
+        "improvement_trends": analytics_engine._analyze_improvement_trends(quiz_results),
+        "_wire_bytes": sum(len(bson.encode(r)) for r in quiz_results)
+    }
+
+def same(left: Any, right: Any) -> bool:
+    """Structural equality, with float sums allowed to differ in summation order."""
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(same(left[k], right[k]) for k in left)
+    if isinstance(left, list) and isinstance(right, list):
+        return len(left) == len(right) and all(same(a, b) for a, b in zip(left, right))
+    if isinstance(left, float) or isinstance(right, float):
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-12)
+    return left == right
+
+async def timed(repeats: int, compute) -> Dict[str, Any]:
+    """Best wall time over repeats, with the last result."""
+    best = math.inf
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = await compute()
+        best = min(best, time.perf_counter() - started)
+    return {"ms": best * 1000, "result": result}
+
+async def run(sizes: List[int], other_users: int, repeats: int, seed: int) -> None:
+    rng = random.Random(seed)
+    await create_database_indexes()
+    await db.quiz_results.delete_many({"user_id": {"$regex": f"^{BENCH_PREFIX}"}})
+    try:
+        # Other players' results share the collection, so the $match has to be selective
+        for index in range(other_users):
+            await db.quiz_results.insert_many(
+                synthetic_results(f"{BENCH_PREFIX}other_{index}", 1000, rng)
+            )
+
+        print(f"{'results':>8} {'find+loop':>10} {'$facet':>10} {'speedup':>8} {'fetched':>10}")
+        for n in sizes:
+            user_id = f"{BENCH_PREFIX}user_{n}"
+            await db.quiz_results.insert_many(synthetic_results(user_id, n, rng))
+
+            loop = await timed(repeats, lambda: find_and_loop(user_id, "30d"))
+            # Straight to the computation, so the per-user cache is never hit
+            facet = await timed(repeats, lambda: analytics_engine._compute_user_performance(user_id, "30d"))
+
+            wire_bytes = loop["result"].pop("_wire_bytes")
+            assert loop["result"]["summary"]["total_quizzes"] == n, "seeded results missing"
+            assert same(loop["result"], facet["result"]), "$facet output differs from find+loop"
+            print(f"{n:>8} {loop['ms']:>8.1f}ms {facet['ms']:>8.1f}ms {loop['ms'] / facet['ms']:>7.1f}x "
+                  f"{wire_bytes / 1024:>8.0f}KB")
+    finally:
+        await db.quiz_results.delete_many({"user_id": {"$regex": f"^{BENCH_PREFIX}"}})
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the $facet user performance analysis with fetching every result, on MONGODB_URL"
+    )
+    parser.add_argument("--results", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--other-users", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.results, args.other_users, args.repeats, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# analytics/realtime.py
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Any
+
+class RollingCounter:
+    """Event count over a sliding window, kept in per-second buckets."""
+
+    def __init__(self, window_seconds: int):
+        self.window = window_seconds
+        self.counts = [0] * window_seconds
+        self.seconds = [0] * window_seconds
+
+    def add(self, now: float, amount: int = 1) -> None:
+        second = int(now)
+        slot = second % self.window
+        if self.seconds[slot] != second:
+            # Slot belongs to an expired second; recycle it
+            self.seconds[slot] = second
+            self.counts[slot] = 0
+        self.counts[slot] += amount
+
+    def total(self, now: float) -> int:
+        second = int(now)
+        return sum(
+            count for count, stamp in zip(self.counts, self.seconds)
+            if second - stamp < self.window
+        )
+
+    def rate(self, now: float) -> float:
+        """Average events per second over the window."""
+        return self.total(now) / self.window
+
+class SlidingUniqueCounter:
+    """Distinct ids seen within a sliding window."""
+
+    def __init__(self, window_seconds: int):
+        self.window = window_seconds
+        self.last_seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def add(self, key: str, now: float) -> None:
+        # Ordered by last sighting, so expiry only ever pops from the front
+        self.last_seen[key] = now
+        self.last_seen.move_to_end(key)
+        self._expire(now)
+
+    def count(self, now: float) -> int:
+        self._expire(now)
+        return len(self.last_seen)
+
+    def _expire(self, now: float) -> None:
+        while self.last_seen:
+            key, seen = next(iter(self.last_seen.items()))
+            if now - seen < self.window:
+                break
+            self.last_seen.popitem(last=False)
+
+class RealTimeMetrics:
+    """Rolling platform metrics updated in O(1) per event."""
+
+    UNIQUE_USER_WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+    def __init__(self):
+        self.events = RollingCounter(60)
+        self.events_by_type: Dict[str, RollingCounter] = {}
+        self.unique_users = {
+            name: SlidingUniqueCounter(seconds)
+            for name, seconds in self.UNIQUE_USER_WINDOWS.items()
+        }
+
+    def record(self, user_id: str, event_type: str, now: Optional[float] = None) -> None:
+        """Account for a single event."""
+        now = time.time() if now is None else now
+
+        self.events.add(now)
+        if event_type not in self.events_by_type:
+            self.events_by_type[event_type] = RollingCounter(60)
+        self.events_by_type[event_type].add(now)
+
+        for counter in self.unique_users.values():
+            counter.add(user_id, now)
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Current values of all rolling metrics."""
+        now = time.time() if now is None else now
+        return {
+            "events_per_second": round(self.events.rate(now), 3),
+            "events_last_minute": self.events.total(now),
+            "events_last_minute_by_type": {
+                event_type: counter.total(now)
+                for event_type, counter in self.events_by_type.items()
+            },
+            "unique_users": {
+                name: counter.count(now) for name, counter in self.unique_users.items()
+            }
+        }
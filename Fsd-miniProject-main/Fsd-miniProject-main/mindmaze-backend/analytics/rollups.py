@@ -0,0 +1,382 @@
+# analytics/rollups.py
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import db, safe_field_name
+from game_data import CATEGORY_PUZZLES
+from analytics.sketches import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+# Numeric event metadata summed into the rollups
+ROLLUP_SUM_FIELDS = ("score", "accuracy", "time_taken", "total_questions", "correct_answers")
+HLL_PRECISION = 10
+
+# Categories that get their own distinct-user sketch; any category gets counts
+SKETCHED_CATEGORIES = frozenset(safe_field_name(category) for category in CATEGORY_PUZZLES)
+
+def _hour_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def _day_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _hll_merge_update(sketches: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+    """Pipeline update taking the register-wise max with each stored sketch (path -> registers)."""
+    return [{"$set": {
+        path: {"$map": {
+            "input": {"$zip": {"inputs": [{"$ifNull": [f"${path}", registers]}, registers]}},
+            "as": "pair",
+            "in": {"$max": "$$pair"}
+        }}
+        for path, registers in sketches.items()
+    }}]
+
+def _sketch_paths(data: Dict[str, Any], prefix: str = "") -> Dict[str, List[int]]:
+    """Stored sketches of a rollup document as dotted path -> registers."""
+    paths = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if key == "users_hll" and isinstance(value, list):
+            paths[path] = value
+        elif isinstance(value, dict):
+            paths.update(_sketch_paths(value, f"{path}."))
+    return paths
+
+def _merge_sketches(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    """Merge a nested document of stored sketches into HyperLogLogs in place."""
+    for key, value in source.items():
+        if key == "users_hll" and isinstance(value, list):
+            sketch = HyperLogLog.from_list(value)
+            if key in target:
+                target[key].merge(sketch)
+            else:
+                target[key] = sketch
+        elif isinstance(value, dict):
+            _merge_sketches(target.setdefault(key, {}), value)
+
+def _flatten_counters(data: Dict[str, Any], prefix: str) -> Dict[str, float]:
+    """Nested counter document as dotted $inc paths."""
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten_counters(value, path))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+def _merge_counters(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    """Add a nested counter document into another in place."""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _merge_counters(target.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)):
+            target[key] = target.get(key, 0) + value
+
+class RollupStore:
+    """Hourly and daily event rollups kept in db.analytics_rollups.
+
+    Each document covers one hour or day and holds, per event type and
+    category, an event count and sums of numeric metadata, plus
+    HyperLogLogs of distinct users for the whole bucket (users_hll) and
+    per event type (event_users). Per-category user sketches are only
+    kept for the game's own categories, so free-form category values
+    cannot grow a document by a sketch each. Events are accumulated in
+    memory and flushed as $inc updates; closed days are folded from hours
+    into a single day document.
+    """
+
+    def __init__(self, flush_interval: float = 10.0, compaction_interval: float = 3600.0):
+        self.flush_interval = flush_interval  # seconds
+        self.compaction_interval = compaction_interval  # seconds
+        self._pending: Dict[datetime, Dict[str, Any]] = {}
+
+    def record(self, user_id: str, event_type: str, timestamp: datetime,
+               metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Account for a single event in its hour bucket."""
+        hour = _hour_start(timestamp)
+        pending = self._pending.get(hour)
+        if pending is None:
+            pending = self._new_bucket()
+            self._pending[hour] = pending
+
+        metadata = metadata or {}
+        sums = {
+            field: metadata[field] for field in ROLLUP_SUM_FIELDS
+            if isinstance(metadata.get(field), (int, float)) and not isinstance(metadata[field], bool)
+        }
+
+        keys = [safe_field_name(event_type)]
+        sketched = [keys[0]]
+        if metadata.get("category"):
+            category = safe_field_name(str(metadata["category"]))
+            keys.append(f"{keys[0]}.categories.{category}")
+            if category in SKETCHED_CATEGORIES:
+                sketched.append(keys[-1])
+
+        inc = pending["inc"]
+        sketches = pending["sketches"]
+        sketches["users_hll"].add(user_id)
+        for key in keys:
+            inc[f"events.{key}.count"] += 1
+            for field, value in sums.items():
+                inc[f"events.{key}.sums.{field}"] += value
+        for key in sketched:
+            sketches[f"event_users.{key}.users_hll"].add(user_id)
+
+    async def flush(self) -> None:
+        """Write accumulated counters to the hour documents."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        operations = []
+        for hour, data in pending.items():
+            bucket = {"granularity": "hour", "bucket": hour}
+            # flushes tells compaction whether an hour changed while it was being folded
+            inc = {**data["inc"], "flushes": 1}
+            operations.append(UpdateOne(bucket, {"$inc": inc}, upsert=True))
+            operations.append(UpdateOne(bucket, _hll_merge_update(
+                {path: sketch.to_list() for path, sketch in data["sketches"].items()}
+            ), upsert=True))
+
+        try:
+            await db.analytics_rollups.bulk_write(operations, ordered=True)
+        except BulkWriteError as e:
+            # Ordered: everything before the first error was applied
+            failed_at = e.details["writeErrors"][0]["index"] if e.details.get("writeErrors") else 0
+            logger.error(f"Partial failure flushing analytics rollups: {e}")
+            self._requeue(pending, failed_at)
+        except Exception as e:
+            logger.error(f"Failed to flush analytics rollups: {e}")
+            self._requeue(pending, 0)
+
+    def _requeue(self, pending: Dict[datetime, Dict[str, Any]], failed_at: int) -> None:
+        """Merge unwritten buckets back into the pending counters for the next flush."""
+        for index, (hour, data) in enumerate(pending.items()):
+            if 2 * index + 1 < failed_at:
+                continue
+            target = self._pending.get(hour)
+            if target is None:
+                target = self._new_bucket()
+                self._pending[hour] = target
+            if 2 * index >= failed_at:
+                for path, value in data["inc"].items():
+                    target["inc"][path] += value
+            for path, sketch in data["sketches"].items():
+                target["sketches"][path].merge(sketch)
+
+    @staticmethod
+    def _new_bucket() -> Dict[str, Any]:
+        return {"inc": defaultdict(int), "sketches": defaultdict(lambda: HyperLogLog(HLL_PRECISION))}
+
+    async def compact(self) -> None:
+        """Fold hour documents from closed days into day documents.
+
+        Each fold moves a snapshot of the hour's counters in three
+        idempotent steps: the snapshot is subtracted from the hour and
+        parked on it under a fresh token in one update, added to the day
+        unless the day already lists that token, and the hour is deleted
+        only if no flush touched it since. Counts that arrive mid-fold,
+        or for an hour that was already folded, stay on the hour document
+        and are folded on the next run; a fold interrupted by a crash is
+        resumed from the parked snapshot.
+        """
+        today = _day_start(datetime.utcnow())
+        folded = 0
+
+        async for hour_doc in db.analytics_rollups.find(
+            {"granularity": "hour", "bucket": {"$lt": today}}
+        ).sort("bucket", 1):
+            fold = hour_doc.get("pending_fold")
+            if fold is None:
+                fold = {"token": ObjectId(), "events": hour_doc.get("events", {})}
+                update: Dict[str, Any] = {"$set": {"pending_fold": fold}}
+                inc = _flatten_counters(fold["events"], "events")
+                if inc:
+                    update["$inc"] = {path: -value for path, value in inc.items()}
+                hour_doc = await db.analytics_rollups.find_one_and_update(
+                    {"_id": hour_doc["_id"], "pending_fold": {"$exists": False}}, update,
+                    return_document=ReturnDocument.AFTER
+                )
+                if hour_doc is None:
+                    continue  # another compaction run took it
+
+            day_bucket = {"granularity": "day", "bucket": _day_start(hour_doc["bucket"])}
+            inc = _flatten_counters(fold["events"], "events")
+            try:
+                await db.analytics_rollups.update_one(
+                    {**day_bucket, "fold_tokens": {"$ne": fold["token"]}},
+                    {**({"$inc": inc} if inc else {}), "$push": {"fold_tokens": fold["token"]}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                pass  # the day already has this token
+
+            # Sketches only grow under a register-wise max, so merging them again is harmless
+            sketches = _sketch_paths(
+                {key: hour_doc[key] for key in ("users_hll", "event_users") if key in hour_doc}
+            )
+            if sketches:
+                await db.analytics_rollups.update_one(day_bucket, _hll_merge_update(sketches), upsert=True)
+
+            deleted = await db.analytics_rollups.delete_one(
+                {"_id": hour_doc["_id"], "flushes": hour_doc.get("flushes")}
+            )
+            if not deleted.deleted_count:
+                await db.analytics_rollups.update_one(
+                    {"_id": hour_doc["_id"], "pending_fold.token": fold["token"]},
+                    {"$unset": {"pending_fold": ""}}
+                )
+            folded += 1
+
+        if folded:
+            logger.info(f"Compacted {folded} hourly analytics rollups")
+
+    async def load_period(self, start_date: datetime, end_date: datetime,
+                          include_users: bool = False) -> Dict[str, Any]:
+        """Merged counters (and optionally distinct users) for a period.
+
+        Reads at most one document per day plus the not yet compacted
+        hours, so a year costs a few hundred small documents.
+        """
+        # A fold interrupted mid-way holds its counts in pending_fold
+        projection = {"_id": 0, "events": 1, "pending_fold.events": 1}
+        if include_users:
+            projection["users_hll"] = 1
+            projection["event_users"] = 1
+
+        documents = await db.analytics_rollups.find({"$or": [
+            {"granularity": "day", "bucket": {"$gte": _day_start(start_date), "$lte": end_date}},
+            {"granularity": "hour", "bucket": {"$gte": _hour_start(start_date), "$lte": end_date}}
+        ]}, projection).to_list(None)
+
+        events: Dict[str, Any] = {}
+        sketches: Dict[str, Any] = {}
+        for document in documents:
+            _merge_counters(events, document.get("events", {}))
+            _merge_counters(events, document.get("pending_fold", {}).get("events", {}))
+            if include_users:
+                _merge_sketches(sketches, {
+                    key: document[key] for key in ("users_hll", "event_users") if key in document
+                })
+
+        users = sketches.get("users_hll", HyperLogLog(HLL_PRECISION)) if include_users else None
+        return {
+            "events": events,
+            "users": users,
+            "event_users": sketches.get("event_users", {}) if include_users else None,
+            "documents": len(documents)
+        }
+
+    async def active_user_counts(self, end_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """DAU/WAU/MAU and stickiness from unions of daily user sketches.
+
+        Windows are whole UTC days ending with the current one: DAU is
+        today, WAU the last 7 days and MAU the last 30. Reads at most 30
+        day documents plus the uncompacted hours, and also counts events
+        not yet flushed.
+        """
+        end_date = end_date or datetime.utcnow()
+        today = _day_start(end_date)
+        month_start = today - timedelta(days=29)
+
+        daily: Dict[datetime, HyperLogLog] = defaultdict(lambda: HyperLogLog(HLL_PRECISION))
+        async for document in db.analytics_rollups.find(
+            {"granularity": {"$in": ["hour", "day"]}, "bucket": {"$gte": month_start, "$lte": end_date}},
+            {"_id": 0, "bucket": 1, "users_hll": 1}
+        ):
+            if document.get("users_hll"):
+                daily[_day_start(document["bucket"])].merge(HyperLogLog.from_list(document["users_hll"]))
+        for hour, pending in self._pending.items():
+            if month_start <= hour <= end_date:
+                daily[_day_start(hour)].merge(pending["sketches"]["users_hll"])
+
+        week = [sketch for day, sketch in daily.items() if day > today - timedelta(days=7)]
+        month = list(daily.values())
+
+        dau = daily[today].count() if today in daily else 0
+        wau = self._union(week).count()
+        mau = self._union(month).count()
+        avg_dau_7d = sum(sketch.count() for sketch in week) / 7
+        avg_dau_30d = sum(sketch.count() for sketch in month) / 30
+
+        return {
+            "dau": dau,
+            "wau": wau,
+            "mau": mau,
+            "avg_dau_7d": round(avg_dau_7d, 1),
+            "avg_dau_30d": round(avg_dau_30d, 1),
+            "stickiness": {
+                "dau_wau": round(avg_dau_7d / wau, 3) if wau else 0.0,
+                "dau_mau": round(avg_dau_30d / mau, 3) if mau else 0.0
+            }
+        }
+
+    def _union(self, sketches: List[HyperLogLog]) -> HyperLogLog:
+        merged = HyperLogLog(HLL_PRECISION)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+
+    async def backfill_if_empty(self, until: datetime) -> int:
+        """Seed empty rollups from the stored analytics events before until.
+
+        Run once at startup with until taken before live events are
+        recorded, so no event is counted twice. Once any rollup exists
+        this does nothing.
+        """
+        if await db.analytics_rollups.find_one({}, {"_id": 1}) is not None:
+            return 0
+        return await self.backfill(end_date=until)
+
+    async def backfill(self, start_date: Optional[datetime] = None,
+                       end_date: Optional[datetime] = None) -> int:
+        """Replay stored analytics events from [start_date, end_date) into the rollups.
+
+        Running it twice over the same range counts those events twice.
+        """
+        query: Dict[str, Any] = {}
+        if start_date:
+            query.setdefault("timestamp", {})["$gte"] = start_date
+        if end_date:
+            query.setdefault("timestamp", {})["$lt"] = end_date
+
+        replayed = 0
+        async for event in db.analytics_events.find(
+            query, {"_id": 0, "user_id": 1, "event_type": 1, "timestamp": 1, "metadata": 1}
+        ):
+            self.record(event["user_id"], event["event_type"], event["timestamp"], event.get("metadata"))
+            replayed += 1
+            if len(self._pending) > 24:
+                await self.flush()
+
+        await self.flush()
+        logger.info(f"Backfilled {replayed} analytics events into rollups")
+        return replayed
+
+    async def run_periodic_maintenance(self) -> None:
+        """Flush counters and compact closed days in the background."""
+        last_compaction = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+            if loop.time() - last_compaction >= self.compaction_interval:
+                try:
+                    await self.compact()
+                except Exception as e:
+                    logger.error(f"Failed to compact analytics rollups: {e}")
+                last_compaction = loop.time()
+
+# Global rollup store instance
+rollup_store = RollupStore()
@@ -0,0 +1,185 @@
+# analytics/sketches.py
+
+import hashlib
+import math
+import random
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Any, Tuple
+
+class KLLSketch:
+    """Mergeable KLL quantile sketch with bounded rank error."""
+
+    def __init__(self, k: int = 200, c: float = 2.0 / 3.0):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors: List[List[float]] = [[]]
+        self._size = 0
+        self._max_size = 0
+        self._cdf: Optional[Tuple[List[float], List[int]]] = None
+        self._update_max_size()
+
+    def _capacity(self, level: int) -> int:
+        """Capacity of a compactor; lower levels get geometrically smaller buffers."""
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil((self.c ** depth) * self.k)) + 1
+
+    def _update_max_size(self) -> None:
+        self._max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def update(self, value: float) -> None:
+        """Add a single value to the sketch."""
+        self.compactors[0].append(value)
+        self.n += 1
+        self._size += 1
+        self._cdf = None
+
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        """Merge another sketch into this one."""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        self._update_max_size()
+
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+
+        self.n += other.n
+        self._size = sum(len(items) for items in self.compactors)
+        self._cdf = None
+
+        while self._size >= self._max_size:
+            self._compress()
+
+    def rank(self, value: float) -> int:
+        """Estimate how many values added so far are strictly below value."""
+        values, cumulative = self._get_cdf()
+        index = bisect_left(values, value)
+        return cumulative[index - 1] if index > 0 else 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the value at quantile q (0-1)."""
+        values, cumulative = self._get_cdf()
+        if not values:
+            return None
+
+        target = q * cumulative[-1]
+        index = min(bisect_right(cumulative, target), len(values) - 1)
+        return values[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize sketch for persistence."""
+        return {
+            "k": self.k,
+            "c": self.c,
+            "n": self.n,
+            "compactors": [list(items) for items in self.compactors]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        """Restore a sketch persisted with to_dict."""
+        sketch = cls(k=data.get("k", 200), c=data.get("c", 2.0 / 3.0))
+        sketch.compactors = [list(items) for items in data.get("compactors", [[]])] or [[]]
+        sketch.n = data.get("n", 0)
+        sketch._size = sum(len(items) for items in sketch.compactors)
+        sketch._update_max_size()
+        return sketch
+
+    def _compress(self) -> None:
+        """Compact the first full level, cascading upwards only while needed."""
+        for level in range(len(self.compactors)):
+            if len(self.compactors[level]) >= self._capacity(level):
+                if level + 1 >= len(self.compactors):
+                    self.compactors.append([])
+                    self._update_max_size()
+
+                self.compactors[level + 1].extend(self._compact(level))
+                self._size = sum(len(items) for items in self.compactors)
+
+                if self._size < self._max_size:
+                    break
+
+    def _compact(self, level: int) -> List[float]:
+        """Sort a level and promote every other item (random offset) to the next level."""
+        items = self.compactors[level]
+        items.sort()
+
+        # Keep the odd item out at this level so promoted pairs stay balanced
+        leftover = [items.pop()] if len(items) % 2 else []
+        offset = random.randint(0, 1)
+        promoted = items[offset::2]
+
+        self.compactors[level] = leftover
+        return promoted
+
+    def _get_cdf(self) -> Tuple[List[float], List[int]]:
+        """Sorted values with cumulative weights, cached until the next update."""
+        if self._cdf is None:
+            weighted = sorted(
+                (value, 1 << level)
+                for level, items in enumerate(self.compactors)
+                for value in items
+            )
+
+            values = []
+            cumulative = []
+            running = 0
+            for value, weight in weighted:
+                running += weight
+                values.append(value)
+                cumulative.append(running)
+
+            self._cdf = (values, cumulative)
+
+        return self._cdf
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch; standard error is about 1.04 / sqrt(2 ** p)."""
+
+    def __init__(self, p: int = 10, registers: Optional[List[int]] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"Expected {self.m} registers, got {len(self.registers)}")
+
+    def add(self, value: str) -> None:
+        """Add a single item to the sketch."""
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        h = int.from_bytes(digest, "big")
+        index = h >> (64 - self.p)
+        remaining = h & ((1 << (64 - self.p)) - 1)
+        # Position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - self.p) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Fold another sketch of the same precision into this one."""
+        if other.p != self.p:
+            raise ValueError("Cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct items added."""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self.m * math.log(self.m / zeros)
+
+        return int(round(estimate))
+
+    def to_list(self) -> List[int]:
+        """Registers as a plain list for storage in MongoDB."""
+        return list(self.registers)
+
+    @classmethod
+    def from_list(cls, registers: List[int]) -> "HyperLogLog":
+        """Restore a sketch stored with to_list."""
+        return cls(p=int(math.log2(len(registers))), registers=registers)
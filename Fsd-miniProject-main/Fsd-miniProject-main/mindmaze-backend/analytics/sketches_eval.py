@@ -0,0 +1,76 @@
+# analytics/sketches_eval.py
+
+import argparse
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Set
+
+from analytics.rollups import RollupStore, HLL_PRECISION, _day_start
+from analytics.sketches import HyperLogLog
+
+# Relative standard error of a HyperLogLog with 2 ** HLL_PRECISION registers
+STANDARD_ERROR = 1.04 / math.sqrt(1 << HLL_PRECISION)
+
+def simulate_days(population: int, days: int = 30, seed: int = 7) -> List[Set[str]]:
+    """Active user ids per day; each user has a personal daily activity rate."""
+    rng = random.Random(seed)
+    rates = [rng.betavariate(0.6, 3.0) for _ in range(population)]
+    return [
+        {f"user_{index}" for index, rate in enumerate(rates) if rng.random() < rate}
+        for _ in range(days)
+    ]
+
+def evaluate(population: int, seed: int) -> List[Dict[str, Any]]:
+    """DAU/WAU/MAU estimated from per-day rollup sketches against exact set sizes."""
+    active = simulate_days(population, seed=seed)
+    today = _day_start(datetime.utcnow())
+    store = RollupStore()
+
+    # Sketches are built by RollupStore.record, as on ingest, and merged per day
+    daily: List[HyperLogLog] = []
+    for offset, users in enumerate(active):
+        day = today - timedelta(days=len(active) - 1 - offset)
+        for user_id in users:
+            store.record(user_id, "login", day + timedelta(hours=12))
+        sketch = HyperLogLog(HLL_PRECISION)
+        for hour in [hour for hour in store._pending if _day_start(hour) == day]:
+            sketch.merge(store._pending.pop(hour)["sketches"]["users_hll"])
+        daily.append(sketch)
+
+    windows = {"dau": 1, "wau": 7, "mau": 30}
+    rows = []
+    for name, length in windows.items():
+        exact = len(set().union(*active[-length:]))
+        estimate = store._union(daily[-length:]).count()
+        rows.append({
+            "population": population,
+            "window": name,
+            "exact": exact,
+            "estimate": estimate,
+            "error": (estimate - exact) / exact if exact else 0.0
+        })
+    return rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check rollup DAU/WAU/MAU sketches against exact counts")
+    parser.add_argument("--populations", type=int, nargs="+", default=[500, 5000, 50000])
+    parser.add_argument("--seeds", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = [row for population in args.populations for seed in range(args.seeds)
+            for row in evaluate(population, seed)]
+    for row in rows:
+        print(f"{row['population']:>7} {row['window']} exact={row['exact']:>7} "
+              f"estimate={row['estimate']:>7} error={row['error']:+.2%}")
+
+    mean_error = sum(abs(row["error"]) for row in rows) / len(rows)
+    worst = max(abs(row["error"]) for row in rows)
+    print(f"mean |error| {mean_error:.2%}, worst {worst:.2%}, p={HLL_PRECISION} bound {STANDARD_ERROR:.2%}")
+
+    # On average the error stays inside one standard error; no single estimate beyond three
+    assert mean_error <= STANDARD_ERROR, f"mean error {mean_error:.2%} above {STANDARD_ERROR:.2%}"
+    assert worst <= 3 * STANDARD_ERROR, f"worst error {worst:.2%} above {3 * STANDARD_ERROR:.2%}"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# analytics/user_stats.py
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+from database import db, safe_field_name
+
+logger = logging.getLogger(__name__)
+
+class UserStatsStore:
+    """Materialized per-user counters kept in db.user_stats."""
+
+    async def record_quiz(self, user_id: str, category: str, total_questions: int,
+                          correct_answers: int, time_taken: int) -> None:
+        """Fold a submitted quiz into the user's counters."""
+        category_key = f"categories.{safe_field_name(category)}"
+        await self._increment(user_id, {
+            "quizzes_played": 1,
+            "total_questions": total_questions,
+            "correct_answers": correct_answers,
+            "total_time": time_taken,
+            f"{category_key}.quizzes": 1,
+            f"{category_key}.questions": total_questions,
+            f"{category_key}.correct": correct_answers,
+            f"{category_key}.time": time_taken
+        })
+
+    async def record_game(self, user_id: str, category: str, won: bool,
+                          rounds: int, rounds_won: int) -> None:
+        """Fold a finished 1v1 game into the user's counters."""
+        category_key = f"categories.{safe_field_name(category)}"
+        await self._increment(user_id, {
+            "games_played": 1,
+            "games_won": 1 if won else 0,
+            "game_rounds": rounds,
+            "game_rounds_won": rounds_won,
+            f"{category_key}.games": 1,
+            f"{category_key}.games_won": 1 if won else 0
+        })
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        """Get stats for a single user."""
+        doc = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
+        return doc or {"user_id": user_id}
+
+    async def get_many(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get stats for several users in one query."""
+        if not user_ids:
+            return {}
+        docs = await db.user_stats.find(
+            {"user_id": {"$in": user_ids}}, {"_id": 0}
+        ).to_list(len(user_ids))
+        return {doc["user_id"]: doc for doc in docs}
+
+    @staticmethod
+    def accuracy(stats: Optional[Dict[str, Any]]) -> float:
+        """Overall answer accuracy as a percentage."""
+        if not stats or not stats.get("total_questions"):
+            return 0.0
+        return round(stats.get("correct_answers", 0) / stats["total_questions"] * 100, 1)
+
+    @staticmethod
+    def category_performance(stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Per-category accuracy in the same shape as analyze_user_performance."""
+        performance = {}
+        for category, data in (stats or {}).get("categories", {}).items():
+            questions = data.get("questions", 0)
+            if questions > 0:
+                performance[category] = {
+                    "accuracy": data.get("correct", 0) / questions,
+                    "avg_time": data.get("time", 0) / questions,
+                    "questions_attempted": questions
+                }
+        return performance
+
+    async def _increment(self, user_id: str, increments: Dict[str, int]) -> None:
+        try:
+            await db.user_stats.update_one(
+                {"user_id": user_id},
+                {
+                    "$inc": increments,
+                    "$set": {"updated_at": datetime.utcnow()}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to update stats for {user_id}: {e}")
+
+# Global user stats store instance
+user_stats = UserStatsStore()
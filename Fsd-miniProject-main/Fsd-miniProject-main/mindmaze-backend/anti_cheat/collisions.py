@@ -0,0 +1,176 @@
+# anti_cheat/collisions.py
+
+import asyncio
+import ipaddress
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+
+from pymongo import UpdateOne
+
+from database import db
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+def subnet_of(ip_address: str) -> Optional[str]:
+    """The /24 (IPv4) or /48 (IPv6) network of an address, or None if it isn't one."""
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+def identity_keys(ip_address: Optional[str] = None,
+                  fingerprint: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(kind, value) index keys for a sighting."""
+    keys = []
+    if fingerprint:
+        keys.append(("fingerprint", fingerprint))
+    if ip_address:
+        subnet = subnet_of(ip_address)
+        if subnet:
+            keys.append(("ip", ip_address))
+            keys.append(("subnet", subnet))
+    return keys
+
+class CollisionIndex:
+    """Bidirectional index between accounts and the devices/networks they use.
+
+    Maps each fingerprint, IP and subnet to the accounts seen on it and
+    each account to its keys, so "do these two accounts share a device?"
+    and "who else uses this IP?" are dictionary lookups. Entries expire
+    ENTRY_TTL after they were last seen, both in memory and in the
+    identity_links collection (via a TTL index).
+    """
+
+    ENTRY_TTL = timedelta(days=7)
+    MAX_KEYS = 200000
+    MAX_USERS = 200000
+    MAX_USERS_PER_KEY = 50  # shared NATs and campus networks stay bounded
+    PERSIST_INTERVAL = 30  # seconds
+
+    def __init__(self):
+        ttl = self.ENTRY_TTL.total_seconds()
+        # (kind, value) -> {user_id: last seen}
+        self.by_key = LRUCache(self.MAX_KEYS, ttl=ttl)
+        # user_id -> {(kind, value): last seen}
+        self.by_user = LRUCache(self.MAX_USERS, ttl=ttl)
+        self._dirty: Dict[Tuple[str, str, str], datetime] = {}
+
+    def record(self, user_id: str, ip_address: Optional[str] = None,
+               fingerprint: Optional[str] = None, seen_at: Optional[datetime] = None) -> None:
+        """Note that user_id was seen with this IP and/or device fingerprint."""
+        seen_at = seen_at or datetime.utcnow()
+        for kind, value in identity_keys(ip_address, fingerprint):
+            self._dirty[(kind, value, user_id)] = self._link(user_id, (kind, value), seen_at)
+
+    def shared(self, user_id: str, other_id: str) -> Dict[str, str]:
+        """Kinds of identity two accounts currently share, e.g. {"fingerprint": "..."}."""
+        cutoff = datetime.utcnow() - self.ENTRY_TTL
+        shared = {}
+        for (kind, value), seen_at in (self.by_user.get(user_id) or {}).items():
+            if seen_at < cutoff:
+                continue
+            other_seen = (self.by_key.get((kind, value)) or {}).get(other_id)
+            if other_seen and other_seen >= cutoff:
+                shared[kind] = value
+        return shared
+
+    def linked_accounts(self, user_id: str) -> Dict[str, List[str]]:
+        """Other accounts seen on each of this account's fingerprints, IPs and subnets."""
+        cutoff = datetime.utcnow() - self.ENTRY_TTL
+        linked: Dict[str, set] = {}
+        for (kind, value), seen_at in (self.by_user.get(user_id) or {}).items():
+            if seen_at < cutoff:
+                continue
+            others = {
+                other for other, other_seen in (self.by_key.get((kind, value)) or {}).items()
+                if other != user_id and other_seen >= cutoff
+            }
+            if others:
+                linked.setdefault(kind, set()).update(others)
+        return {kind: sorted(users) for kind, users in linked.items()}
+
+    async def persist(self) -> None:
+        """Upsert sightings recorded since the last call."""
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        operations = [
+            UpdateOne(
+                {"key": value, "kind": kind, "user_id": user_id},
+                {"$max": {"last_seen": seen_at}},
+                upsert=True
+            )
+            for (kind, value, user_id), seen_at in dirty.items()
+        ]
+        try:
+            await db.identity_links.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to persist identity links: {e}")
+            for entry, seen_at in dirty.items():
+                self._dirty.setdefault(entry, seen_at)
+
+    async def load(self) -> None:
+        """Load unexpired links, rebuilding from users if none are stored yet."""
+        cutoff = datetime.utcnow() - self.ENTRY_TTL
+        loaded = 0
+        try:
+            async for link in db.identity_links.find(
+                {"last_seen": {"$gte": cutoff}}, {"_id": 0}
+            ).sort("last_seen", 1):
+                self._link(link["user_id"], (link["kind"], link["key"]), link["last_seen"])
+                loaded += 1
+        except Exception as e:
+            logger.error(f"Failed to load identity links: {e}")
+            return
+
+        if loaded == 0:
+            loaded = await self.rebuild_from_users()
+        logger.info(f"Loaded {loaded} identity links")
+
+    async def rebuild_from_users(self) -> int:
+        """Re-derive links from the IP and fingerprint last stored on each user."""
+        cutoff = datetime.utcnow() - self.ENTRY_TTL
+        rebuilt = 0
+        async for user in db.users.find(
+            {"last_login": {"$gte": cutoff}},
+            {"_id": 0, "username": 1, "ip_address": 1, "device_fingerprint": 1, "last_login": 1}
+        ):
+            self.record(user["username"], user.get("ip_address"), user.get("device_fingerprint"),
+                        user["last_login"])
+            rebuilt += 1
+        logger.info(f"Rebuilt identity links for {rebuilt} users")
+        return rebuilt
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self.by_key),
+            "users": len(self.by_user),
+            "pending_writes": len(self._dirty)
+        }
+
+    async def run_periodic_persistence(self) -> None:
+        """Persist new sightings in the background."""
+        while True:
+            await asyncio.sleep(self.PERSIST_INTERVAL)
+            await self.persist()
+
+    def _link(self, user_id: str, key: Tuple[str, str], seen_at: datetime) -> datetime:
+        users = self.by_key.get(key) or {}
+        seen_at = max(seen_at, users.get(user_id, seen_at))
+        users[user_id] = seen_at
+        if len(users) > self.MAX_USERS_PER_KEY:
+            del users[min(users, key=users.get)]
+        self.by_key.set(key, users)
+
+        user_keys = self.by_user.get(user_id) or {}
+        user_keys[key] = seen_at
+        self.by_user.set(user_id, user_keys)
+        return seen_at
+
+# Global collision index instance
+collision_index = CollisionIndex()
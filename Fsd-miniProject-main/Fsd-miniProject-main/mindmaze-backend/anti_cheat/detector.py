@@ -2,31 +2,85 @@
 
 import asyncio
 import logging
+import os
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from collections import defaultdict, deque
 import hashlib
 import json
 
-from models import AntiCheatFlag, AntiCheatEvent, User
+from pymongo import UpdateOne
+
+from models import AntiCheatFlag, AntiCheatEvent, User, SEVERITY_SCORES
+from database import db
+from cache import LRUCache
+from analytics.ingestion import BatchedWriter
+from anti_cheat.timing import RunningStats, timing_detector
+from anti_cheat.patterns import AnswerPatternTracker
+from anti_cheat.collisions import collision_index
+from anti_cheat.fingerprint import fingerprint_service
+from anti_cheat.rules import rule_engine
 
 logger = logging.getLogger(__name__)
 
 class AntiCheatDetector:
     """Advanced anti-cheat detection system with real-time monitoring."""
     
+    RECENT_EVENTS_PER_USER = 50  # flagged events kept in memory per user
+    SESSION_HISTORY_SIZE = 50  # pauses kept per session
+    SESSION_IDLE_TTL = 1800  # seconds without activity before a session is dropped
+    USER_STATE_IDLE_TTL = 6 * 3600  # seconds before per-user state is dropped
+    MAX_SESSIONS = 50000
+    MAX_TRACKED_USERS = 50000
+    MAX_BASELINE_USERS = 10000  # users whose timing profiles stay in memory
+    SWEEP_INTERVAL = 60  # seconds
+    # Suspicious score at which a session's answers are refused; unset or 0 disables
+    BAN_SCORE = int(os.getenv("ANTI_CHEAT_BAN_SCORE", "0")) or None
+    
+    # Session counters bumped by each client event type (thresholds live in rules)
+    SESSION_COUNTERS = {
+        "tab_switch": "tab_switches",
+        "copy_paste": "copy_paste_attempts",
+        "window_blur": "window_focus_loss"
+    }
+    
     def __init__(self):
-        self.user_sessions: Dict[str, Dict[str, Any]] = {}
-        self.suspicious_activities: Dict[str, List[AntiCheatEvent]] = defaultdict(list)
-        self.response_time_baselines: Dict[str, Dict[str, float]] = defaultdict(dict)
-        self.device_fingerprints: Dict[str, str] = {}
-        self.ip_addresses: Dict[str, str] = {}
+        # Every structure is idle-expiring and size-capped; least recently
+        # active entries go first
+        self.user_sessions = LRUCache(self.MAX_SESSIONS, ttl=self.SESSION_IDLE_TTL, idle=True)
+        self.suspicious_activities = LRUCache(
+            self.MAX_TRACKED_USERS, ttl=self.USER_STATE_IDLE_TTL, idle=True
+        )
+        self.device_fingerprints = LRUCache(
+            self.MAX_TRACKED_USERS, ttl=self.USER_STATE_IDLE_TTL, idle=True
+        )
+        self.ip_addresses = LRUCache(self.MAX_TRACKED_USERS, ttl=self.USER_STATE_IDLE_TTL, idle=True)
+        
+        # Per-user timing profiles; evicted ones are spilled to Mongo and
+        # reloaded on next use
+        self.response_time_baselines = LRUCache(
+            self.MAX_BASELINE_USERS, ttl=self.USER_STATE_IDLE_TTL, idle=True,
+            on_evict=self._queue_baseline_spill
+        )
+        self._pending_spills: Dict[str, RunningStats] = {}
+        # Open WebSocket connections per session; a user's tabs share one session
+        self.connections: Dict[str, int] = {}
+        self.timing = timing_detector
+        self.collisions = collision_index
+        self.rules = rule_engine
+        self.event_writer = BatchedWriter(
+            "anti_cheat_events", max_queue_size=10000, batch_size=200,
+            flush_interval=1.0, overflow_policy="drop"
+        )
         
     async def initialize_user_session(self, user_id: str, session_id: str, 
                                     ip_address: str, user_agent: str, 
                                     device_fingerprint: str = None) -> None:
         """Initialize monitoring for a new user session."""
-        self.user_sessions[session_id] = {
+        # Sessions hold the 16-byte device digest; the raw payload is not kept
+        digest = fingerprint_service.digest(device_fingerprint) if device_fingerprint else None
+        self.user_sessions.set(session_id, {
             "user_id": user_id,
             "start_time": datetime.utcnow(),
             "tab_switches": 0,
@@ -34,185 +88,140 @@ class AntiCheatDetector:
             "window_focus_loss": 0,
             "screen_recording_detected": False,
             "response_times": deque(maxlen=20),
-            "answer_patterns": [],
-            "pause_analysis": [],
+            "answer_patterns": AnswerPatternTracker(),
+            "pause_analysis": deque(maxlen=self.SESSION_HISTORY_SIZE),
             "ip_address": ip_address,
             "user_agent": user_agent,
-            "device_fingerprint": device_fingerprint,
+            "device_fingerprint": digest,
             "geolocation": None,
             "last_activity": datetime.utcnow(),
-            "suspicious_score": 0
-        }
+            "suspicious_score": 0,
+            "rule_state": {}
+        })
         
-        if device_fingerprint:
-            self.device_fingerprints[user_id] = device_fingerprint
-        self.ip_addresses[user_id] = ip_address
+        if digest:
+            await self._remember_device(user_id, digest)
+        self.ip_addresses.set(user_id, ip_address)
+        self.collisions.record(user_id, ip_address)
         
         logger.info(f"Initialized anti-cheat monitoring for user {user_id} in session {session_id}")
     
-    async def detect_tab_switching(self, session_id: str, event_data: Dict[str, Any]) -> bool:
-        """Detect tab switching behavior."""
-        if session_id not in self.user_sessions:
+    async def process_event(self, session_id: str, event_type: str,
+                            event_data: Optional[Dict[str, Any]] = None) -> bool:
+        """Record a client anti-cheat event and flag every rule it trips."""
+        session = self._get_session(session_id)
+        if session is None:
             return False
-            
-        session = self.user_sessions[session_id]
-        session["tab_switches"] += 1
-        session["last_activity"] = datetime.utcnow()
         
-        # Flag if more than 3 tab switches in a session
-        if session["tab_switches"] > 3:
-            await self._flag_suspicious_activity(
-                session_id, AntiCheatFlag.TAB_SWITCH, "high", 
-                {"tab_switches": session["tab_switches"]}
-            )
-            return True
-        return False
+        event_data = event_data or {}
+        counter = self.SESSION_COUNTERS.get(event_type)
+        if counter:
+            session[counter] += 1
+        if event_type == "screen_recording":
+            session["screen_recording_detected"] = True
+        
+        triggered = self.rules.evaluate(
+            session["rule_state"], event_type, event_data, time.monotonic()
+        )
+        for rule, value in triggered:
+            metadata = {rule.metadata_key: int(value) if value.is_integer() else value}
+            for key, field in rule.context.items():
+                metadata[key] = event_data.get(field, "unknown")
+            metadata["rule"] = rule.name
+            await self._flag_suspicious_activity(session_id, rule.flag_type, rule.severity, metadata)
+        return bool(triggered)
+    
+    async def detect_tab_switching(self, session_id: str, event_data: Dict[str, Any]) -> bool:
+        """Detect tab switching behavior."""
+        return await self.process_event(session_id, "tab_switch", event_data)
     
     async def detect_copy_paste(self, session_id: str, event_data: Dict[str, Any]) -> bool:
         """Detect copy-paste attempts."""
-        if session_id not in self.user_sessions:
-            return False
-            
-        session = self.user_sessions[session_id]
-        session["copy_paste_attempts"] += 1
-        
-        # Any copy-paste attempt is suspicious
-        await self._flag_suspicious_activity(
-            session_id, AntiCheatFlag.COPY_PASTE, "high",
-            {"attempts": session["copy_paste_attempts"]}
-        )
-        return True
+        return await self.process_event(session_id, "copy_paste", event_data)
     
     async def detect_multiple_windows(self, session_id: str, event_data: Dict[str, Any]) -> bool:
         """Detect multiple browser windows/tabs."""
-        if session_id not in self.user_sessions:
-            return False
-            
-        window_count = event_data.get("window_count", 1)
-        if window_count > 1:
-            await self._flag_suspicious_activity(
-                session_id, AntiCheatFlag.MULTIPLE_WINDOWS, "medium",
-                {"window_count": window_count}
-            )
-            return True
-        return False
+        return await self.process_event(session_id, "multiple_windows", event_data)
     
     async def detect_screen_recording(self, session_id: str, event_data: Dict[str, Any]) -> bool:
         """Detect screen recording software."""
-        if session_id not in self.user_sessions:
-            return False
-            
-        session = self.user_sessions[session_id]
-        session["screen_recording_detected"] = True
-        
-        await self._flag_suspicious_activity(
-            session_id, AntiCheatFlag.SCREEN_RECORDING, "critical",
-            {"recording_software": event_data.get("software", "unknown")}
-        )
-        return True
+        return await self.process_event(session_id, "screen_recording", event_data)
     
     async def analyze_response_timing(self, session_id: str, question_id: str, 
                                     response_time: float, difficulty: str) -> bool:
         """Analyze response timing for suspicious patterns."""
-        if session_id not in self.user_sessions:
+        session = self._get_session(session_id)
+        if session is None:
             return False
             
-        session = self.user_sessions[session_id]
         session["response_times"].append(response_time)
         
-        # Calculate baseline for this user
-        user_id = session["user_id"]
-        if user_id not in self.response_time_baselines:
-            self.response_time_baselines[user_id] = {}
-        
-        baseline_key = f"{question_id}_{difficulty}"
-        if baseline_key not in self.response_time_baselines[user_id]:
-            self.response_time_baselines[user_id][baseline_key] = response_time
-            return False
+        # Score against the question's and the user's timing distributions
+        profile = await self._get_baselines(session["user_id"])
+        result = self.timing.score(profile, f"{question_id}_{difficulty}", response_time)
         
-        baseline = self.response_time_baselines[user_id][baseline_key]
-        
-        # Flag if response is suspiciously fast (less than 25% of baseline)
-        if response_time < baseline * 0.25:
+        if result["suspicious"]:
             await self._flag_suspicious_activity(
-                session_id, AntiCheatFlag.SUSPICIOUS_TIMING, "high",
+                session_id, AntiCheatFlag.SUSPICIOUS_TIMING,
+                "high" if result["z_user"] is not None else "medium",
                 {
+                    "question_id": question_id,
                     "response_time": response_time,
-                    "baseline": baseline,
-                    "ratio": response_time / baseline
+                    "z_question": round(result["z_question"], 2),
+                    "z_user": round(result["z_user"], 2) if result["z_user"] is not None else None,
+                    "question_samples": result["question_samples"]
                 }
             )
             return True
-        
-        # Update baseline with weighted average
-        self.response_time_baselines[user_id][baseline_key] = (
-            baseline * 0.7 + response_time * 0.3
-        )
         return False
     
-    async def analyze_answer_patterns(self, session_id: str, answers: List[str]) -> bool:
-        """Analyze answer patterns for suspicious behavior."""
-        if session_id not in self.user_sessions:
+    async def analyze_answer_patterns(self, session_id: str, answer: str,
+                                      opponent_answer: Optional[str] = None,
+                                      since_question: Optional[float] = None) -> bool:
+        """Analyze one answer for repeat, alternation, collusion and pre-render patterns."""
+        session = self._get_session(session_id)
+        if session is None:
             return False
             
-        session = self.user_sessions[session_id]
-        session["answer_patterns"].extend(answers)
-        
-        # Check for patterns like all same letter answers
-        if len(answers) >= 3:
-            if all(answer.upper() == answers[0].upper() for answer in answers):
-                await self._flag_suspicious_activity(
-                    session_id, AntiCheatFlag.ANSWER_PATTERN, "medium",
-                    {"pattern": "all_same_letter", "answers": answers}
-                )
-                return True
-            
-            # Check for alternating patterns
-            if len(answers) >= 4:
-                alternating = all(
-                    answers[i] != answers[i+1] for i in range(len(answers)-1)
-                )
-                if alternating:
-                    await self._flag_suspicious_activity(
-                        session_id, AntiCheatFlag.ANSWER_PATTERN, "medium",
-                        {"pattern": "alternating", "answers": answers}
-                    )
-                    return True
-        
-        return False
+        detected = session["answer_patterns"].update(answer, opponent_answer, since_question)
+        for pattern, severity, metadata in detected:
+            await self._flag_suspicious_activity(
+                session_id, AntiCheatFlag.ANSWER_PATTERN, severity,
+                {"pattern": pattern, **metadata}
+            )
+        return bool(detected)
     
     async def analyze_pause_patterns(self, session_id: str, pause_duration: float) -> bool:
         """Analyze pause patterns for suspicious behavior."""
-        if session_id not in self.user_sessions:
+        session = self._get_session(session_id)
+        if session is None:
             return False
             
-        session = self.user_sessions[session_id]
         session["pause_analysis"].append(pause_duration)
-        
-        # Flag unusually long pauses (might indicate external consultation)
-        if pause_duration > 300:  # 5 minutes
-            await self._flag_suspicious_activity(
-                session_id, AntiCheatFlag.PAUSE_ANALYSIS, "medium",
-                {"pause_duration": pause_duration}
-            )
-            return True
-        
-        return False
+        return await self.process_event(session_id, "pause", {"pause_duration": pause_duration})
     
-    async def verify_device_fingerprint(self, session_id: str, current_fingerprint: str) -> bool:
-        """Verify device fingerprint consistency."""
-        if session_id not in self.user_sessions:
+    async def verify_device_fingerprint(self, session_id: str,
+                                        current_fingerprint: Union[str, Dict[str, Any]]) -> bool:
+        """Verify device fingerprint consistency against the session's digest."""
+        session = self._get_session(session_id)
+        if session is None or not current_fingerprint:
             return False
             
-        session = self.user_sessions[session_id]
-        stored_fingerprint = session.get("device_fingerprint")
+        current = fingerprint_service.digest(current_fingerprint)
+        stored = session.get("device_fingerprint")
+        
+        # The first fingerprint a session reports becomes its device
+        if stored is None:
+            session["device_fingerprint"] = current
+            await self._remember_device(session["user_id"], current)
+            return False
         
-        if stored_fingerprint and stored_fingerprint != current_fingerprint:
+        if not fingerprint_service.matches(stored, current):
             await self._flag_suspicious_activity(
                 session_id, AntiCheatFlag.DEVICE_FINGERPRINT, "high",
                 {
-                    "stored": stored_fingerprint,
-                    "current": current_fingerprint
+                    "stored": stored.hex(),
+                    "current": current.hex()
                 }
             )
             return True
@@ -221,10 +230,10 @@ class AntiCheatDetector:
     
     async def verify_ip_address(self, session_id: str, current_ip: str) -> bool:
         """Verify IP address consistency."""
-        if session_id not in self.user_sessions:
+        session = self._get_session(session_id)
+        if session is None:
             return False
             
-        session = self.user_sessions[session_id]
         stored_ip = session.get("ip_address")
         
         if stored_ip and stored_ip != current_ip:
@@ -239,18 +248,31 @@ class AntiCheatDetector:
         
         return False
     
+    async def check_shared_identity(self, session_id: str, user_id: str,
+                                    opponent: str, stage: str) -> bool:
+        """Flag a matched pair of accounts seen on the same device or IP."""
+        shared = self.collisions.shared(user_id, opponent)
+        if "fingerprint" not in shared and "ip" not in shared:
+            return False
+        
+        await self._flag_suspicious_activity(
+            session_id, AntiCheatFlag.MULTI_ACCOUNT,
+            "high" if "fingerprint" in shared else "medium",
+            {"opponent": opponent, "shared": sorted(shared), "stage": stage}
+        )
+        return True
+    
     async def _flag_suspicious_activity(self, session_id: str, flag_type: AntiCheatFlag, 
                                       severity: str, metadata: Dict[str, Any]) -> None:
         """Flag suspicious activity and create event."""
-        if session_id not in self.user_sessions:
+        session = self._get_session(session_id)
+        if session is None:
             return
             
-        session = self.user_sessions[session_id]
         user_id = session["user_id"]
         
         # Increase suspicious score
-        severity_scores = {"low": 1, "medium": 3, "high": 5, "critical": 10}
-        session["suspicious_score"] += severity_scores.get(severity, 1)
+        session["suspicious_score"] += SEVERITY_SCORES.get(severity, 1)
         
         # Create anti-cheat event
         event = AntiCheatEvent(
@@ -264,25 +286,166 @@ class AntiCheatDetector:
             user_agent=session.get("user_agent")
         )
         
-        self.suspicious_activities[user_id].append(event)
+        # Recent events stay in memory; persistence is queued without waiting
+        recent = self.suspicious_activities.get(user_id)
+        if recent is None:
+            recent = deque(maxlen=self.RECENT_EVENTS_PER_USER)
+            self.suspicious_activities.set(user_id, recent)
+        recent.append(event)
+        document = event.dict()
+        document["flag_type"] = event.flag_type.value
+        self.event_writer.submit_nowait(document)
         
         logger.warning(f"Anti-cheat flag: {flag_type} for user {user_id} in session {session_id}")
     
     async def get_suspicious_activities(self, user_id: str) -> List[AntiCheatEvent]:
-        """Get all suspicious activities for a user."""
-        return self.suspicious_activities.get(user_id, [])
+        """Get recent suspicious activities for a user."""
+        return list(self.suspicious_activities.get(user_id) or [])
     
     async def get_session_suspicious_score(self, session_id: str) -> int:
         """Get suspicious score for a session."""
-        if session_id not in self.user_sessions:
-            return 0
-        return self.user_sessions[session_id]["suspicious_score"]
+        session = self.user_sessions.get(session_id)
+        return session["suspicious_score"] if session else 0
+    
+    def owned_session(self, user_id: str, session_id: Optional[str]) -> str:
+        """session_id if it is a live session of user_id, otherwise the user's connection session.
+
+        Client messages name their session; one naming another user's session
+        must not move that user's score or flags.
+        """
+        session = self.user_sessions.get(session_id) if session_id else None
+        if session is not None and session["user_id"] == user_id:
+            return session_id
+        return f"session_{user_id}"
+    
+    def is_session_banned(self, session_id: str) -> bool:
+        """Whether a session has accumulated enough flags to be refused; no I/O, safe to call inline."""
+        session = self.user_sessions.get(session_id)
+        return (self.BAN_SCORE is not None and session is not None
+                and session["suspicious_score"] >= self.BAN_SCORE)
+    
+    async def open_connection(self, user_id: str, session_id: str,
+                              ip_address: str, user_agent: str) -> None:
+        """Count a connection, initializing the session on the first one."""
+        count = self.connections.get(session_id, 0)
+        self.connections[session_id] = count + 1
+        if count == 0 or self.user_sessions.get(session_id) is None:
+            await self.initialize_user_session(user_id, session_id, ip_address, user_agent)
+    
+    async def close_connection(self, session_id: str) -> bool:
+        """Drop a connection; the session is cleaned up with the last one, returning True."""
+        count = self.connections.get(session_id, 0) - 1
+        if count > 0:
+            self.connections[session_id] = count
+            return False
+        self.connections.pop(session_id, None)
+        await self.cleanup_session(session_id)
+        return True
     
     async def cleanup_session(self, session_id: str) -> None:
         """Clean up session data."""
-        if session_id in self.user_sessions:
-            del self.user_sessions[session_id]
+        if self.user_sessions.pop(session_id) is not None:
             logger.info(f"Cleaned up anti-cheat session {session_id}")
+    
+    def sweep(self) -> Dict[str, int]:
+        """Drop idle state; returns evictions per structure."""
+        return {name: cache.expire() for name, cache in self._state_caches().items()}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Sizes of the in-memory detector state."""
+        stats = {name: len(cache) for name, cache in self._state_caches().items()}
+        stats["pending_baseline_spills"] = len(self._pending_spills)
+        stats["identity_index"] = self.collisions.get_stats()
+        stats["fingerprint_cache"] = fingerprint_service.get_stats()
+        return stats
+    
+    async def flush_baselines(self, include_live: bool = False) -> None:
+        """Write spilled (and optionally all in-memory) timing profiles to Mongo."""
+        spills, self._pending_spills = self._pending_spills, {}
+        if include_live:
+            spills.update(self.response_time_baselines.items())
+        if not spills:
+            return
+        
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"user_id": user_id},
+                {"$set": {"timing": profile.to_list(), "updated_at": now}},
+                upsert=True
+            )
+            for user_id, profile in spills.items()
+        ]
+        try:
+            await db.response_baselines.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to spill response time baselines: {e}")
+            # Retry on the next sweep, without letting the backlog grow unbounded
+            for user_id, profile in spills.items():
+                if len(self._pending_spills) >= self.MAX_BASELINE_USERS:
+                    break
+                self._pending_spills.setdefault(user_id, profile)
+    
+    async def run_periodic_cleanup(self) -> None:
+        """Expire idle state and spill evicted timing profiles in the background."""
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            try:
+                evicted = self.sweep()
+                await self.flush_baselines()
+                await self.timing.persist()
+                if any(evicted.values()):
+                    logger.info(f"Anti-cheat sweep evicted {evicted}")
+            except Exception as e:
+                logger.error(f"Anti-cheat cleanup failed: {e}")
+    
+    async def _remember_device(self, user_id: str, digest: bytes) -> None:
+        """Track a user's latest device, also on the user document so identity links can be rebuilt."""
+        self.device_fingerprints.set(user_id, digest)
+        self.collisions.record(user_id, fingerprint=digest.hex())
+        try:
+            await db.users.update_one({"username": user_id}, {"$set": {"device_fingerprint": digest.hex()}})
+        except Exception as e:
+            logger.error(f"Failed to store device fingerprint for {user_id}: {e}")
+    
+    def _get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Live session state, refreshing its idle timer."""
+        session = self.user_sessions.get(session_id)
+        if session is not None:
+            session["last_activity"] = datetime.utcnow()
+        return session
+    
+    async def _get_baselines(self, user_id: str) -> RunningStats:
+        """A user's timing profile, reloaded from Mongo after eviction."""
+        profile = self.response_time_baselines.get(user_id)
+        if profile is not None:
+            return profile
+        
+        profile = self._pending_spills.pop(user_id, None)
+        if profile is None:
+            profile = RunningStats()
+            try:
+                doc = await db.response_baselines.find_one({"user_id": user_id})
+                if doc and doc.get("timing"):
+                    profile = RunningStats.from_list(doc["timing"])
+            except Exception as e:
+                logger.error(f"Failed to load timing profile for {user_id}: {e}")
+        
+        self.response_time_baselines.set(user_id, profile)
+        return profile
+    
+    def _queue_baseline_spill(self, user_id: str, profile: RunningStats) -> None:
+        if profile.n:
+            self._pending_spills[user_id] = profile
+    
+    def _state_caches(self) -> Dict[str, LRUCache]:
+        return {
+            "user_sessions": self.user_sessions,
+            "suspicious_activities": self.suspicious_activities,
+            "device_fingerprints": self.device_fingerprints,
+            "ip_addresses": self.ip_addresses,
+            "response_time_baselines": self.response_time_baselines
+        }
 
 # Global anti-cheat detector instance
 anti_cheat_detector = AntiCheatDetector()
@@ -0,0 +1,104 @@
+# anti_cheat/fingerprint.py
+
+import hashlib
+import hmac
+import json
+import re
+from typing import Dict, Any, Callable, Optional
+
+from cache import LRUCache
+
+DIGEST_SIZE = 16  # bytes
+DIGEST_PERSON = b"mindmaze-device"
+
+_VERSION_DETAIL = re.compile(r"(\d+)(?:\.\d+)+")
+
+def _coarse_user_agent(value: Any) -> str:
+    # Keep major versions only, so routine browser updates don't change the device
+    return _VERSION_DETAIL.sub(r"\1", str(value)).strip()
+
+def _lower(value: Any) -> str:
+    return str(value).strip().lower()
+
+def _screen(value: Any) -> str:
+    # Orientation changes swap width and height
+    dimensions = sorted(re.findall(r"\d+", str(value)), key=int, reverse=True)
+    return "x".join(dimensions) if dimensions else _lower(value)
+
+def _blob(value: Any) -> str:
+    # Canvas data URLs run to kilobytes; only their hash goes into the canonical form
+    return hashlib.blake2b(str(value).encode("utf-8"), digest_size=DIGEST_SIZE).hexdigest()
+
+# Fields that identify a device, and how each is canonicalized; others are ignored
+FINGERPRINT_FIELDS: Dict[str, Callable[[Any], str]] = {
+    "user_agent": _coarse_user_agent,
+    "language": _lower,
+    "platform": _lower,
+    "screen_resolution": _screen,
+    "timezone": str,
+    "canvas_fingerprint": _blob,
+    "webgl_fingerprint": _lower
+}
+
+def canonicalize(data: Dict[str, Any]) -> str:
+    """Stable JSON form of a fingerprint payload: known fields, coarsened, sorted keys."""
+    canonical = {
+        field: normalize(data[field]) for field, normalize in FINGERPRINT_FIELDS.items()
+        if data.get(field) not in (None, "")
+    }
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+
+class FingerprintService:
+    """Turns client fingerprint payloads into 16-byte BLAKE2b device digests.
+
+    Raw payload strings are memoized in an LRU, so re-verifying a device
+    that sent the same payload before is a single dictionary lookup.
+    """
+
+    CACHE_SIZE = 10000
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.cache = LRUCache(cache_size)
+
+    def digest(self, payload: Any) -> bytes:
+        """Device digest for a payload given as a JSON string or an already parsed dict.
+
+        Other JSON values (lists, numbers) are hashed as opaque identifiers
+        in their sorted-key JSON form; only strings go through the cache.
+        """
+        if isinstance(payload, dict):
+            return self._hash(canonicalize(payload))
+        if not isinstance(payload, str):
+            return self._hash(json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str))
+
+        cached = self.cache.get(payload)
+        if cached is not None:
+            return cached
+
+        try:
+            data = json.loads(payload)
+        except (TypeError, ValueError):
+            data = None
+        # Anything that isn't a JSON object is treated as an opaque identifier
+        digest = self._hash(canonicalize(data) if isinstance(data, dict) else str(payload))
+        self.cache.set(payload, digest)
+        return digest
+
+    def hexdigest(self, payload: Any) -> str:
+        return self.digest(payload).hex()
+
+    @staticmethod
+    def matches(stored: Optional[bytes], current: Optional[bytes]) -> bool:
+        return stored is not None and current is not None and hmac.compare_digest(stored, current)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.cache.get_stats()
+
+    @staticmethod
+    def _hash(canonical: str) -> bytes:
+        return hashlib.blake2b(
+            canonical.encode("utf-8"), digest_size=DIGEST_SIZE, person=DIGEST_PERSON
+        ).digest()
+
+# Global fingerprint service instance
+fingerprint_service = FingerprintService()
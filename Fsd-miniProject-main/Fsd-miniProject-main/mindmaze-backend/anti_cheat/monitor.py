@@ -3,11 +3,12 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 import json
 
 from models import AntiCheatFlag, AntiCheatEvent
 from anti_cheat.detector import anti_cheat_detector
+from anti_cheat.fingerprint import fingerprint_service
 
 logger = logging.getLogger(__name__)
 
@@ -254,13 +255,9 @@ class BrowserLockdown:
         """
     
     @staticmethod
-    def generate_device_fingerprint() -> str:
-        """Generate device fingerprint hash from provided data."""
-        import hashlib
-        
-        # This would be called with data from the frontend
-        # For now, return a placeholder
-        return "device_fingerprint_placeholder"
+    def generate_device_fingerprint(fingerprint_data: Union[str, Dict[str, Any]]) -> str:
+        """Device fingerprint hash (hex BLAKE2b) of the data sent by the fingerprint script."""
+        return fingerprint_service.hexdigest(fingerprint_data)
 
 # Global monitor instance
 real_time_monitor = RealTimeMonitor()
@@ -0,0 +1,64 @@
+# anti_cheat/patterns.py
+
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple
+
+class AnswerPatternTracker:
+    """Incremental answer-pattern detectors over a session's recent answers.
+
+    Every detector keeps a run length or a rolling-window counter, so each
+    answer is an O(1) update however long the session runs. A pattern is
+    reported once when it is reached, not again on every later answer.
+    """
+
+    WINDOW_SIZE = 10  # answers the rolling counters cover
+    REPEAT_RUN = 3  # same answer to this many questions in a row
+    ALTERNATION_RUN = 4  # A, B, A, B ...
+    OPPONENT_MATCHES = 2  # wrong answers identical to the opponent's within the window
+    MIN_RENDER_SECONDS = 0.3  # answers sooner than this after the question was sent
+
+    __slots__ = ("recent", "repeat_run", "alternation_run", "window", "opponent_matches")
+
+    def __init__(self):
+        self.recent: deque = deque(maxlen=2)  # last two normalized answers
+        self.repeat_run = 0
+        self.alternation_run = 0
+        self.window: deque = deque()  # opponent-match bits, oldest first
+        self.opponent_matches = 0
+
+    def update(self, answer: str, opponent_answer: Optional[str] = None,
+               since_question: Optional[float] = None) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Account for one answer; returns (pattern, severity, metadata) for patterns it completes."""
+        answer = answer.strip().lower()
+        previous = self.recent[-1] if self.recent else None
+        before_previous = self.recent[0] if len(self.recent) == 2 else None
+        detected = []
+
+        self.repeat_run = self.repeat_run + 1 if answer == previous else 1
+        if self.repeat_run == self.REPEAT_RUN:
+            detected.append(("repeated_answer", "medium", {"answer": answer, "run": self.repeat_run}))
+
+        if previous is not None and answer != previous and answer == before_previous:
+            self.alternation_run += 1
+        elif previous is not None and answer != previous:
+            self.alternation_run = 2
+        else:
+            self.alternation_run = 1
+        if self.alternation_run == self.ALTERNATION_RUN:
+            detected.append(("alternating", "medium", {"answers": [previous, answer]}))
+
+        matched = opponent_answer is not None and answer == opponent_answer.strip().lower()
+        self.window.append(matched)
+        self.opponent_matches += matched
+        if len(self.window) > self.WINDOW_SIZE:
+            self.opponent_matches -= self.window.popleft()
+        if matched and self.opponent_matches == self.OPPONENT_MATCHES:
+            detected.append(("identical_to_opponent", "high",
+                             {"matches": self.opponent_matches, "window": len(self.window)}))
+
+        if since_question is not None and since_question < self.MIN_RENDER_SECONDS:
+            detected.append(("answered_before_render", "high",
+                             {"seconds_after_question": round(since_question, 3)}))
+
+        self.recent.append(answer)
+        return detected
@@ -0,0 +1,162 @@
+# anti_cheat/pipeline.py
+
+import asyncio
+import logging
+import zlib
+from typing import Dict, List, Any, Awaitable, Callable, Optional
+
+from anti_cheat.detector import anti_cheat_detector
+from anti_cheat.timing import P2Quantile
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()  # queued in place of an answer to drop a connection
+
+class DetectorPipeline:
+    """Answer telemetry queue drained by a pool of detector workers.
+
+    Answers are analyzed after they are scored instead of before. Each
+    worker owns one queue and telemetry is sharded by username, so a
+    user's answers (and their session and timing baseline updates) are
+    analyzed one at a time in submission order, exactly as they were
+    inline. Lag is the time from publish to the start of analysis.
+
+    Disconnects go through the same shard, so a session is only cleaned
+    up after the answers published before it are analyzed.
+    """
+
+    WORKERS = 4
+    MAX_QUEUE_SIZE = 10000  # per worker; publishers wait when a shard is full
+    LAG_QUANTILES = (0.5, 0.95, 0.99)
+    DRAIN_TIMEOUT = 10.0  # seconds allowed on shutdown to finish queued telemetry
+
+    def __init__(self, workers: int = WORKERS, max_queue_size: int = MAX_QUEUE_SIZE):
+        self.detector = anti_cheat_detector
+        self.shards: List[asyncio.Queue] = [asyncio.Queue(maxsize=max_queue_size) for _ in range(workers)]
+        self._tasks: List[asyncio.Task] = []
+
+        # Counters
+        self.published = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocked = 0  # publishes that had to wait for room
+        self.lag_quantiles = [P2Quantile(q) for q in self.LAG_QUANTILES]
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    def start(self) -> None:
+        """Start one worker per shard."""
+        if self.running():
+            return
+        self._tasks = [asyncio.create_task(self._run(shard)) for shard in self.shards]
+        logger.info(f"Started {len(self._tasks)} anti-cheat detector workers")
+
+    async def stop(self) -> None:
+        """Analyze what is still queued, then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.join() for shard in self.shards)), self.DRAIN_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Anti-cheat pipeline stopped with {self.pending()} answers unanalyzed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped anti-cheat detector workers")
+
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def publish(self, username: str, session_id: str, answer: str,
+                      response_time: Any, context: Dict[str, Any]) -> None:
+        """Queue one answer for analysis; only waits if the user's shard is full."""
+        await self._put(username, (asyncio.get_running_loop().time(), session_id, answer, response_time, context))
+        self.published += 1
+
+    async def close_connection(self, username: str, session_id: str,
+                               on_closed: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        """Drop a connection once the user's queued answers are analyzed.
+
+        on_closed runs if it was the session's last connection. Without
+        running workers the connection is dropped right away.
+        """
+        if not self.running():
+            await self._close(session_id, on_closed)
+            return
+        await self._put(username, (asyncio.get_running_loop().time(), session_id, _CLOSE, None, on_closed))
+
+    async def _put(self, username: str, item: tuple) -> None:
+        shard = self.shards[zlib.crc32(username.encode("utf-8")) % len(self.shards)]
+        try:
+            shard.put_nowait(item)
+        except asyncio.QueueFull:
+            # Dropping telemetry would change detection results, so apply backpressure
+            self.blocked += 1
+            await shard.put(item)
+
+    def pending(self) -> int:
+        return sum(shard.qsize() for shard in self.shards)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, throughput and detector lag (seconds) for monitoring."""
+        lag = {
+            f"p{int(q * 100)}": round(estimator.value(), 4) if estimator.value() is not None else None
+            for q, estimator in zip(self.LAG_QUANTILES, self.lag_quantiles)
+        }
+        lag["max"] = round(self.max_lag, 4)
+        lag["last"] = round(self.last_lag, 4)
+        return {
+            "workers": len(self.shards),
+            "running": sum(1 for task in self._tasks if not task.done()),
+            "pending": self.pending(),
+            "pending_per_worker": [shard.qsize() for shard in self.shards],
+            "published": self.published,
+            "processed": self.processed,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "lag_seconds": lag
+        }
+
+    async def _run(self, shard: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await shard.get()
+            try:
+                if item[2] is _CLOSE:
+                    await self._close(item[1], item[4])
+                    continue
+                self._record_lag(loop.time() - item[0])
+                await self._analyze(*item[1:])
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Anti-cheat analysis failed for session {item[1]}: {e}")
+            finally:
+                shard.task_done()
+
+    async def _close(self, session_id: str, on_closed: Optional[Callable[[], Awaitable[None]]]) -> None:
+        if await self.detector.close_connection(session_id) and on_closed:
+            await on_closed()
+
+    async def _analyze(self, session_id: str, answer: str, response_time: Any,
+                       context: Dict[str, Any]) -> None:
+        # Same calls, arguments and order as the former inline analysis
+        if isinstance(response_time, (int, float)) and response_time > 0:
+            await self.detector.analyze_response_timing(
+                session_id, context["question_id"], response_time, context["category"]
+            )
+        await self.detector.analyze_answer_patterns(
+            session_id, answer, context["opponent_answer"], context["since_question"]
+        )
+
+    def _record_lag(self, lag: float) -> None:
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        for estimator in self.lag_quantiles:
+            estimator.update(lag)
+
+# Global detector pipeline instance
+detector_pipeline = DetectorPipeline()
@@ -0,0 +1,116 @@
+# anti_cheat/pipeline_eval.py
+
+import argparse
+import asyncio
+import logging
+import random
+from collections import Counter
+from typing import Dict, List, Any, Tuple
+
+from anti_cheat.detector import AntiCheatDetector
+from anti_cheat.pipeline import DetectorPipeline
+
+ANSWERS = ["paris", "london", "rome", "berlin"]
+
+def simulate(users: int, answers_per_user: int, seed: int = 7) -> Dict[str, List[Tuple[str, Dict[str, Any]]]]:
+    """Per-user answers with a context, drawn so repeat, alternation, opponent and render patterns occur.
+
+    Response times are left out, so analysis never needs a stored timing baseline.
+    """
+    rng = random.Random(seed)
+    sessions = {}
+    for index in range(users):
+        answers = []
+        for _ in range(answers_per_user):
+            answer = rng.choice(ANSWERS[:rng.choice([1, 2, 4])])
+            answers.append((answer, {
+                "question_id": f"q_{rng.randrange(50)}",
+                "category": "geography",
+                "opponent_answer": rng.choice(ANSWERS) if rng.random() < 0.5 else None,
+                "since_question": rng.uniform(0.0, 0.5) if rng.random() < 0.2 else rng.uniform(2.0, 20.0)
+            }))
+        sessions[f"user_{index}"] = answers
+    return sessions
+
+def written_flags(detector: AntiCheatDetector) -> Counter:
+    """Flags queued for persistence, per (session, pattern)."""
+    flags = Counter()
+    while not detector.event_writer.queue.empty():
+        document = detector.event_writer.queue.get_nowait()
+        flags[(document["session_id"], document["metadata"]["pattern"])] += 1
+    return flags
+
+async def inline(sessions: Dict[str, List[Tuple[str, Dict[str, Any]]]]) -> Counter:
+    """Reference: analysis awaited before each answer, as before the pipeline."""
+    detector = AntiCheatDetector()
+    for username, answers in sessions.items():
+        await detector.open_connection(username, f"session_{username}", "127.0.0.1", "eval")
+        for answer, context in answers:
+            await detector.analyze_answer_patterns(
+                f"session_{username}", answer, context["opponent_answer"], context["since_question"]
+            )
+        await detector.close_connection(f"session_{username}")
+    return written_flags(detector)
+
+async def disconnect_after_answers(sessions: Dict[str, List[Tuple[str, Dict[str, Any]]]],
+                                   queued_close: bool) -> Tuple[Counter, AntiCheatDetector, List[str]]:
+    """Every user answers and disconnects while their answers are still queued."""
+    detector = AntiCheatDetector()
+    pipeline = DetectorPipeline(workers=4)
+    pipeline.detector = detector
+    pipeline.start()
+    closed: List[str] = []
+
+    async def on_closed(username: str) -> None:
+        closed.append(username)
+
+    for username, answers in sessions.items():
+        await detector.open_connection(username, f"session_{username}", "127.0.0.1", "eval")
+        for answer, context in answers:
+            await pipeline.publish(username, f"session_{username}", answer, 0, context)
+        if queued_close:
+            await pipeline.close_connection(username, f"session_{username}",
+                                            lambda username=username: on_closed(username))
+        elif await detector.close_connection(f"session_{username}"):
+            # What the WebSocket handler did before: clean up straight away
+            await on_closed(username)
+    await pipeline.stop()
+    return written_flags(detector), detector, closed
+
+async def reconnect_keeps_session() -> bool:
+    """A second tab opened before the first tab's close is processed keeps the session."""
+    detector = AntiCheatDetector()
+    pipeline = DetectorPipeline(workers=1)
+    pipeline.detector = detector
+    pipeline.start()
+    await detector.open_connection("user_0", "session_user_0", "127.0.0.1", "eval")
+    await pipeline.close_connection("user_0", "session_user_0")
+    await detector.open_connection("user_0", "session_user_0", "127.0.0.1", "eval")
+    await pipeline.stop()
+    return detector.user_sessions.get("session_user_0") is not None
+
+async def run(users: int, answers_per_user: int, seed: int) -> None:
+    sessions = simulate(users, answers_per_user, seed)
+    expected = await inline(sessions)
+    queued, detector, closed = await disconnect_after_answers(sessions, queued_close=True)
+    direct, _, _ = await disconnect_after_answers(sessions, queued_close=False)
+
+    print(f"inline flags {sum(expected.values())}, "
+          f"queued close {sum(queued.values())}, immediate close {sum(direct.values())}")
+    assert queued == expected, "flags differ from inline analysis"
+    assert sorted(closed) == sorted(sessions), "on_closed did not run once per user"
+    assert len(detector.user_sessions) == 0 and not detector.connections, "sessions left behind"
+    assert await reconnect_keeps_session(), "session dropped while a second tab was open"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that answers published before a disconnect are still analyzed")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--answers", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)  # one warning per flag otherwise
+    asyncio.run(run(args.users, args.answers, args.seed))
+
+if __name__ == "__main__":
+    main()
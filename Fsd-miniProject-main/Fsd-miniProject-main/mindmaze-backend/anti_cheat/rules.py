@@ -0,0 +1,181 @@
+# anti_cheat/rules.py
+
+import logging
+import operator
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple, Union
+
+from models import AntiCheatRule, AntiCheatFlag
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COMPARISONS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+MAX_WINDOW_EVENTS = 1000  # events a windowed aggregate keeps per session
+
+# The detector's built-in thresholds, expressed as rules
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {
+        "name": "tab_switches", "event_type": "tab_switch", "aggregate": "count",
+        "comparison": ">", "threshold": 3, "severity": "high",
+        "flag_type": AntiCheatFlag.TAB_SWITCH, "metadata_key": "tab_switches"
+    },
+    {
+        "name": "copy_paste", "event_type": "copy_paste", "aggregate": "count",
+        "comparison": ">=", "threshold": 1, "severity": "high",
+        "flag_type": AntiCheatFlag.COPY_PASTE, "metadata_key": "attempts"
+    },
+    {
+        "name": "multiple_windows", "event_type": "multiple_windows", "aggregate": "last",
+        "field": "window_count", "comparison": ">", "threshold": 1, "severity": "medium",
+        "flag_type": AntiCheatFlag.MULTIPLE_WINDOWS, "metadata_key": "window_count"
+    },
+    {
+        "name": "screen_recording", "event_type": "screen_recording", "aggregate": "count",
+        "comparison": ">=", "threshold": 1, "severity": "critical",
+        "flag_type": AntiCheatFlag.SCREEN_RECORDING, "metadata_key": "detections",
+        "context": {"recording_software": "software"}
+    },
+    {
+        "name": "long_pause", "event_type": "pause", "aggregate": "last",
+        "field": "pause_duration", "comparison": ">", "threshold": 300, "severity": "medium",
+        "flag_type": AntiCheatFlag.PAUSE_ANALYSIS, "metadata_key": "pause_duration"
+    }
+]
+
+class RuleAggregate:
+    """Running aggregate of one rule for one session, O(1) amortized per event.
+
+    Without a window it keeps session totals; with one it keeps the
+    events inside the window plus a running sum and a monotonic deque
+    for the maximum.
+    """
+
+    __slots__ = ("signature", "window", "count", "total", "peak", "last", "events", "peaks")
+
+    def __init__(self, rule: AntiCheatRule):
+        self.signature = _signature(rule)
+        self.window = rule.window
+        self.count = 0
+        self.total = 0.0
+        self.peak: Optional[float] = None
+        self.last: Optional[float] = None
+        self.events: deque = deque()  # (time, value) inside the window
+        self.peaks: deque = deque()  # (time, value) with decreasing values
+
+    def add(self, now: float, value: float) -> None:
+        self.last = value
+        if self.window is None:
+            self.count += 1
+            self.total += value
+            self.peak = value if self.peak is None else max(self.peak, value)
+            return
+
+        self.events.append((now, value))
+        self.total += value
+        while self.peaks and self.peaks[-1][1] <= value:
+            self.peaks.pop()
+        self.peaks.append((now, value))
+
+        cutoff = now - self.window
+        while self.events and (self.events[0][0] < cutoff or len(self.events) > MAX_WINDOW_EVENTS):
+            _, expired = self.events.popleft()
+            self.total -= expired
+        oldest = self.events[0][0]
+        while self.peaks[0][0] < oldest:
+            self.peaks.popleft()
+
+    def value(self, aggregate: str) -> float:
+        if aggregate == "count":
+            return float(len(self.events) if self.window is not None else self.count)
+        if aggregate == "sum":
+            return self.total
+        if aggregate == "max":
+            return self.peaks[0][1] if self.window is not None else self.peak
+        return self.last
+
+def _signature(rule: AntiCheatRule) -> Tuple[str, Optional[str], Optional[float]]:
+    # State survives a reload unless what it aggregates changed
+    return rule.aggregate, rule.field, rule.window
+
+class RuleEngine:
+    """Declarative anti-cheat rules compiled into a per-event-type dispatch table.
+
+    Each rule names an event type, an aggregate of that event over an
+    optional time window, a threshold and a severity. Evaluating an
+    event only touches the rules registered for its type. Rules live in
+    db.anti_cheat_rules and fall back to DEFAULT_RULES; reloading swaps
+    the whole table at once.
+    """
+
+    def __init__(self, rules: Optional[List[Union[Dict[str, Any], AntiCheatRule]]] = None):
+        self.rules: List[AntiCheatRule] = []
+        self.dispatch: Dict[str, Tuple[AntiCheatRule, ...]] = {}
+        self.load(rules if rules is not None else DEFAULT_RULES)
+
+    def load(self, rules: List[Union[Dict[str, Any], AntiCheatRule]]) -> None:
+        """Validate and install a rule set; the current set stays if any rule is invalid."""
+        parsed = [rule if isinstance(rule, AntiCheatRule) else AntiCheatRule(**rule) for rule in rules]
+        names = [rule.name for rule in parsed]
+        if len(set(names)) != len(names):
+            raise ValueError("Anti-cheat rule names must be unique")
+        for rule in parsed:
+            if rule.aggregate != "count" and not rule.field:
+                raise ValueError(f"Rule {rule.name} needs a field for aggregate '{rule.aggregate}'")
+
+        dispatch: Dict[str, List[AntiCheatRule]] = {}
+        for rule in parsed:
+            if rule.enabled:
+                dispatch.setdefault(rule.event_type, []).append(rule)
+        self.rules = parsed
+        self.dispatch = {event_type: tuple(group) for event_type, group in dispatch.items()}
+
+    def evaluate(self, state: Dict[str, RuleAggregate], event_type: str,
+                 event_data: Dict[str, Any], now: float) -> List[Tuple[AntiCheatRule, float]]:
+        """Update a session's aggregates with one event; returns the rules it trips."""
+        triggered = []
+        for rule in self.dispatch.get(event_type, ()):
+            if rule.aggregate == "count":
+                value = 1.0
+            else:
+                raw = event_data.get(rule.field)
+                if isinstance(raw, bool) or not isinstance(raw, (int, float)):
+                    continue
+                value = float(raw)
+
+            aggregate = state.get(rule.name)
+            if aggregate is None or aggregate.signature != _signature(rule):
+                aggregate = RuleAggregate(rule)
+                state[rule.name] = aggregate
+            aggregate.add(now, value)
+
+            current = aggregate.value(rule.aggregate)
+            if COMPARISONS[rule.comparison](current, rule.threshold):
+                triggered.append((rule, current))
+        return triggered
+
+    def get_rules(self) -> List[Dict[str, Any]]:
+        return [rule.dict() for rule in self.rules]
+
+    async def reload(self) -> None:
+        """Install the rules stored in Mongo, or the defaults if none are stored."""
+        try:
+            stored = await db.anti_cheat_rules.find({}, {"_id": 0}).to_list(None)
+            self.load(stored or DEFAULT_RULES)
+            logger.info(f"Loaded {len(self.rules)} anti-cheat rules")
+        except Exception as e:
+            logger.error(f"Failed to reload anti-cheat rules, keeping current set: {e}")
+
+    async def save(self, rules: List[Dict[str, Any]]) -> None:
+        """Validate, store and install a new rule set."""
+        candidate = RuleEngine(rules)
+        documents = [rule.dict() for rule in candidate.rules]
+        for document in documents:
+            document["flag_type"] = document["flag_type"].value
+        await db.anti_cheat_rules.delete_many({})
+        if documents:
+            await db.anti_cheat_rules.insert_many(documents)
+        self.load(candidate.rules)
+
+# Global rule engine instance
+rule_engine = RuleEngine()
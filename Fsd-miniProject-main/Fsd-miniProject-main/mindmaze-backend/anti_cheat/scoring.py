@@ -0,0 +1,200 @@
+# anti_cheat/scoring.py
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from itertools import chain
+from typing import Dict, List, Any, Iterable, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Packed per-session features, in column order
+FEATURES = (
+    "tab_switches",
+    "copy_paste_attempts",
+    "window_focus_loss",
+    "screen_recording",
+    "flag_score",
+    "fast_answer_share",
+    "uniform_timing",
+    "long_pause_share"
+)
+
+# Logistic weights per feature; counts enter as log1p
+FEATURE_WEIGHTS = np.array([0.9, 1.2, 0.5, 2.5, 0.6, 3.0, 1.5, 1.5])
+RISK_BIAS = -4.0  # a session with no signals scores about 2/100
+
+FAST_ANSWER_SECONDS = 1.5
+LONG_PAUSE_SECONDS = 120.0
+MIN_TIMED_ANSWERS = 5  # answers needed before timing features count
+UNIFORM_TIMING_CV = 0.5  # coefficient of variation below which timing looks scripted
+
+# Session counters pack() reads, in column order
+COUNTER_FIELDS = ("tab_switches", "copy_paste_attempts", "window_focus_loss",
+                  "screen_recording_detected", "suspicious_score")
+
+# (session_id, user_id, counters, response_times, pause_analysis)
+SessionRow = Tuple[str, str, Tuple[Any, ...], Tuple[float, ...], Tuple[float, ...]]
+
+def session_row(session_id: str, state: Dict[str, Any]) -> SessionRow:
+    """Copy the fields pack() reads out of live session state.
+
+    Rows hold only tuples of plain values, which the garbage collector
+    stops tracking, so a snapshot of every live session does not set off
+    full collections; tuple() of a deque is a single atomic copy.
+    """
+    return (session_id, state["user_id"],
+            tuple(state.get(field) or 0 for field in COUNTER_FIELDS),
+            tuple(state["response_times"]), tuple(state["pause_analysis"]))
+
+def _ragged_stats(sequences: Sequence[Iterable[float]], n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Flatten per-session value lists into (values, owning row, row lengths)."""
+    lengths = np.fromiter((len(values) for values in sequences), dtype=np.int64, count=n)
+    values = np.fromiter(chain.from_iterable(sequences), dtype=np.float64, count=int(lengths.sum()))
+    owners = np.repeat(np.arange(n), lengths)
+    return values, owners, lengths
+
+class SessionFeatures:
+    """Feature matrix for a batch of sessions, one row per session."""
+
+    def __init__(self, session_ids: List[str], user_ids: List[str], matrix: np.ndarray):
+        self.session_ids = session_ids
+        self.user_ids = user_ids
+        self.matrix = matrix  # shape (sessions, len(FEATURES))
+
+    def __len__(self) -> int:
+        return len(self.session_ids)
+
+    @classmethod
+    def pack(cls, sessions: List[Tuple[str, Dict[str, Any]]]) -> "SessionFeatures":
+        """Pack detector session state; the only per-session Python work is reading fields."""
+        return cls.pack_rows([session_row(session_id, state) for session_id, state in sessions])
+
+    @classmethod
+    def pack_rows(cls, rows: List[SessionRow]) -> "SessionFeatures":
+        """Pack session rows copied by session_row()."""
+        n = len(rows)
+        matrix = np.zeros((n, len(FEATURES)), dtype=np.float64)
+
+        if n:
+            matrix[:, :5] = np.array([row[2] for row in rows], dtype=np.float64)
+        matrix[:, :5] = np.log1p(matrix[:, :5])
+        matrix[:, 3] = matrix[:, 3] > 0
+
+        # Response times: share of very fast answers, and suspiciously even pacing
+        times, owners, counts = _ragged_stats([row[3] for row in rows], n)
+        safe_counts = np.maximum(counts, 1)
+        timed = counts >= MIN_TIMED_ANSWERS
+        fast = np.bincount(owners, weights=times < FAST_ANSWER_SECONDS, minlength=n) / safe_counts
+        means = np.bincount(owners, weights=times, minlength=n) / safe_counts
+        squares = np.bincount(owners, weights=times * times, minlength=n) / safe_counts
+        stds = np.sqrt(np.maximum(squares - means * means, 0.0))
+        cv = np.divide(stds, means, out=np.zeros(n), where=means > 0)
+        matrix[:, 5] = np.where(timed, fast, 0.0)
+        matrix[:, 6] = np.where(timed & (means > 0), np.clip(1 - cv / UNIFORM_TIMING_CV, 0.0, 1.0), 0.0)
+
+        pauses, owners, counts = _ragged_stats([row[4] for row in rows], n)
+        matrix[:, 7] = np.bincount(
+            owners, weights=pauses > LONG_PAUSE_SECONDS, minlength=n
+        ) / np.maximum(counts, 1)
+
+        return cls([row[0] for row in rows], [row[1] for row in rows], matrix)
+
+    @classmethod
+    def concat(cls, parts: List["SessionFeatures"]) -> "SessionFeatures":
+        if not parts:
+            return cls([], [], np.zeros((0, len(FEATURES)), dtype=np.float64))
+        return cls([session_id for part in parts for session_id in part.session_ids],
+                   [user_id for part in parts for user_id in part.user_ids],
+                   np.vstack([part.matrix for part in parts]))
+
+class RiskScorer:
+    """Periodic batch risk scoring of every live anti-cheat session.
+
+    Session state is packed into a feature matrix and scored with one
+    logistic pass, so a tick costs a handful of array operations no
+    matter how many sessions are live. The top_k riskiest sessions are
+    kept for the admin dashboard.
+
+    score_live copies session state on the event loop in short slices and
+    packs and scores the copy in a worker thread. Packing runs in chunks
+    because each np.fromiter call holds the GIL until it returns.
+    """
+
+    SNAPSHOT_CHUNK = 2000  # sessions copied per event loop slice
+    PACK_CHUNK = 2000  # sessions packed per GIL-holding call
+
+    def __init__(self, interval: float = 5.0, top_k: int = 20):
+        self.interval = interval  # seconds
+        self.top_k = top_k
+        self.latest: Dict[str, Any] = {"sessions": 0, "top_sessions": [], "scored_at": None}
+
+    async def snapshot(self, sessions: List[Tuple[str, Dict[str, Any]]]) -> List[SessionRow]:
+        """Copy live session state, yielding to the event loop between chunks."""
+        rows: List[SessionRow] = []
+        for start in range(0, len(sessions), self.SNAPSHOT_CHUNK):
+            rows.extend(session_row(session_id, state)
+                        for session_id, state in sessions[start:start + self.SNAPSHOT_CHUNK])
+            await asyncio.sleep(0)
+        return rows
+
+    async def score_live(self, sessions: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Score live sessions without blocking the event loop on pack/score."""
+        rows = await self.snapshot(sessions)
+        return await asyncio.to_thread(self.score_rows, rows)
+
+    def score(self, features: SessionFeatures) -> np.ndarray:
+        """Risk per session on a 0-100 scale."""
+        logits = features.matrix @ FEATURE_WEIGHTS + RISK_BIAS
+        return 100.0 / (1.0 + np.exp(-logits))
+
+    def score_sessions(self, sessions: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Score all sessions and keep the riskiest ones."""
+        return self.score_rows([session_row(session_id, state) for session_id, state in sessions])
+
+    def score_rows(self, rows: List[SessionRow]) -> Dict[str, Any]:
+        """Score copied session rows and keep the riskiest ones."""
+        started = time.perf_counter()
+        features = SessionFeatures.concat([
+            SessionFeatures.pack_rows(rows[start:start + self.PACK_CHUNK])
+            for start in range(0, len(rows), self.PACK_CHUNK)
+        ])
+        packed = time.perf_counter()
+        scores = self.score(features)
+
+        top = self._top_indices(scores)
+        self.latest = {
+            "sessions": len(features),
+            "top_sessions": [
+                {
+                    "session_id": features.session_ids[i],
+                    "user_id": features.user_ids[i],
+                    "risk_score": round(float(scores[i]), 1),
+                    "features": {name: round(float(value), 3)
+                                 for name, value in zip(FEATURES, features.matrix[i])}
+                }
+                for i in top
+            ],
+            "high_risk_sessions": int(np.count_nonzero(scores >= 50)),
+            "pack_ms": round((packed - started) * 1000, 1),
+            "score_ms": round((time.perf_counter() - packed) * 1000, 1),
+            "scored_at": datetime.utcnow().isoformat()
+        }
+        elapsed = time.perf_counter() - started
+        if elapsed > self.interval / 2:
+            logger.warning(f"Risk scoring of {len(features)} sessions took {elapsed:.2f}s")
+        return self.latest
+
+    def _top_indices(self, scores: np.ndarray) -> List[int]:
+        k = min(self.top_k, len(scores))
+        if k == 0:
+            return []
+        # Partial selection first, then sort only the k winners
+        candidates = np.argpartition(scores, len(scores) - k)[-k:]
+        return [int(i) for i in candidates[np.argsort(scores[candidates])[::-1]]]
+
+# Global risk scorer instance
+risk_scorer = RiskScorer()
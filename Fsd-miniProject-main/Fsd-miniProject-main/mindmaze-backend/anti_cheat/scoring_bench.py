@@ -0,0 +1,85 @@
+# anti_cheat/scoring_bench.py
+
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Dict, List, Any, Tuple
+
+from anti_cheat.scoring import RiskScorer
+
+HEARTBEAT_SECONDS = 0.001
+
+def synthetic_sessions(n: int, seed: int = 7) -> List[Tuple[str, Dict[str, Any]]]:
+    """Detector-shaped session state with full response/pause histories."""
+    rng = random.Random(seed)
+    sessions = []
+    for index in range(n):
+        sessions.append((f"session_user_{index}", {
+            "user_id": f"user_{index}",
+            "tab_switches": rng.randrange(4),
+            "copy_paste_attempts": int(rng.random() < 0.05),
+            "window_focus_loss": rng.randrange(6),
+            "screen_recording_detected": rng.random() < 0.01,
+            "suspicious_score": rng.choice([0, 0, 0, 10, 25]),
+            "response_times": deque((rng.lognormvariate(2.0, 0.5) for _ in range(20)), maxlen=20),
+            "pause_analysis": deque((rng.expovariate(1 / 30) for _ in range(50)), maxlen=50)
+        }))
+    return sessions
+
+async def heartbeat(stalls: List[float], stop: asyncio.Event) -> None:
+    """Record how late the loop wakes a 1ms sleeper, i.e. how long sockets would wait."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        stalls.append(time.perf_counter() - started - HEARTBEAT_SECONDS)
+
+async def measure_live(scorer: RiskScorer, sessions: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, float]:
+    """Wall time of score_live and the worst event loop stall while it runs."""
+    stalls: List[float] = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stalls, stop))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await scorer.score_live(sessions)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return {"total_ms": elapsed * 1000, "max_stall_ms": max(stalls) * 1000}
+
+async def measure_inline(scorer: RiskScorer, sessions: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, float]:
+    """The same tick scored directly on the loop, as before."""
+    stalls: List[float] = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(stalls, stop))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    scorer.score_sessions(sessions)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.01)
+    stop.set()
+    await beat
+    return {"total_ms": elapsed * 1000, "max_stall_ms": max(stalls) * 1000}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time a risk scoring tick and the event loop stall it causes")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    scorer = RiskScorer()
+    print(f"{'sessions':>9} {'pack':>9} {'score':>9} {'inline stall':>13} {'live total':>11} {'live stall':>11}")
+    for n in args.sessions:
+        sessions = synthetic_sessions(n)
+        inline = min((asyncio.run(measure_inline(scorer, sessions)) for _ in range(args.repeats)),
+                     key=lambda row: row["max_stall_ms"])
+        pack_ms, score_ms = scorer.latest["pack_ms"], scorer.latest["score_ms"]
+        live = min((asyncio.run(measure_live(scorer, sessions)) for _ in range(args.repeats)),
+                   key=lambda row: row["max_stall_ms"])
+        assert scorer.latest["sessions"] == n
+        print(f"{n:>9} {pack_ms:>7.1f}ms {score_ms:>7.1f}ms {inline['max_stall_ms']:>11.1f}ms "
+              f"{live['total_ms']:>9.1f}ms {live['max_stall_ms']:>9.1f}ms")
+
+if __name__ == "__main__":
+    main()
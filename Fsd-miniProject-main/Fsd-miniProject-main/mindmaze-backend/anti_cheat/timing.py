@@ -0,0 +1,277 @@
+# anti_cheat/timing.py
+
+import logging
+import math
+from typing import Dict, List, Optional, Any
+from pymongo import ReplaceOne
+
+from database import db
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+MIN_RESPONSE_TIME = 0.05  # seconds; floor before taking logs
+
+class RunningStats:
+    """Welford running mean and variance in O(1) per update."""
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def z(self, value: float) -> Optional[float]:
+        """Standard score of value, or None without enough spread to judge."""
+        std = self.std
+        return (value - self.mean) / std if std > 0 else None
+
+    def to_list(self) -> List[float]:
+        return [self.n, self.mean, self.m2]
+
+    @classmethod
+    def from_list(cls, state: List[float]) -> "RunningStats":
+        return cls(int(state[0]), state[1], state[2])
+
+class P2Quantile:
+    """Streaming quantile estimate with the P-square algorithm (five markers, O(1) per update)."""
+
+    def __init__(self, q: float):
+        self.q = q
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5.0]
+        self.increments = [0.0, q / 2, q, (1 + q) / 2, 1.0]
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+
+        heights = self.heights
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Nudge the three middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - self.positions[i]
+            if ((d >= 1 and self.positions[i + 1] - self.positions[i] > 1) or
+                    (d <= -1 and self.positions[i - 1] - self.positions[i] < -1)):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if heights[i - 1] < candidate < heights[i + 1]:
+                    heights[i] = candidate
+                else:
+                    heights[i] = self._linear(i, step)
+                self.positions[i] += step
+
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            index = min(len(self.heights) - 1, int(round(self.q * (len(self.heights) - 1))))
+            return self.heights[index]
+        return self.heights[2]
+
+    def to_list(self) -> List[float]:
+        return [self.count] + self.heights + self.positions + self.desired
+
+    @classmethod
+    def from_list(cls, q: float, state: List[float]) -> "P2Quantile":
+        estimator = cls(q)
+        estimator.count = int(state[0])
+        size = min(estimator.count, 5)
+        estimator.heights = list(state[1:1 + size])
+        if estimator.count > 5:
+            estimator.positions = [int(p) for p in state[6:11]]
+            estimator.desired = list(state[11:16])
+        return estimator
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+class TimingProfile:
+    """Distribution of log response times: Welford moments plus streaming quartiles."""
+
+    QUANTILES = (0.25, 0.5, 0.75)
+
+    def __init__(self, stats: Optional[RunningStats] = None,
+                 quartiles: Optional[List[P2Quantile]] = None):
+        self.stats = stats or RunningStats()
+        self.quartiles = quartiles or [P2Quantile(q) for q in self.QUANTILES]
+
+    @property
+    def count(self) -> int:
+        return self.stats.n
+
+    def update(self, value: float) -> None:
+        self.stats.update(value)
+        for estimator in self.quartiles:
+            estimator.update(value)
+
+    def median(self) -> Optional[float]:
+        return self.quartiles[1].value()
+
+    def robust_z(self, value: float) -> Optional[float]:
+        """Distance from the median in IQR-derived standard deviations."""
+        low, median, high = (estimator.value() for estimator in self.quartiles)
+        if median is None:
+            return None
+        scale = (high - low) / 1.349  # IQR of a normal distribution is 1.349 sigma
+        if scale <= 0:
+            scale = self.stats.std
+        return (value - median) / scale if scale > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stats": self.stats.to_list(),
+            "quartiles": [estimator.to_list() for estimator in self.quartiles]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TimingProfile":
+        return cls(
+            RunningStats.from_list(data["stats"]),
+            [P2Quantile.from_list(q, state) for q, state in zip(cls.QUANTILES, data["quartiles"])]
+        )
+
+class TimingAnomalyDetector:
+    """Scores answer times against per-question and per-user distributions.
+
+    Times are compared in log space. Each question keeps a TimingProfile
+    over all players; each user keeps running stats of their log time
+    relative to the question median, so naturally quick players are not
+    flagged for being consistently quick. Scoring and updating are O(1).
+    """
+
+    MIN_QUESTION_SAMPLES = 20
+    MIN_USER_SAMPLES = 10
+    QUESTION_Z_THRESHOLD = -3.0  # faster than ~99.9% of answers to the question
+    USER_Z_THRESHOLD = -3.5  # far faster than this player usually is, relative to the question
+    SUPPORTING_Z_THRESHOLD = -1.5  # the other score must at least lean fast
+    MAX_QUESTIONS = 20000
+
+    def __init__(self):
+        self.questions = LRUCache(self.MAX_QUESTIONS, on_evict=self._queue_dirty)
+        self._dirty: Dict[str, TimingProfile] = {}
+
+    def score(self, user_profile: RunningStats, question_key: str,
+              response_time: float) -> Dict[str, Any]:
+        """Score one answer time, then fold it into the profiles unless it looks anomalous."""
+        value = math.log(max(response_time, MIN_RESPONSE_TIME))
+        question = self._question(question_key)
+
+        z_question = None
+        z_user = None
+        residual = None
+        if question.count >= self.MIN_QUESTION_SAMPLES:
+            z_question = question.robust_z(value)
+            residual = value - question.median()
+            if user_profile.n >= self.MIN_USER_SAMPLES:
+                z_user = user_profile.z(residual)
+
+        # Extreme on one scale with the other (once known) agreeing
+        suspicious = False
+        if z_question is not None:
+            if z_user is None:
+                suspicious = z_question <= self.QUESTION_Z_THRESHOLD
+            else:
+                suspicious = (
+                    (z_question <= self.QUESTION_Z_THRESHOLD and z_user <= self.SUPPORTING_Z_THRESHOLD) or
+                    (z_user <= self.USER_Z_THRESHOLD and z_question <= self.SUPPORTING_Z_THRESHOLD)
+                )
+
+        # Anomalous answers are not learned from, so repeat cheating can't
+        # drag the baselines down
+        if not suspicious:
+            question.update(value)
+            self._dirty[question_key] = question
+            if residual is not None:
+                user_profile.update(residual)
+
+        return {
+            "suspicious": suspicious,
+            "z_question": z_question,
+            "z_user": z_user,
+            "question_samples": question.count,
+            "user_samples": user_profile.n
+        }
+
+    async def load(self) -> None:
+        """Load persisted question profiles."""
+        loaded = 0
+        try:
+            async for doc in db.timing_profiles.find({}).limit(self.MAX_QUESTIONS):
+                self.questions.set(doc["_id"], TimingProfile.from_dict(doc["profile"]))
+                loaded += 1
+        except Exception as e:
+            logger.error(f"Failed to load question timing profiles: {e}")
+        logger.info(f"Loaded {loaded} question timing profiles")
+
+    async def persist(self) -> None:
+        """Write question profiles changed since the last call."""
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        operations = [
+            ReplaceOne({"_id": question_key}, {"profile": profile.to_dict()}, upsert=True)
+            for question_key, profile in dirty.items()
+        ]
+        try:
+            await db.timing_profiles.bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to persist question timing profiles: {e}")
+            for question_key, profile in dirty.items():
+                self._dirty.setdefault(question_key, profile)
+
+    def _question(self, question_key: str) -> TimingProfile:
+        profile = self.questions.get(question_key)
+        if profile is None:
+            profile = self._dirty.pop(question_key, None) or TimingProfile()
+            self.questions.set(question_key, profile)
+        return profile
+
+    def _queue_dirty(self, question_key: str, profile: TimingProfile) -> None:
+        self._dirty[question_key] = profile
+
+# Global timing anomaly detector instance
+timing_detector = TimingAnomalyDetector()
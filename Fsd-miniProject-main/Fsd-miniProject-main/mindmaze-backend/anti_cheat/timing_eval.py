@@ -0,0 +1,113 @@
+# anti_cheat/timing_eval.py
+
+import argparse
+import math
+import random
+from collections import defaultdict
+from typing import Dict, List, Any, Tuple
+
+from anti_cheat.timing import RunningStats, TimingAnomalyDetector
+
+# Synthetic population: log answer time = question difficulty + player speed + noise
+QUESTION_LOG_MEDIAN = (math.log(8.0), 0.4)  # mean, spread of per-question medians
+PLAYER_SPEED_SPREAD = 0.3
+ANSWER_NOISE_SPREAD = 0.35
+
+def simulate(players: int = 2000, questions: int = 300, answers_per_player: int = 40,
+             cheater_share: float = 0.05, cheat_rate: float = 0.5,
+             seed: int = 7) -> List[Tuple[str, str, float, bool, str]]:
+    """Interleaved (user, question, seconds, cheated, kind) answers.
+
+    Cheaters are "instant" (a lookup bot answering in 0.3-1.5s) or
+    "scaled" (honest pace, but a third of the usual time on cheated
+    answers); each cheats on a cheat_rate share of their answers.
+    """
+    rng = random.Random(seed)
+    medians = [rng.gauss(*QUESTION_LOG_MEDIAN) for _ in range(questions)]
+    population = []
+    for index in range(players):
+        kind = "honest"
+        if rng.random() < cheater_share:
+            kind = rng.choice(["instant", "scaled"])
+        population.append((f"user_{index}", kind, rng.gauss(0, PLAYER_SPEED_SPREAD)))
+
+    answers = []
+    for user_id, kind, speed in population:
+        for _ in range(answers_per_player):
+            question = rng.randrange(questions)
+            seconds = math.exp(medians[question] + speed + rng.gauss(0, ANSWER_NOISE_SPREAD))
+            cheated = kind != "honest" and rng.random() < cheat_rate
+            if cheated:
+                seconds = rng.uniform(0.3, 1.5) if kind == "instant" else seconds / 3
+            answers.append((user_id, f"q{question}", seconds, cheated, kind))
+    rng.shuffle(answers)
+    return answers
+
+def legacy_flags(answers: List[Tuple[str, str, float, bool, str]]) -> List[bool]:
+    """The previous rule: per-user EWMA baseline under one constant key, flag below 25%."""
+    baselines: Dict[str, float] = {}
+    flags = []
+    for user_id, _, seconds, _, _ in answers:
+        baseline = baselines.get(user_id)
+        if baseline is None:
+            baselines[user_id] = seconds
+            flags.append(False)
+        elif seconds < baseline * 0.25:
+            flags.append(True)
+        else:
+            baselines[user_id] = baseline * 0.7 + seconds * 0.3
+            flags.append(False)
+    return flags
+
+def streaming_flags(answers: List[Tuple[str, str, float, bool, str]]) -> List[bool]:
+    detector = TimingAnomalyDetector()
+    profiles: Dict[str, RunningStats] = defaultdict(RunningStats)
+    return [
+        detector.score(profiles[user_id], question, seconds)["suspicious"]
+        for user_id, question, seconds, _, _ in answers
+    ]
+
+def evaluate(answers: List[Tuple[str, str, float, bool, str]], flags: List[bool]) -> Dict[str, Any]:
+    """Answer-level precision/recall/false positive rate and user-level detection."""
+    true_positives = sum(1 for a, f in zip(answers, flags) if f and a[3])
+    false_positives = sum(1 for a, f in zip(answers, flags) if f and not a[3])
+    cheated = sum(1 for a in answers if a[3])
+    honest = len(answers) - cheated
+
+    recall_by_kind = {}
+    for kind in ("instant", "scaled"):
+        total = sum(1 for a in answers if a[3] and a[4] == kind)
+        caught = sum(1 for a, f in zip(answers, flags) if f and a[3] and a[4] == kind)
+        recall_by_kind[kind] = round(caught / total, 3) if total else None
+
+    kinds = {a[0]: a[4] for a in answers}
+    flagged_users = {a[0] for a, f in zip(answers, flags) if f}
+    cheaters = {user for user, kind in kinds.items() if kind != "honest"}
+    return {
+        "precision": round(true_positives / (true_positives + false_positives), 3)
+        if true_positives + false_positives else None,
+        "recall": round(true_positives / cheated, 3) if cheated else None,
+        "recall_by_kind": recall_by_kind,
+        "false_positive_rate": round(false_positives / honest, 4) if honest else None,
+        "cheaters_flagged": f"{len(flagged_users & cheaters)}/{len(cheaters)}",
+        "honest_users_flagged": f"{len(flagged_users - cheaters)}/{len(kinds) - len(cheaters)}"
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare timing detectors on synthetic answers")
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--answers-per-player", type=int, default=40)
+    parser.add_argument("--cheater-share", type=float, default=0.05)
+    parser.add_argument("--cheat-rate", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    answers = simulate(args.players, args.questions, args.answers_per_player,
+                       args.cheater_share, args.cheat_rate, args.seed)
+    print(f"{len(answers)} answers, {sum(1 for a in answers if a[3])} cheated")
+    for name, flags in (("legacy", legacy_flags(answers)), ("streaming", streaming_flags(answers))):
+        print(name, evaluate(answers, flags))
+
+if __name__ == "__main__":
+    main()
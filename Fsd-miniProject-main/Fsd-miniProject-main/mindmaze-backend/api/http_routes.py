@@ -5,6 +5,9 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any
 import logging
 
+from bson import ObjectId
+from bson.errors import InvalidId
+
 from database import db, serialize_mongo_doc
 from models import User, QuizResult, Achievement, Badge, LeaderboardEntry, StudyStreak, Guild
 from game_data import CATEGORY_PUZZLES
@@ -12,8 +15,18 @@ from game_logic.state import active_games, connected_players, waiting_players
 from game_logic.utils import normalize_answer, is_answer_correct
 from gamification.achievements import achievement_system
 from gamification.points import points_system
+from gamification.percentiles import percentile_tracker
+from gamification.guilds import guild_aggregator
+from gamification.leaderboard import player_leaderboard
 from analytics.engine import analytics_engine
+from analytics.user_stats import user_stats
 from anti_cheat.detector import anti_cheat_detector
+from anti_cheat.scoring import risk_scorer
+from anti_cheat.collisions import collision_index
+from anti_cheat.rules import rule_engine
+from anti_cheat.pipeline import detector_pipeline
+from api.pagination import clamp_limit, encode_cursor, decode_cursor
+from cache import dashboard_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -55,6 +68,9 @@ async def signup(user: User, request: Request):
     })
     
     await db.users.insert_one(user_dict)
+    collision_index.record(user.username, client_ip)
+    percentile_tracker.record_new_user(user_dict["total_points"])
+    player_leaderboard.update(user.username, user_dict["total_points"])
     
     # Track registration event
     await analytics_engine.track_event(
@@ -86,6 +102,8 @@ async def login(user: User, request: Request):
         }
     )
     
+    collision_index.record(user.username, client_ip)
+    
     # Track login event
     await analytics_engine.track_event(
         user.username, "user_login", 
@@ -119,31 +137,51 @@ async def migrate_user_schema():
 
 # Enhanced Leaderboard System
 @router.get("/api/leaderboard")
-async def get_leaderboard(category: Optional[str] = None, limit: int = 100):
-    """Get enhanced leaderboard with multiple categories."""
+async def get_leaderboard(category: Optional[str] = None, limit: int = 100, 
+                          cursor: Optional[str] = None):
+    """Get enhanced leaderboard with multiple categories, paged by keyset cursor."""
     # Ensure user schema is up to date
     await migrate_user_schema()
     
+    limit = clamp_limit(limit)
+    position = decode_cursor(cursor)
+    
     query = {}
     if category:
         query["category"] = category
     
+    # Resume strictly after the last (total_points desc, username asc) entry seen
+    start_rank = 0
+    if position:
+        try:
+            last_points, last_username = int(position["p"]), str(position["u"])
+            start_rank = int(position["r"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"total_points": {"$lt": last_points}},
+            {"total_points": last_points, "username": {"$gt": last_username}}
+        ]
+    
     # Get top users by total points (fallback to score if total_points doesn't exist)
     users = await db.users.find(
         query, 
         {"_id": 0, "username": 1, "total_points": 1, "score": 1, "level": 1, "avatar": 1, "badges": 1, "streaks": 1, "achievements": 1}
-    ).sort("total_points", -1).limit(limit).to_list(limit)
+    ).sort([("total_points", -1), ("username", 1)]).limit(limit).to_list(limit)
+    
+    # Materialized stats for the whole page in one indexed fetch
+    stats_by_user = await user_stats.get_many([user["username"] for user in users])
     
     # Add rankings
     leaderboard = []
-    for i, user in enumerate(users, 1):
+    for i, user in enumerate(users, start_rank + 1):
         # Use total_points if available, otherwise fallback to score
         user_score = user.get("total_points", user.get("score", 0))
         
         # Calculate additional stats
         streaks = user.get("streaks", {})
         total_streak = sum(streaks.values()) if streaks else 0
-        achievements = user.get("achievements", [])
+        stats = stats_by_user.get(user["username"], {})
         
         leaderboard.append({
             "rank": i,
@@ -153,15 +191,25 @@ async def get_leaderboard(category: Optional[str] = None, limit: int = 100):
             "avatar": user.get("avatar"),
             "badges": user.get("badges", []),
             "streak": total_streak,
-            "total_quizzes": len(achievements),  # Use achievements count as proxy for quizzes
-            "accuracy": 85.0  # Placeholder accuracy
+            "total_quizzes": stats.get("quizzes_played", 0),
+            "accuracy": user_stats.accuracy(stats)
+        })
+    
+    next_cursor = None
+    if len(users) == limit:
+        last = users[-1]
+        next_cursor = encode_cursor({
+            "p": last.get("total_points", 0),
+            "u": last["username"],
+            "r": start_rank + len(users)
         })
     
     return {
         "leaderboard": leaderboard, 
         "category": category, 
         "total": len(leaderboard),
-        "global": leaderboard  # Add global field for frontend compatibility
+        "global": leaderboard,  # Add global field for frontend compatibility
+        "next_cursor": next_cursor
     }
 
 @router.get("/api/leaderboard/category/{category}")
@@ -171,25 +219,47 @@ async def get_category_leaderboard(category: str, limit: int = 50):
     # Placeholder implementation
     return {"leaderboard": [], "category": category}
 
+@router.get("/api/leaderboard/around/{username}")
+async def get_leaderboard_around(username: str, k: int = 5):
+    """Get a user's rank with the k players directly above and below."""
+    if not player_leaderboard.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is still loading")
+    
+    neighbours = player_leaderboard.around(username, max(0, min(k, 50)))
+    if not neighbours:
+        raise HTTPException(status_code=404, detail="User not found")
+    return neighbours
+
 @router.get("/api/leaderboard/guild")
 async def get_guild_leaderboard(limit: int = 20):
     """Get guild leaderboard."""
-    guilds = await db.guilds.find({}).sort("total_score", -1).limit(limit).to_list(limit)
-    
-    leaderboard = []
-    for i, guild in enumerate(guilds, 1):
-        leaderboard.append({
-            "rank": i,
-            "name": guild["name"],
-            "score": guild["total_score"],
-            "level": guild.get("level", 1),
-            "members": len(guild.get("members", [])),
-            "icon": guild.get("icon", "👥"),
-            "color": guild.get("color", "#3498db")
-        })
-    
+    leaderboard = guild_aggregator.get_leaderboard(limit)
     return {"leaderboard": leaderboard, "total": len(leaderboard)}
 
+@router.post("/api/guilds/{guild_name}/join")
+async def join_guild(guild_name: str, data: Dict[str, Any]):
+    """Join a guild (leaving any current one); the member's points move with them."""
+    username = data.get("username")
+    user = await db.users.find_one({"username": username}, {"_id": 0, "total_points": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not await db.guilds.find_one({"name": guild_name}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Guild not found")
+
+    await guild_aggregator.add_member(guild_name, username, user.get("total_points", 0))
+    return {"message": f"{username} joined {guild_name}"}
+
+@router.post("/api/guilds/{guild_name}/leave")
+async def leave_guild(guild_name: str, data: Dict[str, Any]):
+    """Leave a guild, taking the member's points out of its score."""
+    username = data.get("username")
+    if guild_aggregator.member_guild.get(username) != guild_name:
+        raise HTTPException(status_code=400, detail="User is not a member of this guild")
+
+    user = await db.users.find_one({"username": username}, {"_id": 0, "total_points": 1}) or {}
+    await guild_aggregator.remove_member(guild_name, username, user.get("total_points", 0))
+    return {"message": f"{username} left {guild_name}"}
+
 # Categories and Questions
 @router.get("/api/categories")
 async def get_categories():
@@ -224,6 +294,34 @@ async def get_category_questions(category: str, difficulty: str = "medium", limi
     }
 
 # User Profile and Stats
+async def fetch_quiz_history(username: str, limit: int, cursor: Optional[str] = None):
+    """Fetch one page of a user's quiz history, newest first, by keyset cursor."""
+    limit = clamp_limit(limit)
+    position = decode_cursor(cursor)
+    
+    query = {"user_id": username}
+    if position:
+        try:
+            last_completed = datetime.fromisoformat(position["t"])
+            last_id = ObjectId(position["id"])
+        except (KeyError, TypeError, ValueError, InvalidId):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"completed_at": {"$lt": last_completed}},
+            {"completed_at": last_completed, "_id": {"$lt": last_id}}
+        ]
+    
+    quiz_results = await db.quiz_results.find(query).sort(
+        [("completed_at", -1), ("_id", -1)]
+    ).limit(limit).to_list(limit)
+    
+    next_cursor = None
+    if len(quiz_results) == limit:
+        last = quiz_results[-1]
+        next_cursor = encode_cursor({"t": last["completed_at"].isoformat(), "id": str(last["_id"])})
+    
+    return quiz_results, next_cursor
+
 @router.get("/api/user/{username}/profile")
 async def get_user_profile(username: str):
     """Get detailed user profile."""
@@ -231,10 +329,8 @@ async def get_user_profile(username: str):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get user's quiz history
-    quiz_results = await db.quiz_results.find(
-        {"user_id": username}
-    ).sort("completed_at", -1).limit(10).to_list(10)
+    # Get first page of user's quiz history
+    quiz_results, history_cursor = await fetch_quiz_history(username, 10)
     
     # Get achievements
     achievements = await db.achievements.find(
@@ -246,13 +342,29 @@ async def get_user_profile(username: str):
         {"id": {"$in": user.get("badges", [])}}
     ).to_list(None)
     
+    stats = await user_stats.get(username)
+    stats["accuracy"] = user_stats.accuracy(stats)
+    
     return {
         "user": serialize_mongo_doc(user),
+        "stats": stats,
         "recent_quizzes": serialize_mongo_doc(quiz_results),
+        "quiz_history_cursor": history_cursor,
         "achievements": serialize_mongo_doc(achievements),
         "badges": serialize_mongo_doc(badges)
     }
 
+@router.get("/api/user/{username}/quizzes")
+async def get_user_quiz_history(username: str, limit: int = 10, cursor: Optional[str] = None):
+    """Get a page of user's quiz history; pass next_cursor to continue."""
+    quiz_results, next_cursor = await fetch_quiz_history(username, limit, cursor)
+    
+    return {
+        "user_id": username,
+        "quizzes": serialize_mongo_doc(quiz_results),
+        "next_cursor": next_cursor
+    }
+
 @router.get("/api/user/{username}/stats")
 async def get_user_stats(username: str, period: str = "30d"):
     """Get detailed user statistics."""
@@ -269,6 +381,15 @@ async def get_user_stats(username: str, period: str = "30d"):
         "performance": performance_data
     }
 
+@router.get("/api/user/{username}/rank")
+async def get_user_rank(username: str):
+    """Get user's estimated rank and percentile."""
+    user = await db.users.find_one({"username": username})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return await points_system.get_user_rank(User(**user))
+
 @router.get("/api/user/{username}/achievements")
 async def get_user_achievements(username: str):
     """Get user's achievements and progress."""
@@ -308,7 +429,7 @@ async def start_quiz(quiz_data: Dict[str, Any], request: Request):
     user_agent = request.headers.get("user-agent", "")
     
     await anti_cheat_detector.initialize_user_session(
-        username, session_id, client_ip, user_agent
+        username, session_id, client_ip, user_agent, quiz_data.get("device_fingerprint")
     )
     
     # Get questions for the category
@@ -330,8 +451,17 @@ async def start_quiz(quiz_data: Dict[str, Any], request: Request):
 @router.post("/api/quiz/submit")
 async def submit_quiz(quiz_result: QuizResult, request: Request):
     """Submit quiz results with comprehensive analysis."""
+    # Stats, recommendations and analytics all group results by this category
+    if quiz_result.category not in CATEGORY_PUZZLES:
+        quiz_result.category = "unknown"
+    
     # Store quiz result
     await db.quiz_results.insert_one(quiz_result.dict())
+    await user_stats.record_quiz(
+        quiz_result.user_id, quiz_result.category, quiz_result.total_questions,
+        quiz_result.correct_answers, quiz_result.time_taken
+    )
+    analytics_engine.invalidate_user(quiz_result.user_id)
     
     # Get user data
     user = await db.users.find_one({"username": quiz_result.user_id})
@@ -354,12 +484,14 @@ async def submit_quiz(quiz_result: QuizResult, request: Request):
     unlocked_achievements = await achievement_system.check_achievements(user, quiz_result)
     unlocked_badges = await achievement_system.check_badges(user, quiz_result)
     
+    # Points go through the shared path so rankings stay in sync
+    await points_system.award_points(quiz_result.user_id, points_data["final_points"])
+    
     # Update user in database
     await db.users.update_one(
         {"username": quiz_result.user_id},
         {
             "$set": {
-                "total_points": user["total_points"] + points_data["final_points"],
                 "quiz_coins": user["quiz_coins"] + points_data["coins_earned"],
                 "experience": user["experience"] + (points_data["final_points"] // 2),
                 "achievements": user.get("achievements", []) + unlocked_achievements,
@@ -372,10 +504,12 @@ async def submit_quiz(quiz_result: QuizResult, request: Request):
     await analytics_engine.track_event(
         quiz_result.user_id, "quiz_completed",
         {
-            "category": quiz_result.quiz_id,
+            "category": quiz_result.category,
             "score": quiz_result.score,
             "accuracy": quiz_result.accuracy,
-            "time_taken": quiz_result.time_taken
+            "time_taken": quiz_result.time_taken,
+            "total_questions": quiz_result.total_questions,
+            "correct_answers": quiz_result.correct_answers
         }
     )
     
@@ -389,37 +523,87 @@ async def submit_quiz(quiz_result: QuizResult, request: Request):
     }
 
 # Analytics and Admin
+def _require_period(period: str) -> None:
+    """Reject periods the engine doesn't know; each one would be its own cache entry."""
+    if period not in analytics_engine.TIME_PERIODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported period '{period}'. Use one of: {', '.join(analytics_engine.TIME_PERIODS)}"
+        )
+
 @router.get("/api/admin/analytics")
 async def get_admin_analytics(period: str = "7d"):
     """Get comprehensive platform analytics for admin dashboard."""
-    analytics_data = await analytics_engine.analyze_platform_metrics(period)
+    _require_period(period)
+    analytics_data = await dashboard_cache.get(
+        ("admin_analytics", period), lambda: analytics_engine.analyze_platform_metrics(period)
+    )
     return analytics_data
 
+@router.get("/api/admin/ingestion")
+async def get_ingestion_stats():
+    """Get analytics and anti-cheat ingestion queue counters."""
+    return {
+        "analytics_events": analytics_engine.ingestion.get_stats(),
+        "anti_cheat_events": anti_cheat_detector.event_writer.get_stats(),
+        "anti_cheat_pipeline": detector_pipeline.get_stats()
+    }
+
+@router.get("/api/admin/realtime")
+async def get_realtime_metrics():
+    """Get rolling real-time platform metrics."""
+    metrics = analytics_engine.get_real_time_metrics()
+    metrics["dashboard_cache"] = dashboard_cache.get_stats()
+    metrics["anti_cheat_state"] = anti_cheat_detector.get_stats()
+    metrics["anti_cheat_pipeline"] = detector_pipeline.get_stats()
+    return metrics
+
+@router.get("/api/admin/anti-cheat/risk")
+async def get_anti_cheat_risk():
+    """Get the riskiest live sessions from the latest batch scoring pass."""
+    return risk_scorer.latest
+
+@router.get("/api/admin/anti-cheat/linked/{username}")
+async def get_linked_accounts(username: str):
+    """Get accounts recently seen on the same device fingerprint, IP or subnet."""
+    return {"username": username, "linked": collision_index.linked_accounts(username)}
+
+@router.get("/api/admin/anti-cheat/rules")
+async def get_anti_cheat_rules():
+    """Get the active anti-cheat rules."""
+    return {"rules": rule_engine.get_rules()}
+
+@router.put("/api/admin/anti-cheat/rules")
+async def update_anti_cheat_rules(rules: List[Dict[str, Any]]):
+    """Replace the anti-cheat rule set; it applies to the next event without a restart."""
+    try:
+        await rule_engine.save(rules)
+    except ValueError as e:  # includes pydantic validation errors
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Anti-cheat rules updated", "rules": rule_engine.get_rules()}
+
+@router.post("/api/admin/anti-cheat/rules/reload")
+async def reload_anti_cheat_rules():
+    """Reload the anti-cheat rules from the database."""
+    await rule_engine.reload()
+    return {"message": "Anti-cheat rules reloaded", "rules": rule_engine.get_rules()}
+
+@router.post("/api/admin/cache/invalidate")
+async def invalidate_dashboard_cache(endpoint: Optional[str] = None):
+    """Drop memoized dashboard results, for one endpoint or all of them."""
+    if endpoint:
+        dashboard_cache.invalidate_prefix(endpoint)
+    else:
+        dashboard_cache.clear()
+    return {"message": "Dashboard cache invalidated", "endpoint": endpoint}
+
 @router.get("/api/admin/anti-cheat")
 async def get_anti_cheat_metrics(period: str = "7d"):
     """Get anti-cheat metrics and suspicious activities."""
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=7)  # Default to 7 days
-    
-    # Get anti-cheat events
-    events = await db.anti_cheat_events.find({
-        "timestamp": {"$gte": start_date, "$lte": end_date}
-    }).to_list(None)
-    
-    # Analyze events by type
-    events_by_type = {}
-    for event in events:
-        event_type = event["flag_type"]
-        if event_type not in events_by_type:
-            events_by_type[event_type] = 0
-        events_by_type[event_type] += 1
-    
-    return {
-        "period": period,
-        "total_events": len(events),
-        "events_by_type": events_by_type,
-        "suspicious_users": len(set(event["user_id"] for event in events))
-    }
+    _require_period(period)
+    return await dashboard_cache.get(
+        ("admin_anti_cheat", period), lambda: analytics_engine.analyze_anti_cheat_period(period)
+    )
 
 # Study Recommendations
 @router.get("/api/user/{username}/recommendations")
@@ -438,17 +622,23 @@ async def get_optimal_difficulty(username: str, category: str):
 @router.get("/api/stats")
 async def get_stats():
     """Get basic platform statistics."""
-    total_users = await db.users.count_documents({})
-    active_quizzes = await db.quiz_results.count_documents({
-        "completed_at": {"$gte": datetime.utcnow() - timedelta(hours=1)}
-    })
+    # Database counts are memoized; in-memory game state is always live
+    counts = await dashboard_cache.get(("stats", None), compute_stats_counts)
     
     return {
-        "total_users": total_users,
+        "total_users": counts["total_users"],
         "active_games": len(active_games),
         "connected_players": len(connected_players),
         "waiting_players": len(waiting_players),
         "total_categories": len(CATEGORY_PUZZLES),
         "total_questions": sum(len(p) for p in CATEGORY_PUZZLES.values()),
-        "active_quizzes": active_quizzes
-    }
\ No newline at end of file
+        "active_quizzes": counts["active_quizzes"]
+    }
+
+async def compute_stats_counts() -> Dict[str, int]:
+    """Database-backed counts for /api/stats."""
+    total_users = await db.users.count_documents({})
+    active_quizzes = await db.quiz_results.count_documents({
+        "completed_at": {"$gte": datetime.utcnow() - timedelta(hours=1)}
+    })
+    return {"total_users": total_users, "active_quizzes": active_quizzes}
\ No newline at end of file
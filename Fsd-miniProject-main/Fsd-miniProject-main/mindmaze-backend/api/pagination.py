@@ -0,0 +1,32 @@
+# api/pagination.py
+
+import base64
+import binascii
+import json
+from typing import Dict, Optional, Any
+from fastapi import HTTPException
+
+MAX_PAGE_SIZE = 100
+
+def clamp_limit(limit: int, maximum: int = MAX_PAGE_SIZE) -> int:
+    """Keep requested page sizes within sane bounds."""
+    return max(1, min(limit, maximum))
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode a keyset position as an opaque continuation token."""
+    raw = json.dumps(position, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Decode a continuation token produced by encode_cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
@@ -3,11 +3,15 @@
 import json
 import logging
 import asyncio
+import functools
+import hashlib
+import os
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 
-from game_logic.state import connected_players
+from game_logic.state import connected_players, active_games
+from game_logic.utils import is_answer_correct
 from game_logic.handlers import (
     handle_matchmaking,
     handle_answer,
@@ -16,8 +20,18 @@ from game_logic.handlers import (
 )
 from anti_cheat.detector import anti_cheat_detector
 from anti_cheat.monitor import real_time_monitor
+from anti_cheat.timing import timing_detector
+from anti_cheat.scoring import risk_scorer
+from anti_cheat.collisions import collision_index
+from anti_cheat.rules import rule_engine
+from anti_cheat.pipeline import detector_pipeline
 from analytics.engine import analytics_engine
+from analytics.user_stats import user_stats
 from gamification.achievements import achievement_system
+from gamification.percentiles import percentile_tracker
+from gamification.guilds import guild_aggregator
+from gamification.leaderboard import player_leaderboard
+from analytics.rollups import rollup_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -61,6 +75,44 @@ class LeaderboardManager:
 # Global leaderboard manager
 leaderboard_manager = LeaderboardManager()
 
+# Live admin metrics
+class AdminMetricsManager:
+    def __init__(self):
+        self.subscribers: List[WebSocket] = []
+        self.update_interval = 5  # seconds
+        # Usernames allowed to subscribe, comma separated; nobody when unset
+        self.admins = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+    
+    def is_admin(self, username: str) -> bool:
+        return username in self.admins
+    
+    async def add_subscriber(self, websocket: WebSocket):
+        if websocket not in self.subscribers:
+            self.subscribers.append(websocket)
+    
+    async def remove_subscriber(self, websocket: WebSocket):
+        try:
+            self.subscribers.remove(websocket)
+        except ValueError:
+            pass
+    
+    async def broadcast(self, message_type: str, data: Dict[str, Any]):
+        """Broadcast an admin message to all subscribers."""
+        message = {
+            "type": message_type,
+            "data": data,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        
+        for websocket in list(self.subscribers):
+            try:
+                await websocket.send_text(json.dumps(message))
+            except Exception as e:
+                logger.error(f"Failed to send admin update: {e}")
+
+# Global admin metrics manager
+admin_metrics_manager = AdminMetricsManager()
+
 # Real-time notifications
 class NotificationManager:
     def __init__(self):
@@ -109,6 +161,7 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
     
     logger.info(f"✅ WebSocket connected for user: {username}")
     
+    session_opened = False
     try:
         # Send welcome message with user data
         await websocket.send_text(json.dumps({
@@ -125,6 +178,12 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
         
         # Start real-time monitoring
         await real_time_monitor.start_monitoring(f"session_{username}", username)
+        await anti_cheat_detector.open_connection(
+            username, f"session_{username}",
+            websocket.client.host if websocket.client else "unknown",
+            websocket.headers.get("user-agent", "unknown")
+        )
+        session_opened = True
         
         while True:
             try:
@@ -152,6 +211,15 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
                 elif message_type == "unsubscribe_leaderboard":
                     await handle_unsubscribe_leaderboard(username, websocket, message)
                     
+                elif message_type == "get_around_me":
+                    await handle_get_around_me(username, websocket, message)
+                    
+                elif message_type == "subscribe_admin_metrics":
+                    await handle_subscribe_admin_metrics(username, websocket, message)
+                    
+                elif message_type == "unsubscribe_admin_metrics":
+                    await handle_unsubscribe_admin_metrics(username, websocket, message)
+                    
                 elif message_type == "get_achievements":
                     await handle_get_achievements(username, websocket, message)
                     
@@ -192,7 +260,14 @@ async def websocket_endpoint(websocket: WebSocket, username: str):
         await cleanup_player(username)
         await notification_manager.remove_user_connection(username, websocket)
         await leaderboard_manager.remove_subscriber(username, websocket)
-        await real_time_monitor.stop_monitoring(f"session_{username}")
+        await admin_metrics_manager.remove_subscriber(websocket)
+        # Other tabs of the same user keep the session until the last one closes;
+        # queued behind this user's answers so their analysis still finds it
+        if session_opened:
+            await detector_pipeline.close_connection(
+                username, f"session_{username}",
+                functools.partial(real_time_monitor.stop_monitoring, f"session_{username}")
+            )
 
 async def handle_find_match(username: str, websocket: WebSocket, message: Dict[str, Any]):
     """Handle matchmaking requests."""
@@ -207,6 +282,36 @@ async def handle_find_match(username: str, websocket: WebSocket, message: Dict[s
     logger.info(f"Processing find_match for {username} in category {category}")
     await handle_matchmaking(username, websocket, category)
 
+def _answer_context(username: str, answer: str) -> Optional[Dict[str, Any]]:
+    """Question id, category, opponent's wrong answer and time since the question was sent."""
+    game = next((g for g in active_games.values() if username in g.players), None)
+    if game is None or game.current_question_index >= len(game.questions):
+        return None
+    
+    q_index = game.current_question_index
+    question = game.questions[q_index]
+    
+    # Questions are sampled per game, so the id comes from the text, not the index
+    question_id = hashlib.blake2b(question["question"].encode("utf-8"), digest_size=8).hexdigest()
+    
+    # Only wrong answers are kept; two players sharing a right answer proves nothing
+    opponent_answer = next(
+        (game.answers.get(f"{q_index}:{player}") for player in game.players if player != username), None
+    )
+    if not is_answer_correct(answer, question["answer"]):
+        game.answers[f"{q_index}:{username}"] = answer
+    
+    since_question = None
+    if game.question_started_at:
+        since_question = (datetime.utcnow() - game.question_started_at).total_seconds()
+    
+    return {
+        "question_id": question_id,
+        "category": game.category,
+        "opponent_answer": opponent_answer,
+        "since_question": since_question
+    }
+
 async def handle_submit_answer(username: str, websocket: WebSocket, message: Dict[str, Any]):
     """Handle answer submissions with anti-cheat monitoring."""
     answer = message.get("answer", "").strip()
@@ -217,17 +322,22 @@ async def handle_submit_answer(username: str, websocket: WebSocket, message: Dic
         }))
         return
     
-    # Anti-cheat analysis
-    session_id = message.get("session_id", f"session_{username}")
-    response_time = message.get("response_time", 0)
-    
-    # Analyze response timing
-    await anti_cheat_detector.analyze_response_timing(
-        session_id, "question_1", response_time, "medium"
-    )
+    session_id = anti_cheat_detector.owned_session(username, message.get("session_id"))
+    # Both sessions belong to the sender; no other player's flags can refuse these answers
+    if (anti_cheat_detector.is_session_banned(session_id)
+            or anti_cheat_detector.is_session_banned(f"session_{username}")):
+        await websocket.send_text(json.dumps({
+            "type": "error",
+            "message": "Answers from this session are no longer accepted"
+        }))
+        return
     
-    # Analyze answer patterns
-    await anti_cheat_detector.analyze_answer_patterns(session_id, [answer])
+    # Context is read before the answer advances the game; analysis runs off the answer path
+    context = _answer_context(username, answer)
+    if context:
+        await detector_pipeline.publish(
+            username, session_id, answer, message.get("response_time", 0), context
+        )
     
     logger.info(f"Processing answer submission for {username}: {answer}")
     await handle_answer(username, answer, websocket)
@@ -237,21 +347,22 @@ async def handle_cancel_search(username: str, websocket: WebSocket, message: Dic
     logger.info(f"Processing search cancellation for {username}")
     await handle_cancel_search(username, websocket)
 
+async def dispatch_anti_cheat_event(username: str, message: Dict[str, Any]) -> Optional[str]:
+    """Route a client anti-cheat event to the detector; shared by both anti-cheat message types."""
+    # The game client reports the event as "reason"
+    event_type = message.get("event_type") or message.get("reason")
+    event_data = message.get("data") or {}
+    session_id = anti_cheat_detector.owned_session(username, message.get("session_id"))
+    
+    if event_type == "device_fingerprint":
+        await anti_cheat_detector.verify_device_fingerprint(session_id, event_data.get("fingerprint"))
+    elif event_type:
+        await anti_cheat_detector.process_event(session_id, event_type, event_data)
+    return event_type
+
 async def handle_anti_cheat_event(username: str, websocket: WebSocket, message: Dict[str, Any]):
     """Handle anti-cheat events from frontend."""
-    event_type = message.get("event_type")
-    event_data = message.get("data", {})
-    session_id = message.get("session_id", f"session_{username}")
-    
-    # Process different types of anti-cheat events
-    if event_type == "tab_switch":
-        await anti_cheat_detector.detect_tab_switching(session_id, event_data)
-    elif event_type == "copy_paste":
-        await anti_cheat_detector.detect_copy_paste(session_id, event_data)
-    elif event_type == "multiple_windows":
-        await anti_cheat_detector.detect_multiple_windows(session_id, event_data)
-    elif event_type == "screen_recording":
-        await anti_cheat_detector.detect_screen_recording(session_id, event_data)
+    event_type = await dispatch_anti_cheat_event(username, message)
     
     # Send acknowledgment
     await websocket.send_text(json.dumps({
@@ -280,6 +391,58 @@ async def handle_unsubscribe_leaderboard(username: str, websocket: WebSocket, me
         "message": "Unsubscribed from leaderboard updates"
     }))
 
+async def handle_get_around_me(username: str, websocket: WebSocket, message: Dict[str, Any]):
+    """Handle requests for the player's neighbourhood on the leaderboard."""
+    try:
+        k = int(str(message.get("k", 5)))
+    except ValueError:
+        await websocket.send_text(json.dumps({
+            "type": "error",
+            "message": "k must be an integer"
+        }))
+        return
+    
+    k = max(0, min(k, 50))
+    neighbours = player_leaderboard.around(username, k) if player_leaderboard.ready else None
+    
+    if not neighbours:
+        await websocket.send_text(json.dumps({
+            "type": "error",
+            "message": "Leaderboard position not available"
+        }))
+        return
+    
+    await websocket.send_text(json.dumps({
+        "type": "around_me_data",
+        "data": neighbours
+    }))
+
+async def handle_subscribe_admin_metrics(username: str, websocket: WebSocket, message: Dict[str, Any]):
+    """Handle live admin metrics subscription."""
+    # The topic carries per-player anti-cheat risk scores
+    if not admin_metrics_manager.is_admin(username):
+        await websocket.send_text(json.dumps({
+            "type": "error",
+            "message": "Admin metrics are restricted to administrators"
+        }))
+        return
+    
+    await admin_metrics_manager.add_subscriber(websocket)
+    
+    await websocket.send_text(json.dumps({
+        "type": "admin_metrics_subscribed",
+        "data": analytics_engine.get_real_time_metrics()
+    }))
+
+async def handle_unsubscribe_admin_metrics(username: str, websocket: WebSocket, message: Dict[str, Any]):
+    """Handle live admin metrics unsubscription."""
+    await admin_metrics_manager.remove_subscriber(websocket)
+    
+    await websocket.send_text(json.dumps({
+        "type": "admin_metrics_unsubscribed",
+        "message": "Unsubscribed from admin metrics"
+    }))
+
 async def handle_get_achievements(username: str, websocket: WebSocket, message: Dict[str, Any]):
     """Handle achievement requests."""
     # Get user achievements
@@ -316,22 +479,10 @@ async def handle_get_recommendations(username: str, websocket: WebSocket, messag
 
 async def handle_cheating_detected(username: str, websocket: WebSocket, message: Dict[str, Any]):
     """Handle cheating detection events from frontend."""
-    event_type = message.get("event_type")
-    event_data = message.get("data", {})
-    session_id = message.get("session_id", f"session_{username}")
-    
     # Log the cheating detection event
-    logger.info(f"Cheating detected for {username}: {event_type} - {event_data}")
-    
-    # Process different types of cheating events
-    if event_type == "tab_switch":
-        await anti_cheat_detector.detect_tab_switching(session_id, event_data)
-    elif event_type == "copy_paste":
-        await anti_cheat_detector.detect_copy_paste(session_id, event_data)
-    elif event_type == "multiple_windows":
-        await anti_cheat_detector.detect_multiple_windows(session_id, event_data)
-    elif event_type == "screen_recording":
-        await anti_cheat_detector.detect_screen_recording(session_id, event_data)
+    logger.info(f"Cheating detected for {username}: {message.get('event_type') or message.get('reason')}")
+    
+    event_type = await dispatch_anti_cheat_event(username, message)
     
     # Send acknowledgment
     await websocket.send_text(json.dumps({
@@ -353,6 +504,7 @@ async def broadcast_leaderboard_updates():
                 {}, 
                 {"_id": 0, "username": 1, "total_points": 1, "score": 1, "level": 1, "avatar": 1, "badges": 1, "streaks": 1, "achievements": 1}
             ).sort("total_points", -1).limit(100).to_list(100)
+            stats_by_user = await user_stats.get_many([user["username"] for user in users])
             
             leaderboard_data = []
             for i, user in enumerate(users, 1):
@@ -362,7 +514,7 @@ async def broadcast_leaderboard_updates():
                 # Calculate additional stats
                 streaks = user.get("streaks", {})
                 total_streak = sum(streaks.values()) if streaks else 0
-                achievements = user.get("achievements", [])
+                stats = stats_by_user.get(user["username"], {})
                 
                 leaderboard_data.append({
                     "rank": i,
@@ -372,8 +524,8 @@ async def broadcast_leaderboard_updates():
                     "avatar": user.get("avatar"),
                     "badges": user.get("badges", []),
                     "streak": total_streak,
-                    "total_quizzes": len(achievements),
-                    "accuracy": 85.0
+                    "total_quizzes": stats.get("quizzes_played", 0),
+                    "accuracy": user_stats.accuracy(stats)
                 })
             
             # Broadcast to all subscribers
@@ -386,7 +538,46 @@ async def broadcast_leaderboard_updates():
             logger.error(f"Error in leaderboard broadcast: {e}")
             await asyncio.sleep(5)
 
+async def broadcast_admin_metrics():
+    """Background task to push rolling metrics to admin subscribers."""
+    while True:
+        try:
+            await asyncio.sleep(admin_metrics_manager.update_interval)
+            if admin_metrics_manager.subscribers:
+                await admin_metrics_manager.broadcast(
+                    "admin_metrics_update", analytics_engine.get_real_time_metrics()
+                )
+        except Exception as e:
+            logger.error(f"Error in admin metrics broadcast: {e}")
+
+async def broadcast_risk_scores():
+    """Background task to batch-score live anti-cheat sessions and push the riskiest to admins."""
+    while True:
+        try:
+            await asyncio.sleep(risk_scorer.interval)
+            result = await risk_scorer.score_live(anti_cheat_detector.user_sessions.items())
+            if admin_metrics_manager.subscribers:
+                await admin_metrics_manager.broadcast("anti_cheat_risk_update", result)
+        except Exception as e:
+            logger.error(f"Error in anti-cheat risk scoring: {e}")
+
 # Start background tasks
 async def start_background_tasks():
     """Start background tasks for real-time features."""
-    asyncio.create_task(broadcast_leaderboard_updates())
\ No newline at end of file
+    await guild_aggregator.load()
+    analytics_engine.ingestion.start()
+    anti_cheat_detector.event_writer.start()
+    detector_pipeline.start()
+    await timing_detector.load()
+    await collision_index.load()
+    await rule_engine.reload()
+    asyncio.create_task(broadcast_leaderboard_updates())
+    asyncio.create_task(broadcast_admin_metrics())
+    asyncio.create_task(broadcast_risk_scores())
+    asyncio.create_task(percentile_tracker.run_periodic_persistence())
+    # History from before the rollups existed; only replayed into an empty collection
+    asyncio.create_task(rollup_store.backfill_if_empty(until=datetime.utcnow()))
+    asyncio.create_task(rollup_store.run_periodic_maintenance())
+    asyncio.create_task(anti_cheat_detector.run_periodic_cleanup())
+    asyncio.create_task(collision_index.run_periodic_persistence())
+    asyncio.create_task(player_leaderboard.load())
\ No newline at end of file
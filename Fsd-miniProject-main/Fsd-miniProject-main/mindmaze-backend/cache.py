@@ -0,0 +1,272 @@
+# cache.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Awaitable, Callable, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """Bounded in-memory cache with least-recently-used eviction and optional TTL.
+
+    With idle=True the TTL counts from the last access instead of the last
+    write, and on_evict is called with (key, value) for every entry dropped
+    by the size cap or by expiry.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = None, idle: bool = False,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl  # seconds; None keeps entries until evicted or invalidated
+        self.idle = idle
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        # Invalidation clock: each delete stamps its key, so an in-flight
+        # computation can tell whether its own key went stale. Stamps are
+        # capped at max_size; dropping one (or clear()) raises the floor,
+        # which conservatively treats every older computation as stale.
+        self._clock = 0
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._floor = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._expired(entry[1], time.monotonic())
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value for key, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, stored_at = entry
+        now = time.monotonic()
+        if self._expired(stored_at, now):
+            self._evict(key)
+            self.misses += 1
+            return None
+
+        if self.idle:
+            self._entries[key] = (value, now)
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def version_of(self, key: Hashable) -> int:
+        """Token to pass to set() so a value computed from now on is dropped if key is invalidated."""
+        return self._clock
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None) -> bool:
+        """Store a value, skipping it if key was invalidated since version was read."""
+        if version is not None and max(self._floor, self._invalidated.get(key, 0)) > version:
+            return False
+
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._evict(next(iter(self._entries)))
+        return True
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove and return an entry without counting it as an eviction."""
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry else None
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        now = time.monotonic()
+        return [(key, value) for key, (value, stored_at) in self._entries.items()
+                if not self._expired(stored_at, now)]
+
+    def expire(self) -> int:
+        """Evict every expired entry; returns how many were dropped."""
+        if self.ttl is None:
+            return 0
+
+        now = time.monotonic()
+        if self.idle:
+            # Entries are in access order, so expired ones form a prefix
+            expired = []
+            for key, (_, stored_at) in self._entries.items():
+                if not self._expired(stored_at, now):
+                    break
+                expired.append(key)
+        else:
+            expired = [key for key, (_, stored_at) in self._entries.items()
+                       if self._expired(stored_at, now)]
+
+        for key in expired:
+            self._evict(key)
+        return len(expired)
+
+    def delete(self, key: Hashable) -> None:
+        self._clock += 1
+        self._invalidated[key] = self._clock
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_size:
+            _, stamp = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, stamp)
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._clock += 1
+        self._floor = self._clock
+        self._invalidated.clear()
+        self._entries.clear()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _evict(self, key: Hashable) -> None:
+        value, _ = self._entries.pop(key)
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+class StaleWhileRevalidateCache:
+    """Memoized async results served stale while a single background refresh runs.
+
+    Entries younger than soft_ttl are fresh. Between soft_ttl and hard_ttl
+    the cached value is returned immediately and one refresh is started;
+    past hard_ttl (or on a miss) callers wait for a recomputation, which
+    concurrent callers share.
+    """
+
+    def __init__(self, soft_ttl: float = 30.0, hard_ttl: float = 300.0, max_size: int = 256):
+        self.soft_ttl = soft_ttl  # seconds
+        self.hard_ttl = hard_ttl  # seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+        # Per-key invalidation stamps, as in LRUCache: a refresh only drops
+        # its result if its own key was invalidated after it started
+        self._clock = 0
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._floor = 0
+
+        # Counters
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached result for key, computing or refreshing it as needed."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age < self.hard_ttl:
+                self._entries.move_to_end(key)
+                if age < self.soft_ttl:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    self._refresh(key, compute)
+                return value
+
+        self.misses += 1
+        # Shielded so a cancelled request doesn't abort the shared computation
+        return await asyncio.shield(self._refresh(key, compute))
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop one entry; the next request recomputes it."""
+        self._stamp(key)
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def invalidate_prefix(self, prefix: Hashable) -> None:
+        """Drop every entry whose tuple key starts with prefix, e.g. all periods of an endpoint."""
+        for key in [k for k in (*self._entries, *self._inflight)
+                    if isinstance(k, tuple) and k and k[0] == prefix]:
+            self._stamp(key)
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._clock += 1
+        self._floor = self._clock
+        self._invalidated.clear()
+        self._entries.clear()
+        self._inflight.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache counters for monitoring."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "inflight": len(self._inflight)
+        }
+
+    def _stamp(self, key: Hashable) -> None:
+        self._clock += 1
+        self._invalidated[key] = self._clock
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_size:
+            _, stamp = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, stamp)
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Start a recomputation unless one for key is already running."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # already logged; marks background failures as retrieved
+
+    async def _load(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        version = self._clock
+        self.refreshes += 1
+        try:
+            value = await compute()
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.error(f"Failed to refresh cached {key}: {e}")
+            raise
+
+        # Results started before an invalidation of key are returned but not stored
+        if max(self._floor, self._invalidated.get(key, 0)) <= version:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+# Global admin dashboard cache instance
+dashboard_cache = StaleWhileRevalidateCache(soft_ttl=30.0, hard_ttl=300.0)
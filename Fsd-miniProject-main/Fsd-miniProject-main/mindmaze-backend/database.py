@@ -36,6 +36,7 @@ async def create_database_indexes():
         await db.users.create_index("username", unique=True)
         await db.users.create_index("email", unique=True, sparse=True)
         await db.users.create_index("total_points")
+        await db.users.create_index([("total_points", -1), ("username", 1)])
         await db.users.create_index("level")
         await db.users.create_index("last_login")
         await db.users.create_index("created_at")
@@ -46,8 +47,12 @@ async def create_database_indexes():
         await db.quiz_results.create_index("category")
         await db.quiz_results.create_index("completed_at")
         await db.quiz_results.create_index([("user_id", 1), ("completed_at", -1)])
+        await db.quiz_results.create_index([("user_id", 1), ("completed_at", -1), ("_id", -1)])
         await db.quiz_results.create_index([("category", 1), ("completed_at", -1)])
         
+        # User stats collection indexes
+        await db.user_stats.create_index("user_id", unique=True)
+        
         # Analytics events collection indexes
         await db.analytics_events.create_index("user_id")
         await db.analytics_events.create_index("event_type")
@@ -55,6 +60,9 @@ async def create_database_indexes():
         await db.analytics_events.create_index([("user_id", 1), ("timestamp", -1)])
         await db.analytics_events.create_index([("event_type", 1), ("timestamp", -1)])
         
+        # Analytics rollup collection indexes
+        await db.analytics_rollups.create_index([("granularity", 1), ("bucket", 1)], unique=True)
+        
         # Anti-cheat events collection indexes
         await db.anti_cheat_events.create_index("user_id")
         await db.anti_cheat_events.create_index("session_id")
@@ -63,6 +71,14 @@ async def create_database_indexes():
         await db.anti_cheat_events.create_index([("user_id", 1), ("timestamp", -1)])
         await db.anti_cheat_events.create_index([("flag_type", 1), ("timestamp", -1)])
         
+        # Spilled anti-cheat response time baselines
+        await db.response_baselines.create_index("user_id", unique=True)
+        
+        # Identity links expire a week after the account was last seen on them
+        await db.identity_links.create_index([("kind", 1), ("key", 1), ("user_id", 1)], unique=True)
+        await db.identity_links.create_index("user_id")
+        await db.identity_links.create_index("last_seen", expireAfterSeconds=7 * 24 * 3600)
+        
         # Questions collection indexes
         await db.questions.create_index("category")
         await db.questions.create_index("difficulty")
@@ -83,6 +99,7 @@ async def create_database_indexes():
         # Guilds collection indexes
         await db.guilds.create_index("name", unique=True)
         await db.guilds.create_index("leader")
+        await db.guilds.create_index("members")
         await db.guilds.create_index("total_score")
         await db.guilds.create_index("created_at")
         
@@ -117,4 +134,6 @@ def serialize_mongo_doc(doc):
         return serialized
     return doc
 
-
+def safe_field_name(name: str) -> str:
+    """Make a dynamic key (category, event type) safe for use in a dotted field path."""
+    return (name or "unknown").replace(".", "_").lstrip("$") or "unknown"
@@ -11,6 +11,9 @@ from models import GameSession
 from game_logic.state import active_games, connected_players, waiting_players
 from game_logic.utils import is_answer_correct, get_points_for_category
 from game_data import CATEGORY_PUZZLES
+from analytics.user_stats import user_stats
+from analytics.engine import analytics_engine
+from anti_cheat.detector import anti_cheat_detector
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +86,8 @@ async def handle_matchmaking(username: str, websocket: WebSocket, category: str)
                     players=[username, waiting_opponent],
                     category=category,
                     questions=puzzles,
-                    player_scores={username: 0, waiting_opponent: 0}
+                    player_scores={username: 0, waiting_opponent: 0},
+                    question_started_at=datetime.utcnow()
                 )
 
                 # Notify both players that game has started
@@ -107,6 +111,9 @@ async def handle_matchmaking(username: str, websocket: WebSocket, category: str)
                     await connected_players[waiting_opponent].send_text(json.dumps(game_start_data))
                 
                 logger.info(f"Game started: {game_id} between {username} and {waiting_opponent} in category {category}")
+                await anti_cheat_detector.check_shared_identity(
+                    f"session_{username}", username, waiting_opponent, "matchmaking"
+                )
                 
             except Exception as e:
                 error_msg = f"Failed to create game: {str(e)}"
@@ -213,6 +220,20 @@ async def handle_answer(username: str, answer: str, websocket: WebSocket):
                             except Exception as e:
                                 logger.error(f"Failed to notify {player} of game end: {e}")
                     
+                    # Record per-player game stats
+                    round_points = get_points_for_category(game.category)
+                    loser = next((player for player in game.players if player != winner), None)
+                    if loser:
+                        await anti_cheat_detector.check_shared_identity(
+                            f"session_{winner}", winner, loser, "game_end"
+                        )
+                    for player in game.players:
+                        await user_stats.record_game(
+                            player, game.category, player == winner,
+                            len(game.questions), game.player_scores.get(player, 0) // round_points
+                        )
+                        analytics_engine.invalidate_user(player)
+                    
                     # Clean up the game
                     del active_games[game_id]
                     logger.info(f"Game {game_id} ended. Winner: {winner}")
@@ -220,6 +241,7 @@ async def handle_answer(username: str, answer: str, websocket: WebSocket):
                 else:
                     # Continue to next question
                     next_question = game.questions[game.current_question_index]
+                    game.question_started_at = datetime.utcnow()
                     
                     
                     next_round_data = {
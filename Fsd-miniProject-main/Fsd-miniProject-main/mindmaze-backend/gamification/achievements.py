@@ -4,6 +4,7 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from models import Achievement, AchievementType, User, QuizResult
+from gamification.percentiles import percentile_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -424,6 +425,9 @@ class AchievementSystem:
             # This would need to be tracked in user stats
             return False  # Placeholder
         
+        if "top_percentile" in requirements:
+            return percentile_tracker.top_percent(user.total_points) <= requirements["top_percentile"]
+        
         return False
     
     async def calculate_experience(self, quiz_result: QuizResult, 
@@ -0,0 +1,106 @@
+# gamification/guilds.py
+
+import logging
+from typing import Dict, List, Any
+
+from database import db
+from gamification.leaderboard import RankedBoard
+
+logger = logging.getLogger(__name__)
+
+class GuildAggregator:
+    """Incrementally maintained guild scores and ranking."""
+
+    def __init__(self):
+        self.member_guild: Dict[str, str] = {}  # username -> guild name
+        self.guild_info: Dict[str, Dict[str, Any]] = {}
+        self.board = RankedBoard()
+
+    async def load(self) -> None:
+        """Build the membership index and ranking from the guilds collection."""
+        member_guild = {}
+        guild_info = {}
+        scores = {}
+
+        async for guild in db.guilds.find(
+            {}, {"_id": 0, "name": 1, "members": 1, "total_score": 1, "level": 1, "icon": 1, "color": 1}
+        ):
+            name = guild["name"]
+            for member in guild.get("members", []):
+                member_guild[member] = name
+            guild_info[name] = {
+                "level": guild.get("level", 1),
+                "members": len(guild.get("members", [])),
+                "icon": guild.get("icon", "👥"),
+                "color": guild.get("color", "#3498db")
+            }
+            scores[name] = guild.get("total_score", 0)
+
+        self.member_guild = member_guild
+        self.guild_info = guild_info
+        self.board = RankedBoard.from_scores(scores)
+        logger.info(f"Loaded {len(guild_info)} guilds with {len(member_guild)} members")
+
+    async def apply_points_delta(self, username: str, points: int) -> None:
+        """Apply a member's point change to their guild's total."""
+        guild_name = self.member_guild.get(username)
+        if not guild_name or not points:
+            return
+
+        await self._adjust_score(guild_name, points)
+
+    async def add_member(self, guild_name: str, username: str, member_points: int) -> None:
+        """Record a new member, adding their existing points to the guild."""
+        previous = self.member_guild.get(username)
+        if previous == guild_name:
+            return
+        if previous:
+            await self.remove_member(previous, username, member_points)
+
+        self.member_guild[username] = guild_name
+        info = self.guild_info.setdefault(
+            guild_name, {"level": 1, "members": 0, "icon": "👥", "color": "#3498db"}
+        )
+        info["members"] += 1
+        await db.guilds.update_one({"name": guild_name}, {"$addToSet": {"members": username}})
+        await self._adjust_score(guild_name, member_points)
+
+    async def remove_member(self, guild_name: str, username: str, member_points: int) -> None:
+        """Remove a member, taking their points out of the guild's total."""
+        if self.member_guild.get(username) != guild_name:
+            return
+
+        del self.member_guild[username]
+        if guild_name in self.guild_info:
+            self.guild_info[guild_name]["members"] -= 1
+        await db.guilds.update_one({"name": guild_name}, {"$pull": {"members": username}})
+        await self._adjust_score(guild_name, -member_points)
+
+    def get_leaderboard(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Ranked guild leaderboard served from memory."""
+        leaderboard = []
+        for rank, (name, score) in enumerate(self.board.top(limit), 1):
+            info = self.guild_info.get(name, {})
+            leaderboard.append({
+                "rank": rank,
+                "name": name,
+                "score": score,
+                "level": info.get("level", 1),
+                "members": info.get("members", 0),
+                "icon": info.get("icon", "👥"),
+                "color": info.get("color", "#3498db")
+            })
+        return leaderboard
+
+    async def _adjust_score(self, guild_name: str, points: int) -> None:
+        if not points:
+            return
+
+        self.board.update(guild_name, (self.board.score(guild_name) or 0) + points)
+        try:
+            await db.guilds.update_one({"name": guild_name}, {"$inc": {"total_score": points}})
+        except Exception as e:
+            logger.error(f"Failed to update score for guild {guild_name}: {e}")
+
+# Global guild aggregator instance
+guild_aggregator = GuildAggregator()
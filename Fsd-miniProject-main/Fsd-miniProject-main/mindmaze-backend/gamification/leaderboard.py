@@ -0,0 +1,223 @@
+# gamification/leaderboard.py
+
+import logging
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple, Any
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+class RankedBoard:
+    """In-memory ranking ordered by score (desc) then name (asc).
+
+    Entries live in bounded sorted buckets with a Fenwick tree over bucket
+    sizes, so rank lookups and positional access are O(log n) and reading
+    k consecutive entries is O(log n + k).
+    """
+
+    def __init__(self, load: int = 512):
+        self._load = load
+        self._buckets: List[List[Tuple[int, str]]] = []
+        self._maxes: List[Tuple[int, str]] = []
+        self._tree: List[int] = [0]
+        self._scores: Dict[str, int] = {}
+
+    @classmethod
+    def from_scores(cls, scores: Dict[str, int], load: int = 512) -> "RankedBoard":
+        """Bulk-build a board with a single sort instead of n inserts."""
+        board = cls(load)
+        keys = sorted((-score, name) for name, score in scores.items())
+        board._buckets = [keys[i:i + load] for i in range(0, len(keys), load)]
+        board._maxes = [bucket[-1] for bucket in board._buckets]
+        board._scores = dict(scores)
+        board._rebuild_tree()
+        return board
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._scores
+
+    def score(self, name: str) -> Optional[int]:
+        return self._scores.get(name)
+
+    def update(self, name: str, score: int) -> None:
+        """Insert an entry or move it to a new score."""
+        previous = self._scores.get(name)
+        if previous == score:
+            return
+        if previous is not None:
+            self._remove_key((-previous, name))
+        self._scores[name] = score
+        self._insert_key((-score, name))
+
+    def remove(self, name: str) -> None:
+        previous = self._scores.pop(name, None)
+        if previous is not None:
+            self._remove_key((-previous, name))
+
+    def rank(self, name: str) -> Optional[int]:
+        """1-based rank of an entry."""
+        score = self._scores.get(name)
+        if score is None:
+            return None
+        key = (-score, name)
+        pos = bisect_left(self._maxes, key)
+        return self._prefix(pos) + bisect_left(self._buckets[pos], key) + 1
+
+    def entries(self, start: int, count: int) -> List[Tuple[str, int]]:
+        """Up to count (name, score) entries starting at 0-based position start."""
+        if count <= 0 or start >= len(self._scores):
+            return []
+
+        start = max(0, start)
+        pos, offset = self._locate(start)
+        result = []
+        while pos < len(self._buckets) and len(result) < count:
+            bucket = self._buckets[pos]
+            for neg_score, name in bucket[offset:offset + count - len(result)]:
+                result.append((name, -neg_score))
+            pos += 1
+            offset = 0
+        return result
+
+    def top(self, count: int) -> List[Tuple[str, int]]:
+        return self.entries(0, count)
+
+    def _insert_key(self, key: Tuple[int, str]) -> None:
+        if not self._maxes:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+            return
+
+        pos = bisect_right(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._buckets[pos].append(key)
+            self._maxes[pos] = key
+        else:
+            insort(self._buckets[pos], key)
+
+        bucket = self._buckets[pos]
+        if len(bucket) > 2 * self._load:
+            # Split oversized buckets to keep inserts cheap
+            half = bucket[self._load:]
+            del bucket[self._load:]
+            self._maxes[pos] = bucket[-1]
+            self._buckets.insert(pos + 1, half)
+            self._maxes.insert(pos + 1, half[-1])
+            self._rebuild_tree()
+        else:
+            self._tree_add(pos, 1)
+
+    def _remove_key(self, key: Tuple[int, str]) -> None:
+        pos = bisect_left(self._maxes, key)
+        bucket = self._buckets[pos]
+        del bucket[bisect_left(bucket, key)]
+
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+            self._tree_add(pos, -1)
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+            self._rebuild_tree()
+
+    def _rebuild_tree(self) -> None:
+        """Rebuild the Fenwick tree over bucket sizes in O(buckets)."""
+        size = len(self._buckets)
+        tree = [0] + [len(bucket) for bucket in self._buckets]
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, pos: int, delta: int) -> None:
+        i = pos + 1
+        size = len(self._tree) - 1
+        while i <= size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, pos: int) -> int:
+        """Number of entries in buckets before pos."""
+        total = 0
+        i = pos
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """Bucket position and offset of a 0-based index."""
+        size = len(self._tree) - 1
+        pos = 0
+        remaining = index
+        step = 1 << (size.bit_length() - 1) if size else 0
+        while step:
+            nxt = pos + step
+            if nxt <= size and self._tree[nxt] <= remaining:
+                pos = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return pos, remaining
+
+class PlayerLeaderboard:
+    """Global player ranking by total points, kept in memory."""
+
+    def __init__(self):
+        self.board = RankedBoard()
+        self.ready = False
+        self._pending: Optional[Dict[str, int]] = None
+
+    async def load(self) -> None:
+        """Build the ranking from the users collection."""
+        # Updates arriving mid-scan are replayed on top of the fresh board
+        self._pending = {}
+        scores = {}
+        try:
+            async for user in db.users.find({}, {"_id": 0, "username": 1, "total_points": 1, "score": 1}):
+                scores[user["username"]] = user.get("total_points", user.get("score", 0))
+        except Exception as e:
+            logger.error(f"Failed to load player leaderboard: {e}")
+            self._pending = None
+            return
+
+        scores.update(self._pending)
+        self._pending = None
+        board = RankedBoard.from_scores(scores)
+
+        self.board = board
+        self.ready = True
+        logger.info(f"Loaded player leaderboard with {len(board)} users")
+
+    def update(self, username: str, points: int) -> None:
+        """Record a user's current total points."""
+        self.board.update(username, points)
+        if self._pending is not None:
+            self._pending[username] = points
+
+    def around(self, username: str, k: int) -> Optional[Dict[str, Any]]:
+        """User's rank plus up to k neighbours on each side."""
+        rank = self.board.rank(username)
+        if rank is None:
+            return None
+
+        start = max(0, rank - 1 - k)
+        entries = self.board.entries(start, rank - start + k)
+        return {
+            "username": username,
+            "rank": rank,
+            "total_users": len(self.board),
+            "entries": [
+                {"rank": start + i, "username": name, "score": score}
+                for i, (name, score) in enumerate(entries, 1)
+            ]
+        }
+
+# Global player leaderboard instance
+player_leaderboard = PlayerLeaderboard()
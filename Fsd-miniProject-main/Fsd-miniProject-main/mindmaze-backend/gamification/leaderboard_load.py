@@ -0,0 +1,73 @@
+# gamification/leaderboard_load.py
+
+import argparse
+import random
+import time
+from typing import Dict, List, Any
+
+from gamification.leaderboard import RankedBoard, PlayerLeaderboard
+
+def build(users: int, seed: int = 7) -> PlayerLeaderboard:
+    """A ready player leaderboard with synthetic, heavily tied point totals."""
+    rng = random.Random(seed)
+    scores = {f"user_{index}": int(rng.paretovariate(1.2) * 100) for index in range(users)}
+    leaderboard = PlayerLeaderboard()
+    leaderboard.board = RankedBoard.from_scores(scores)
+    leaderboard.ready = True
+    return leaderboard
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        f"p{q}": round(ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] * 1e6, 1)
+        for q in (50, 95, 99)
+    }
+
+def run(users: int, lookups: int, updates: int, k: int, seed: int) -> Dict[str, Any]:
+    """Time the build, around() lookups and point updates; latencies in microseconds."""
+    started = time.perf_counter()
+    leaderboard = build(users, seed)
+    build_seconds = time.perf_counter() - started
+
+    rng = random.Random(seed + 1)
+    lookup_times = []
+    for _ in range(lookups):
+        username = f"user_{rng.randrange(users)}"
+        started = time.perf_counter()
+        result = leaderboard.around(username, k)
+        lookup_times.append(time.perf_counter() - started)
+        assert result is not None and len(result["entries"]) <= 2 * k + 1
+
+    update_times = []
+    for _ in range(updates):
+        username = f"user_{rng.randrange(users)}"
+        started = time.perf_counter()
+        leaderboard.update(username, rng.randrange(100, 100000))
+        update_times.append(time.perf_counter() - started)
+
+    # Spot-check ranks against a full sort
+    ordered = sorted(leaderboard.board.entries(0, users), key=lambda entry: -entry[1])
+    for username in (f"user_{rng.randrange(users)}" for _ in range(20)):
+        rank = leaderboard.around(username, 0)["rank"]
+        assert ordered[rank - 1][1] == leaderboard.board.score(username)
+
+    return {
+        "users": len(leaderboard.board),
+        "build_seconds": round(build_seconds, 2),
+        "around_us": percentiles(lookup_times),
+        "update_us": percentiles(update_times)
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the around-me leaderboard")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(run(args.users, args.lookups, args.updates, args.k, args.seed))
+
+if __name__ == "__main__":
+    main()
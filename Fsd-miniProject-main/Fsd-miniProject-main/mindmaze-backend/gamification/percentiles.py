@@ -0,0 +1,135 @@
+# gamification/percentiles.py
+
+import asyncio
+import logging
+from datetime import datetime
+
+from analytics.sketches import KLLSketch
+from database import db
+
+logger = logging.getLogger(__name__)
+
+SKETCH_ID = "total_points"
+
+class PercentileTracker:
+    """Streaming percentile estimates over users' total points."""
+
+    def __init__(self, k: int = 200, persist_interval: int = 300):
+        # Score changes are recorded as (remove old, add new), so rank queries
+        # subtract the "removed" sketch from the "added" one.
+        self.k = k
+        self.added = KLLSketch(k)
+        self.removed = KLLSketch(k)
+        self.persist_interval = persist_interval  # seconds
+        self.dirty = False
+
+    @property
+    def total_users(self) -> int:
+        return max(0, self.added.n - self.removed.n)
+
+    def record_new_user(self, points: int = 0) -> None:
+        """Register a newly created user."""
+        self.added.update(points)
+        self.dirty = True
+
+    def record_change(self, old_points: int, new_points: int) -> None:
+        """Move a user from old_points to new_points."""
+        if old_points == new_points:
+            return
+        self.removed.update(old_points)
+        self.added.update(new_points)
+        self.dirty = True
+
+    def count_below(self, points: int) -> int:
+        """Estimated number of users with strictly fewer points."""
+        below = self.added.rank(points) - self.removed.rank(points)
+        return min(max(0, below), self.total_users)
+
+    def percentile(self, points: int) -> float:
+        """Percentage of users with fewer points (0-100)."""
+        total_users = self.total_users
+        if total_users == 0:
+            return 0.0
+        return self.count_below(points) / total_users * 100
+
+    def top_percent(self, points: int) -> float:
+        """Smallest top-N% of players that includes this score (0-100)."""
+        total_users = self.total_users
+        if total_users == 0:
+            return 100.0
+        at_or_above = max(1, total_users - self.count_below(points))
+        return at_or_above / total_users * 100
+
+    def estimated_rank(self, points: int) -> int:
+        """Estimated 1-based rank for a score."""
+        return max(1, self.total_users - self.count_below(points))
+
+    async def load(self) -> None:
+        """Load the persisted sketch, rebuilding from users if none exists."""
+        try:
+            doc = await db.sketches.find_one({"_id": SKETCH_ID})
+        except Exception as e:
+            logger.error(f"Failed to load percentile sketch: {e}")
+            return
+
+        if doc:
+            self.added = KLLSketch.from_dict(doc["added"])
+            self.removed = KLLSketch.from_dict(doc["removed"])
+            logger.info(f"Loaded percentile sketch covering {self.total_users} users")
+        else:
+            await self.rebuild()
+
+    async def rebuild(self) -> None:
+        """Rebuild the sketch from the users collection, dropping accumulated churn."""
+        fresh = KLLSketch(self.k)
+        async for user in db.users.find({}, {"_id": 0, "total_points": 1, "score": 1}):
+            fresh.update(user.get("total_points", user.get("score", 0)))
+
+        self.added = fresh
+        self.removed = KLLSketch(self.k)
+        self.dirty = True
+        await self.persist()
+        logger.info(f"Rebuilt percentile sketch from {fresh.n} users")
+
+    async def persist(self) -> None:
+        """Persist the current sketch state."""
+        try:
+            await db.sketches.replace_one(
+                {"_id": SKETCH_ID},
+                {
+                    "_id": SKETCH_ID,
+                    "added": self.added.to_dict(),
+                    "removed": self.removed.to_dict(),
+                    "updated_at": datetime.utcnow()
+                },
+                upsert=True
+            )
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Failed to persist percentile sketch: {e}")
+
+    async def run_periodic_persistence(self) -> None:
+        """Background task: load on start, then persist (or rebuild) periodically."""
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Failed to initialize percentile sketch: {e}")
+
+        while True:
+            try:
+                await asyncio.sleep(self.persist_interval)
+
+                # Error grows with added.n + removed.n, so compact once churn
+                # outweighs the live population
+                if self.removed.n > self.total_users:
+                    await self.rebuild()
+                elif self.dirty:
+                    await self.persist()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in percentile sketch persistence: {e}")
+
+# Global percentile tracker instance
+percentile_tracker = PercentileTracker()
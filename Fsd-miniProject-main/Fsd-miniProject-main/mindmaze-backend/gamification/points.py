@@ -3,7 +3,12 @@
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
+from pymongo import ReturnDocument
 from models import User, QuizResult, DifficultyLevel
+from database import db
+from gamification.percentiles import percentile_tracker
+from gamification.guilds import guild_aggregator
+from gamification.leaderboard import player_leaderboard
 
 logger = logging.getLogger(__name__)
 
@@ -162,6 +167,23 @@ class PointsSystem:
             user.level = new_level
             logger.info(f"User {user.username} leveled up to level {new_level}")
     
+    async def award_points(self, username: str, points: int) -> Optional[int]:
+        """Atomically add points to a user and propagate the change to rankings."""
+        updated = await db.users.find_one_and_update(
+            {"username": username},
+            {"$inc": {"total_points": points}},
+            projection={"_id": 0, "total_points": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not updated:
+            return None
+        
+        new_total = updated["total_points"]
+        percentile_tracker.record_change(new_total - points, new_total)
+        player_leaderboard.update(username, new_total)
+        await guild_aggregator.apply_points_delta(username, points)
+        return new_total
+    
     async def calculate_level(self, experience: int) -> int:
         """Calculate user level based on experience."""
         # Exponential leveling: level = sqrt(experience / 100)
@@ -261,12 +283,11 @@ class PointsSystem:
     
     async def get_user_rank(self, user: User) -> Dict[str, Any]:
         """Get user's rank and percentile."""
-        # This would calculate user's rank among all users
-        # Placeholder implementation
+        # Estimated from the streaming sketch, so no per-request sort over users
         return {
-            "rank": 1,
-            "total_users": 1000,
-            "percentile": 99.9,
+            "rank": percentile_tracker.estimated_rank(user.total_points),
+            "total_users": percentile_tracker.total_users,
+            "percentile": round(percentile_tracker.percentile(user.total_points), 1),
             "points": user.total_points,
             "level": user.level
         }
@@ -12,6 +12,13 @@ from fastapi.middleware.gzip import GZipMiddleware
 from api import http_routes, websocket_routes
 from database import startup_db_client, shutdown_db_client
 from api.websocket_routes import start_background_tasks
+from gamification.percentiles import percentile_tracker
+from analytics.engine import analytics_engine
+from analytics.rollups import rollup_store
+from anti_cheat.detector import anti_cheat_detector
+from anti_cheat.timing import timing_detector
+from anti_cheat.collisions import collision_index
+from anti_cheat.pipeline import detector_pipeline
 
 # Configure logging
 logging.basicConfig(
@@ -40,6 +47,14 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Shutting down MindMaze Ultimate Quiz Platform...")
+    await analytics_engine.ingestion.stop()
+    await detector_pipeline.stop()
+    await anti_cheat_detector.event_writer.stop()
+    await anti_cheat_detector.flush_baselines(include_live=True)
+    await timing_detector.persist()
+    await collision_index.persist()
+    await rollup_store.flush()
+    await percentile_tracker.persist()
     shutdown_db_client()
     logger.info("✅ Shutdown complete")
 
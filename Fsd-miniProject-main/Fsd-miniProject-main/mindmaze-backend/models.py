@@ -1,7 +1,7 @@
 # models.py
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -29,6 +29,10 @@ class AntiCheatFlag(str, Enum):
     DEVICE_FINGERPRINT = "device_fingerprint"
     ANSWER_PATTERN = "answer_pattern"
     PAUSE_ANALYSIS = "pause_analysis"
+    MULTI_ACCOUNT = "multi_account"
+
+# Weight of each anti-cheat severity in suspicion scores
+SEVERITY_SCORES = {"low": 1, "medium": 3, "high": 5, "critical": 10}
 
 class User(BaseModel):
     username: str
@@ -116,6 +120,7 @@ class GameSession(BaseModel):
     answers: Dict[str, str] = {}
     winner: Optional[str] = None
     questions_per_round: int = 5
+    question_started_at: Optional[datetime] = None  # when the current question was sent
 
 class AntiCheatEvent(BaseModel):
     user_id: str
@@ -127,6 +132,20 @@ class AntiCheatEvent(BaseModel):
     ip_address: Optional[str] = None
     user_agent: Optional[str] = None
 
+class AntiCheatRule(BaseModel):
+    name: str
+    event_type: str  # client event the rule listens to, e.g. "tab_switch"
+    aggregate: Literal["count", "sum", "max", "last"] = "count"
+    field: Optional[str] = None  # event data field for sum/max/last
+    window: Optional[float] = Field(default=None, gt=0)  # seconds; None aggregates over the whole session
+    comparison: Literal[">", ">=", "<", "<="] = ">="
+    threshold: float
+    severity: Literal["low", "medium", "high", "critical"]
+    flag_type: AntiCheatFlag
+    metadata_key: str = "value"  # name of the aggregate in the flag metadata
+    context: Dict[str, str] = {}  # metadata key -> event data field copied into the flag
+    enabled: bool = True
+
 class AnalyticsEvent(BaseModel):
     user_id: str
     event_type: str
@@ -154,6 +173,7 @@ class WebSocketMessage(BaseModel):
 class QuizResult(BaseModel):
     user_id: str
     quiz_id: str
+    category: Optional[str] = None  # a CATEGORY_PUZZLES key, as returned by /api/quiz/start
     score: int
     total_questions: int
     correct_answers: int
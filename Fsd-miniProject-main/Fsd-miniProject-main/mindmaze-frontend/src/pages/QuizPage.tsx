@@ -326,6 +326,7 @@ const QuizPage: React.FC = () => {
         body: JSON.stringify({
           session_id: session.id,
           user_id: user?.username,
+          category: session.category,
           score: session.score,
           total_questions: session.total_questions,
           correct_answers: Math.floor(session.score / 10), // Approximate